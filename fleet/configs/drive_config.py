@@ -42,10 +42,77 @@ AWS_DRIVE_DATA_REPOS = {'dump': 'perception_data/dump/drive_data/',
 
 AWS_S3_KEY_DELIMITER = '/'
 
+# Concurrent S3 transfers (files in flight at once)
+S3_TRANSFER_JOBS = 8
+# Multipart uploads for video chunks, parts per file uploaded concurrently
+# (threshold and part size also recompute multipart ETags)
+S3_MULTIPART_THRESHOLD = 16 * 1024 ** 2
+S3_MULTIPART_CHUNKSIZE = 16 * 1024 ** 2
+S3_MULTIPART_CONCURRENCY = 4
+# Largest single part object (PUT / CopyObject)
+S3_MAX_SINGLE_PART_SIZE = 5 * 1024 ** 3
+# Connection pool shared by all transfers of a process, sized for every
+# transfer job uploading multipart at once
+S3_MAX_POOL_CONNECTIONS = S3_TRANSFER_JOBS * S3_MULTIPART_CONCURRENCY
+S3_TCP_KEEPALIVE = True
+# Adaptive S3 call concurrency (AIMD), starts at S3_TRANSFER_JOBS and grows
+# up to S3_MAX_POOL_CONNECTIONS, halved at most once per cooldown (s) on
+# throttling
+S3_CONCURRENCY_MIN = 1
+S3_CONCURRENCY_DECREASE = 0.5
+S3_CONCURRENCY_COOLDOWN = 1.0
+# Retries of throttled / transient S3 calls, exponential backoff (s) with
+# full jitter, bounded by a retry budget earning tokens on success
+S3_RETRY_MAX_ATTEMPTS = 8
+S3_RETRY_BASE_DELAY = 0.1
+S3_RETRY_MAX_DELAY = 20.0
+S3_RETRY_BUDGET = 100
+S3_RETRY_BUDGET_RATIO = 0.1
+# Keys per DeleteObjects request (S3 maximum)
+S3_DELETE_BATCH_SIZE = 1000
+# Streaming read size for downloads and checksums
+S3_READ_CHUNKSIZE = 1024 ** 2
+# Range GET size of objects streamed from S3 (remote validation), avro
+# headers fit in the first read
+S3_STREAM_CHUNKSIZE = 4 * 1024 ** 2
+# Suffix for partially downloaded files, renamed once complete
+S3_PARTIAL_SUFFIX = '.part'
+
+# Local cache for data-catalogue state (push manifests, ...)
+DATA_CATALOGUE_CACHE_DIR = Path('~/.cache/data-catalogue').expanduser()
+# S3 listing snapshots, served as is for S3_LISTING_CACHE_REFRESH seconds,
+# refreshed incrementally up to S3_LISTING_CACHE_TTL seconds
+S3_LISTING_CACHE_PATH = DATA_CATALOGUE_CACHE_DIR.joinpath('listing.sqlite')
+S3_LISTING_CACHE_REFRESH = 5 * 60
+S3_LISTING_CACHE_TTL = 24 * 60 * 60
+# Per run transfer reports (JSON) of diary push / fetch
+TRANSFER_REPORT_DIR = DATA_CATALOGUE_CACHE_DIR.joinpath('reports')
+# Upper bounds (ms) of the per object latency histogram buckets
+TRANSFER_LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000,
+                               10000, 30000]
+# Width (s) of the throughput timeline bins
+TRANSFER_TIMELINE_STEP = 1.0
+# Slowest objects listed in the report
+TRANSFER_SLOWEST_OBJECTS = 10
+
 # drive meta data format
 DRIVE_SCHEMA_FORMAT = 'avsc'
 # drive meta data format
 DRIVE_META_DATA_FORMAT = 'avro'
+# Avro serialization backend of writers, 'fastavro' (C extension), 'avro'
+# or 'auto' (fastavro when installed)
+AVRO_BACKEND = 'auto'
+# Avro file layout of writers, 'table' (one {table: [rows]} record per
+# file) or 'rows' (one record per row), None follows the schema version,
+# rows from AVRO_ROWS_SCHEMA_VERSION on
+AVRO_LAYOUT = None
+AVRO_ROWS_SCHEMA_VERSION = 4
+# Avro block codec of writers, 'null', 'deflate', 'bzip2', 'xz', 'snappy'
+# or 'zstandard' (zstd), snappy and zstandard need their libraries
+AVRO_CODEC = 'deflate'
+# Avro block size (bytes before compression), larger blocks compress
+# better, avro flushes at 16 kB
+AVRO_SYNC_INTERVAL = 64 * 1024
 # drive meta data version
 DRIVE_SCHEMA_VERSION_REGEX = re.compile(
     r'^'                        # start of string
@@ -72,6 +139,39 @@ DRIVE_DIARY_DATE_PATTERN = '[0-9]{4}-[0-9]{2}-[0-9]{2}'
 DRIVE_DIARY_TOKEN_PATTERN = '[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]' + \
     '{4}-[0-9a-f]{4}-[0-9a-f]{12}'
 DRIVE_DATA_VEHICLE_URI = 'vehicle_[0-9a-zA-Z]'
+# Sequence avro files, (file name, schema name)
+DRIVE_SEQUENCE_AVROS = [('data.avro', 'data'), ('element.avro', 'element'),
+                        ('sensordata.avro', 'sensor'),
+                        ('sequence.avro', 'sequence')]
+# Token references checked within a sequence, ((table, field), (table,
+# field)), tokens of the first column must be in the second. The directory
+# table holds the sequence and drive tokens of the sequence path.
+DRIVE_SEQUENCE_REFERENCES = [
+    (('sequence', 'sequence_token'), ('directory', 'sequence_token')),
+    (('sequence', 'drive_token'), ('directory', 'drive_token')),
+    (('sequence', 'element_tokens'), ('element', 'element_token')),
+    (('element', 'sequence_token'), ('sequence', 'sequence_token')),
+    (('element', 'data_token'), ('data', 'data_token')),
+    (('data', 'element_token'), ('element', 'element_token')),
+    (('data', 'sensor_tokens'), ('sensor', 'sensor_token')),
+    (('sensor', 'data_token'), ('data', 'data_token'))]
+# Worker processes validating sequences of a diary concurrently
+DRIVE_VALIDATION_JOBS = os.cpu_count() or 1
+# Validation results cached per diary (in the diary directory)
+DRIVE_VALIDATION_CACHE = '.validated'
+# Validated sequences waiting for upload in diary push --validate, bounds
+# how far validation runs ahead of uploads
+DRIVE_PUSH_QUEUE_SIZE = S3_TRANSFER_JOBS * 2
+# Bundled sequence layout, one uncompressed tar per sequence starting with
+# a JSON index (padded to a fixed size) of member byte offsets
+DRIVE_SEQUENCE_BUNDLE = 'sequence.tar'
+DRIVE_SEQUENCE_BUNDLE_INDEX = 1024
+DRIVE_SEQUENCE_BUNDLE_INDEX_NAME = 'bundle.json'
+# Token index objects under each repo, <repo>/_index/<kind>/<shard>.idx
+# sharded on the leading hex characters of the token
+DRIVE_DATA_INDEX_PREFIX = '_index/'
+DRIVE_DATA_INDEX_KINDS = ['diary', 'drive', 'sequence']
+DRIVE_DATA_INDEX_SHARD_WIDTH = 2
 
 DRIVE_DATA_AVRO_TABLE_NAMES = ['diary', 'drive', 'sequence',
                                'element', 'data', 'sensor_data']
@@ -81,7 +181,17 @@ DRIVE_DATA_STRUCTURE_URL = 'https://gitlab.mobilityservices.io/am/roam' \
     '/perception/data-catalogue/wikis/Drive-Data-Storage-Schema#file-structure'
 
 # List expected to expand
-DRIVE_DATA_SENSORS = ['image', 'radar', 'gps', 'speed', 'steering_wheel']
+DRIVE_DATA_SENSORS = ['image', 'gps', 'speed', 'steering_wheel']
+# Selective fetch, sequence members skipped per excluded sensor
+DRIVE_SEQUENCE_VIDEO_DIR = 'video/'
+DRIVE_DATA_SENSOR_MEMBERS = {'image': [DRIVE_SEQUENCE_VIDEO_DIR]}
+# sensordata.avro rows dropped per excluded sensor (sensor_modality_type)
+DRIVE_DATA_SENSOR_MODALITIES = {'gps': 'gnss'}
+# sensordata.avro fields referencing sensor tokens, nulled with their rows
+DRIVE_DATA_SENSOR_REFERENCES = ['matched_gnss_token']
+# sensordata.avro fields nulled per excluded sensor
+DRIVE_DATA_SENSOR_FIELDS = {'speed': ['vehicle_speed'],
+                            'steering_wheel': ['vehicle_steering_angle']}
 
 # Cron job command(s)
 CRONJOB_WAYLENS_NEW_JOBS_CMD = 'find {} -type d -mmin -1440'
@@ -5,9 +5,6 @@ from pathlib import Path
 
 from avro.schema import Parse as schema_parser
 
-from avro.datafile import DataFileWriter
-from avro.io import DatumWriter
-
 from datetime import datetime
 import dateutil.parser
 
@@ -16,6 +13,7 @@ import ffmpeg
 import skvideo.io
 import skvideo.datasets
 from fleet.configs import drive_config as config
+from fleet.utils.avro_io import write_table
 
 logger = config.get_logger(__name__)
 
@@ -226,9 +224,7 @@ def read_video_info(vid_path):
 
 def avro_save_binary(message, schema, file_name):
 
-    writer = DataFileWriter(open(file_name, "wb"), DatumWriter(), schema)
-    writer.append(message)
-    writer.close()
+    write_table(file_name, message, schema)
 
 
 def avro_read_schemas(schema_path):
@@ -0,0 +1,271 @@
+import io
+import os
+import json
+import shutil
+import tarfile
+import contextlib
+from pathlib import Path
+
+from fleet.configs import drive_config as config
+
+logger = config.get_logger(__name__)
+
+# tar header size, members are padded to multiples of it
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def _padded(size):
+
+  return -(-size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+
+
+def is_bundled(sequence_uri):
+
+  return Path(sequence_uri).joinpath(config.DRIVE_SEQUENCE_BUNDLE).is_file()
+
+
+def sequence_members(sequence_uri):
+
+  """Relative paths of the loose files of a sequence, sorted"""
+
+  sequence_uri = Path(sequence_uri)
+  members = [p.relative_to(sequence_uri).as_posix()
+             for p in sequence_uri.rglob('*') if p.is_file()]
+  members = [m for m in members if m != config.DRIVE_SEQUENCE_BUNDLE]
+  members = [m for m in members if not m.endswith(config.S3_PARTIAL_SUFFIX)]
+
+  return sorted(members)
+
+
+def build_index(sequence_uri, members):
+
+  """Byte offsets of each member's data in the bundle
+
+    The index is the first tar member, padded to DRIVE_SEQUENCE_BUNDLE_INDEX
+    bytes, so every offset is known before the bundle is written.
+  """
+
+  index = {}
+  offset = TAR_BLOCK_SIZE + config.DRIVE_SEQUENCE_BUNDLE_INDEX
+
+  for member in members:
+    size = Path(sequence_uri).joinpath(member).stat().st_size
+    index[member] = [offset + TAR_BLOCK_SIZE, size]
+    offset += TAR_BLOCK_SIZE + _padded(size)
+
+  return index
+
+
+def encode_index(index):
+
+  data = json.dumps(index, sort_keys=True).encode('utf-8')
+  assert len(data) <= config.DRIVE_SEQUENCE_BUNDLE_INDEX, \
+      'Bundle index exceeds {} bytes'.format(config.DRIVE_SEQUENCE_BUNDLE_INDEX)
+
+  return data.ljust(config.DRIVE_SEQUENCE_BUNDLE_INDEX, b' ')
+
+
+def decode_index(data):
+
+  """Parses the index from the leading bytes of a bundle"""
+
+  start = TAR_BLOCK_SIZE
+  index = data[start: start + config.DRIVE_SEQUENCE_BUNDLE_INDEX]
+
+  return json.loads(index.decode('utf-8'))
+
+
+def index_range():
+
+  """Inclusive byte range holding the index of any bundle"""
+
+  return 0, TAR_BLOCK_SIZE + config.DRIVE_SEQUENCE_BUNDLE_INDEX - 1
+
+
+def pack_sequence(sequence_uri, remove=True):
+
+  """Packs the loose files of a sequence into an uncompressed tar bundle
+
+    Args:
+      sequence_uri: Sequence directory
+      remove: Remove the loose files once the bundle is written
+
+    Returns:
+      Path of the bundle
+  """
+
+  sequence_uri = Path(sequence_uri)
+  bundle_path = sequence_uri.joinpath(config.DRIVE_SEQUENCE_BUNDLE)
+  part_path = Path(bundle_path.as_posix() + config.S3_PARTIAL_SUFFIX)
+
+  members = sequence_members(sequence_uri)
+  index = build_index(sequence_uri, members)
+  index_data = encode_index(index)
+
+  with tarfile.open(part_path.as_posix(), 'w',
+                    format=tarfile.USTAR_FORMAT) as tar:
+
+    tarinfo = tarfile.TarInfo(config.DRIVE_SEQUENCE_BUNDLE_INDEX_NAME)
+    tarinfo.size = len(index_data)
+    tar.addfile(tarinfo, io.BytesIO(index_data))
+
+    for member in members:
+      assert tar.offset + TAR_BLOCK_SIZE == index[member][0], \
+          'Bundle offset mismatch for {}'.format(member)
+      tarinfo = tar.gettarinfo(sequence_uri.joinpath(member).as_posix(),
+                               arcname=member)
+      with sequence_uri.joinpath(member).open('rb') as pfile:
+        tar.addfile(tarinfo, pfile)
+
+  os.replace(part_path.as_posix(), bundle_path.as_posix())
+
+  if remove:
+    for member in members:
+      sequence_uri.joinpath(member).unlink()
+    for sub_dir in sorted(sequence_uri.rglob('*'), reverse=True):
+      if sub_dir.is_dir() and not any(sub_dir.iterdir()):
+        sub_dir.rmdir()
+
+  return bundle_path
+
+
+def unpack_sequence(sequence_uri, remove=True):
+
+  """Expands a sequence bundle back into loose files"""
+
+  sequence_uri = Path(sequence_uri)
+  bundle_path = sequence_uri.joinpath(config.DRIVE_SEQUENCE_BUNDLE)
+
+  with bundle_path.open('rb') as pfile:
+    index = decode_index(pfile.read(index_range()[1] + 1))
+
+    for member, (offset, size) in index.items():
+
+      member_path = sequence_uri.joinpath(member)
+      # raises for members escaping the sequence directory
+      member_path.resolve().relative_to(sequence_uri.resolve())
+
+      member_path.parent.mkdir(parents=True, exist_ok=True)
+      pfile.seek(offset)
+
+      with member_path.open('wb') as mfile:
+        shutil.copyfileobj(_BoundedReader(pfile, size), mfile)
+
+  if remove:
+    bundle_path.unlink()
+
+
+class _BoundedReader(object):
+
+  def __init__(self, pfile, size):
+
+    self.pfile = pfile
+    self.remaining = size
+
+  def read(self, size=-1):
+
+    if size < 0 or size > self.remaining:
+      size = self.remaining
+    data = self.pfile.read(size)
+    self.remaining -= len(data)
+    return data
+
+
+@contextlib.contextmanager
+def open_sequence_member(sequence_uri, member):
+
+  """Opens a sequence file (f.ex data.avro) in either layout
+
+    Yields a seekable binary file object, read from the bundle when the
+    sequence is bundled.
+  """
+
+  sequence_uri = Path(sequence_uri)
+
+  if not is_bundled(sequence_uri):
+    with sequence_uri.joinpath(member).open('rb') as pfile:
+      yield pfile
+    return
+
+  bundle_path = sequence_uri.joinpath(config.DRIVE_SEQUENCE_BUNDLE)
+
+  with tarfile.open(bundle_path.as_posix(), 'r:') as tar:
+    pfile = tar.extractfile(member)
+    if pfile is None:
+      raise FileNotFoundError('{} not in bundle {}'.format(member,
+                                                           sequence_uri))
+    yield pfile
+
+
+def fetch_bundle_index(s3_connector, bundle_key):
+
+  """Member byte offsets and sizes of a remote bundle, one range GET"""
+
+  start, end = index_range()
+  return decode_index(s3_connector.get_range(bundle_key, start, end))
+
+
+def fetch_bundle_member(s3_connector, bundle_key, member):
+
+  """Reads one member of a remote bundle with two small range GETs"""
+
+  index = fetch_bundle_index(s3_connector, bundle_key)
+
+  if member not in index:
+    raise KeyError('{} not in bundle {}'.format(member, bundle_key))
+
+  offset, size = index[member]
+  if size == 0:
+    return b''
+
+  return s3_connector.get_range(bundle_key, offset, offset + size - 1)
+
+
+def fetch_bundle_members(s3_connector, bundle_key, sequence_dir, skip=None,
+                         etag=None):
+
+  """Fetches the members of a remote bundle as loose files
+
+    Members are streamed with range GETs into temporary files, so skipped
+    members (f.ex video/) are never downloaded. Members on disk at their
+    indexed size are kept, as get_file keeps files of the listed size.
+    Members have no ETag of their own, so members of another version of
+    the bundle are only told apart by size. Partial members of earlier runs
+    are fetched again (see S3Connector.get_file_range).
+
+    Args:
+      s3_connector: Connected S3Connector
+      bundle_key: S3 key of the bundle
+      sequence_dir: Local sequence directory
+      skip: Member path prefixes not fetched
+      etag: ETag of the bundle, members of another version are refetched
+
+    Returns:
+      True once every fetched member is written
+  """
+
+  skip = skip or []
+  sequence_dir = Path(sequence_dir)
+
+  if etag is None:
+    etag = s3_connector.head(bundle_key)['ETag'].strip('"')
+
+  index = fetch_bundle_index(s3_connector, bundle_key)
+
+  for member, (offset, size) in sorted(index.items()):
+
+    if any(member.startswith(prefix) for prefix in skip):
+      continue
+
+    member_path = sequence_dir.joinpath(member)
+    member_path.resolve().relative_to(sequence_dir.resolve())
+    member_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if member_path.is_file() and member_path.stat().st_size == size:
+      continue
+
+    if not s3_connector.get_file_range(bundle_key, member_path.as_posix(),
+                                       offset, size, etag=etag):
+      return False
+
+  return True
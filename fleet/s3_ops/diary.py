@@ -1,15 +1,33 @@
 import os
 import re
 import glob
+import time
+import queue
+import datetime
 import operator
 import functools
+import threading
 from pathlib import Path
 
 import tqdm
 import numpy as np
 
 from fleet.configs import drive_config as config
-from fleet.s3_ops.s3_connector import S3Connector
+from fleet.s3_ops.s3_connector import get_connector
+from fleet.s3_ops.exclude import apply_exclusions, get_excluded_sensors
+from fleet.s3_ops.transfer import TransferPool, fetch_prefix, \
+    folder_transfers
+from fleet.s3_ops.token_index import TokenIndex
+from fleet.s3_ops.bundle import is_bundled, pack_sequence, unpack_sequence
+from fleet.s3_ops.manifest import PushManifest, get_manifest_path
+from fleet.s3_ops.remote import RemoteDiary
+from fleet.s3_ops.telemetry import get_report_path
+from fleet.s3_ops.integrity import check_drive_references
+from fleet.s3_ops.migrate import migrate_object
+from fleet.s3_ops.validation import ValidationCache, schema_fingerprint, \
+    sequence_files, validate_sequence, validate_sequences, \
+    iter_validate_sequences
+from fleet.utils.avro_io import get_layout
 from fleet.utils.helpers import read_avro_schemas, validate_with_schema
 
 logger = config.get_logger(__name__)
@@ -21,6 +39,8 @@ class Diary(object):
 
     self.diary_uuid = None
     self.s3_connector = None
+    self.push_manifest = None
+    self.remote_objects = {}
 
   def _set_diary_uuid(self, diary_uuid):
 
@@ -67,10 +87,26 @@ class Diary(object):
 
     return drive_diary_uri
 
-  def _validate_drive(self, drive_path):
+  def _validate_drive(self, drive_path, jobs=None, cache=None,
+                      references=True):
+
+    """Validates a drive diary on disk
+
+      Args:
+        drive_path: Drive diary directory
+        jobs: Number of processes validating sequences
+        cache: Optional ValidationCache, files found valid before and
+          unchanged since are skipped
+        references: Also check the tokens referenced across tables and
+          directories
+
+      Returns:
+        List of flags
+    """
 
     drive_flags = []
-    schemas = read_avro_schemas(config.get_avro_schema_path())
+    schema_path = config.get_avro_schema_path()
+    schemas = read_avro_schemas(schema_path)
 
     vehicle_uri = [x for x in drive_path.iterdir() if x.is_dir()]
     assert(len(vehicle_uri)) == 1, \
@@ -88,7 +124,7 @@ class Diary(object):
     assert drive_diary_avro.is_file(), \
         'Expected {} drive diary avro, No such file'.format(drive_diary_avro)
 
-    avro_flag = validate_with_schema(drive_diary_avro, schemas['diary'])
+    avro_flag = self._validate_file(drive_diary_avro, schemas['diary'], cache)
     drive_flags.append(avro_flag)
 
     drives_dir = Path(vehicle_uri).joinpath('drives')
@@ -114,7 +150,7 @@ class Diary(object):
       if not drive_exist:
         logger.warning('Expected {}, No such file'.format(drive_avro))
       else:
-        avro_flag = validate_with_schema(drive_avro, schemas['drive'])
+        avro_flag = self._validate_file(drive_avro, schemas['drive'], cache)
         valid_drives.append(drive_avro)
 
     drives = valid_drives
@@ -130,10 +166,10 @@ class Diary(object):
       else:
         valid_sequences.append(sequence)
 
-    pbar = tqdm.tqdm(valid_sequences)
+    sequences_uris = []
+    drive_sequences = {}
 
-    for sequence in pbar:
-      pbar.set_description("Validating drive : {}".format(sequence.parent))
+    for sequence in valid_sequences:
       sequence_uris = [x for x in sequence.iterdir() if x.is_dir()]
       valid_sequence_uris = [sequence for sequence in sequence_uris
                              if re.match(config.DRIVE_SEQUENCE_URI_PATTERN,
@@ -143,29 +179,87 @@ class Diary(object):
           'Expected atleast 1 sequence of ' \
           'form XXXXXX_<uuid> at'.format(sequence)
 
-      sequence_avro_files = [(uri.joinpath('data.avro'),
-                              uri.joinpath('element.avro'),
-                              uri.joinpath('sensordata.avro'),
-                              uri.joinpath('sequence.avro'))
-                             for uri in valid_sequence_uris]
+      sequences_uris.extend(valid_sequence_uris)
+      drive_sequences[sequence.parent] = valid_sequence_uris
+
+    drive_flags.extend(self._validate_sequences(sequences_uris, schema_path,
+                                                jobs=jobs, cache=cache,
+                                                references=references))
 
-      seqpbar = tqdm.tqdm(sequence_avro_files)
+    if references:
+      drive_flags.append(self._check_references(
+          vehicle_uri, [drive.parent for drive in drives], drive_sequences))
 
-      for (data, element, sensordata, sequence) in seqpbar:
+    return drive_flags
 
-        avro_flag = validate_with_schema(data, schemas['data'])
-        drive_flags.append(avro_flag)
+  def _check_references(self, vehicle_uri, drive_uris, drive_sequences,
+                        opener=None):
 
-        avro_flag = validate_with_schema(element, schemas['element'])
-        drive_flags.append(avro_flag)
+    try:
+      problems = check_drive_references(vehicle_uri, drive_uris,
+                                        drive_sequences, opener=opener)
+    except Exception as err:
+      problems = ['error checking references, {}'.format(err)]
 
-        avro_flag = validate_with_schema(sensordata, schemas['sensor'])
-        drive_flags.append(avro_flag)
+    for problem in problems:
+      logger.error('Broken references at {}, {}'.format(vehicle_uri, problem))
 
-        avro_flag = validate_with_schema(sequence, schemas['sequence'])
-        drive_flags.append(avro_flag)
+    return not problems
 
-    return drive_flags
+  def _load_validation_cache(self, drive_path, references=True, force=False,
+                             with_hash=False):
+
+    # results without reference checks do not stand for checked ones
+    schema_version = schema_fingerprint(config.get_avro_schema_path())
+    if references:
+      schema_version += '+references'
+
+    cache = ValidationCache(drive_path, schema_version, with_hash=with_hash)
+
+    return cache if force else cache.load()
+
+  def _validate_file(self, avro_path, schema, cache=None):
+
+    if cache is not None and cache.is_valid(avro_path):
+      return True
+
+    avro_flag = validate_with_schema(avro_path, schema)
+
+    if cache is not None:
+      if avro_flag:
+        cache.record(avro_path)
+      else:
+        cache.discard(avro_path)
+
+    return avro_flag
+
+  def _validate_sequences(self, sequence_uris, schema_path, jobs=None,
+                          cache=None, references=True):
+
+    if cache is None:
+      sequence_flags = validate_sequences(sequence_uris, schema_path,
+                                          jobs=jobs, references=references)
+      return [flag for flags in sequence_flags for flag in flags]
+
+    count = len(config.DRIVE_SEQUENCE_AVROS) + int(references)
+    sequence_flags = [[True] * count if cache.is_valid(
+        uri, sequence_files(uri)) else None for uri in sequence_uris]
+
+    pending = [idx for idx, flags in enumerate(sequence_flags)
+               if flags is None]
+    pending_flags = validate_sequences(
+        [sequence_uris[idx] for idx in pending], schema_path, jobs=jobs,
+        references=references)
+
+    for idx, flags in zip(pending, pending_flags):
+      uri = sequence_uris[idx]
+      sequence_flags[idx] = flags
+      if all(flags):
+        cache.record(uri, sequence_files(uri))
+      else:
+        cache.discard(uri)
+
+    return [flag for flags in sequence_flags for flag in flags]
 
   def _validate_drive_s3(self, repo_path, diary_uuid=None):
 
@@ -177,18 +271,28 @@ class Diary(object):
         'Diary Token {} does not match \
          patten {}'.format(diary_uuid, config.DRIVE_DIARY_TOKEN_PATTERN)
 
-    list_subdirs = self.s3_connector.list_subdirs
-    diaries = list_subdirs(config.AWS_DRIVE_DATA_BUCKET, repo_path)
-
-    diaries = [diary.rstrip('/') for diary in diaries]
-    diaries = [os.path.split(diary)[1] for diary in diaries]
+    diary_prefix = TokenIndex(self.s3_connector,
+                              repo_path).lookup('diary', diary_uuid)
+    if diary_prefix is not None:
+      return [os.path.basename(diary_prefix.rstrip('/'))]
 
     diary_pattern = config.DRIVE_DIARY_DATE_PATTERN + '_' + diary_uuid
 
-    for diary in diaries:
-      diary_token = re.match(diary_pattern, diary)
-      if diary_token is not None:
-        drive_diary.append(diary_token.group())
+    # listed from the snapshot, again in full if the diary is not in it
+    for refresh in [False, True]:
+
+      diaries = self.s3_connector.list_subdirs(repo_path, refresh=refresh)
+
+      diaries = [diary.rstrip('/') for diary in diaries]
+      diaries = [os.path.split(diary)[1] for diary in diaries]
+
+      for diary in diaries:
+        diary_token = re.match(diary_pattern, diary)
+        if diary_token is not None:
+          drive_diary.append(diary_token.group())
+
+      if drive_diary:
+        break
 
     return drive_diary
 
@@ -203,6 +307,22 @@ class Diary(object):
 
     return functools.reduce(operator.iconcat, drive_files, [])
 
+  def _check_sequences(self, drive_sequence):
+
+    """Asserts every loose sequence of a drive has a video file"""
+
+    sequence_uris = [x for x in drive_sequence.iterdir()
+                     if x.is_dir() and not is_bundled(x)]
+
+    video_dirs = [uri.joinpath('video') for uri in sequence_uris]
+    video_files = [video_dir.iterdir() for video_dir in video_dirs
+                   if video_dir.is_dir()]
+    video_files = functools.reduce(operator.iconcat, video_files, [])
+    video_files = [v for v in video_files if v.is_file()]
+
+    assert len(sequence_uris) == len(video_files), \
+        "Each sequence must have a video file"
+
   def _push(self, args):
 
     repo_type = args.repo
@@ -224,8 +344,7 @@ class Diary(object):
 
       drive_diary_uri = self._validate_drive_source(source_path)
 
-      self.s3_connector = S3Connector()
-      self.s3_connector.connect(env_name=None)
+      self.s3_connector = get_connector()
 
       drive_diary_path = Path(source_path).joinpath(drive_diary_uri)
 
@@ -235,9 +354,6 @@ class Diary(object):
                             os.path.basename(vehicle_uri))
 
       vehicle_id = vehicle_id.group()
-      drive_diary_avro = Path(vehicle_uri).joinpath('drive_diary.avro')
-      self._push_obj_to_s3(drive_diary_avro, source_path, drive_data_repo,
-                           verbose=True)
 
       drives_dir = Path(vehicle_uri).joinpath('drives')
 
@@ -246,71 +362,565 @@ class Diary(object):
                 if re.match(config.DRIVE_DIARY_TOKEN_PATTERN,
                             drive.name) is not None]
 
-      drive_avros = [drive.joinpath('drive.avro') for drive in drives]
-      drive_sequences = [drive.joinpath('sequences') for drive in drives]
-      pbar = tqdm.tqdm(list(zip(drive_avros, drive_sequences)))
+      for drive in drives:
+        self._check_sequences(drive.joinpath('sequences'))
 
-      for drive_avro, drive_sequence in pbar:
+      diary_s3_key = os.path.join(drive_data_repo, drive_diary_uri)
+      push_formats = [config.DRIVE_META_DATA_FORMAT,
+                      config.DRIVE_SEQUENCE_BUNDLE.rsplit('.', 1)[-1]]
+      push_formats += config.DRIVE_DATA_BLOB_FORMATS
 
-        pbar.set_description('Pushing drive {}'.format(drive_avro.parent.name))
+      if not args.force:
+        self._load_push_manifest(drive_data_repo, drive_diary_uri)
 
-        self._push_obj_to_s3(drive_avro, source_path, drive_data_repo)
+      with self.s3_connector.track('push') as telemetry:
+        try:
+          if args.validate:
+            transfers = list(folder_transfers(drive_diary_path,
+                                              diary_s3_key, push_formats))
+            s3_push_notif = self._validate_and_push(
+                drive_diary_path, vehicle_uri, drives, transfers,
+                jobs=args.jobs, validation_jobs=args.validation_jobs)
+          else:
+            s3_push_notif = [self.s3_connector.put_folder(
+                drive_diary_path, diary_s3_key, formats=push_formats,
+                jobs=args.jobs, put_fn=self._push_obj_to_s3,
+                desc='Pushing diary')]
+        finally:
+          if self.push_manifest is not None:
+            self.push_manifest.save()
+            logger.info('Skipped {} unchanged files, push manifest '
+                        '{}'.format(self.push_manifest.skipped,
+                                    self.push_manifest.manifest_path))
+          telemetry.save(self._report_path(args, 'push'))
 
-        sequence_uris = [x for x in drive_sequence.iterdir() if x.is_dir()]
+      assert np.all(s3_push_notif), \
+          'Failed to push complete drive diary {}'.format(source_path)
 
-        sequence_avro_files = [[uri.joinpath('data.avro'),
-                                uri.joinpath('element.avro'),
-                                uri.joinpath('sensordata.avro'),
-                                uri.joinpath('sequence.avro')]
-                               for uri in sequence_uris]
+      index_entries = self._index_entries(drive_diary_path, drives,
+                                          source_path, drive_data_repo)
+      assert TokenIndex(self.s3_connector, drive_data_repo).update(
+          index_entries, jobs=args.jobs), \
+          'Failed to update token index for {}'.format(source_path)
 
-        video_dirs = [uri.joinpath('video') for uri in sequence_uris]
-        video_files = [video_dir.iterdir() for video_dir in video_dirs
-                       if video_dir.is_dir()]
-        video_files = functools.reduce(operator.iconcat, video_files, [])
-        video_files = [[v] for v in video_files if v.is_file()]
+      logger.info('Done pushing diary '
+                  '{}, {}'.format(self.diary_uuid, drive_data_repo))
 
-        assert len(sequence_avro_files) == len(video_files), \
-            "Each sequence must have a video file"
+      return True
 
-        sequences_to_push = list(zip(video_files, sequence_avro_files))
-        seqpbar = tqdm.tqdm(sequences_to_push)
+    except Exception as err:
 
-        for seqdata in seqpbar:
-          seqdata = functools.reduce(operator.iconcat, seqdata, [])
-          seqpbar.set_description('Pushing sequence'
-                                  ' {}'.format(seqdata[1].parent.name))
+      logger.error('Error pushing drive : {}'.format(err))
+      return False
+
+  def _validate_and_push(self, drive_diary_path, vehicle_uri, drives,
+                         transfers, jobs=None, validation_jobs=None):
+
+    """Validates sequences and pushes each as soon as it is found valid
+
+      Sequences are validated on a process pool (producer) and put on a
+      bounded queue, upload threads (consumers) push the files of each
+      validated sequence, so CPU bound validation overlaps with network
+      bound uploads. Diary and drive tables are validated up front and
+      pushed last, only once every sequence is valid.
+
+      Args:
+        drive_diary_path: Drive diary directory
+        vehicle_uri: Vehicle directory of the diary
+        drives: Drive directories
+        transfers: List of (file, s3_key) of the diary
+        jobs: Number of upload threads
+        validation_jobs: Number of validation processes
+
+      Returns:
+        List of validation and push flags
+    """
+
+    jobs = jobs if jobs is not None else config.S3_TRANSFER_JOBS
+    schema_path = config.get_avro_schema_path()
+    schemas = read_avro_schemas(schema_path)
+    cache = self._load_validation_cache(drive_diary_path)
+
+    table_transfers, sequence_transfers = [], {}
+    for drive_file, s3_key in transfers:
+      sequence_uri = next((p for p in Path(drive_file).parents
+                           if p.parent.name == 'sequences'), None)
+      if sequence_uri is None:
+        table_transfers.append((drive_file, s3_key))
+      else:
+        sequence_transfers.setdefault(sequence_uri, []).append(
+            (drive_file, s3_key))
+
+    sequence_uris = sorted(sequence_transfers)
+    drive_sequences = {drive: [uri for uri in sequence_uris
+                               if uri.parents[1] == drive]
+                       for drive in drives}
+
+    flags = [self._validate_file(Path(vehicle_uri).joinpath(
+        'drive_diary.avro'), schemas['diary'], cache)]
+    flags += [self._validate_file(drive.joinpath('drive.avro'),
+                                  schemas['drive'], cache)
+              for drive in drives]
+    flags.append(self._check_references(vehicle_uri, drives,
+                                        drive_sequences))
+
+    validated = queue.Queue(maxsize=config.DRIVE_PUSH_QUEUE_SIZE)
+    push_flags = []
+    lock = threading.Lock()
+    pbar = tqdm.tqdm(total=len(sequence_uris), desc='Validating and pushing')
+
+    def upload():
+
+      while True:
+
+        sequence_uri = validated.get()
+        if sequence_uri is None:
+          return
+
+        for drive_file, s3_key in sequence_transfers[sequence_uri]:
+          try:
+            flag = self._push_obj_to_s3(drive_file, s3_key)
+          except Exception as err:
+            logger.error('Error pushing {}, {}'.format(drive_file, err))
+            flag = False
+          with lock:
+            push_flags.append(flag)
+
+        pbar.update(1)
+
+    cached = [uri for uri in sequence_uris
+              if cache.is_valid(uri, sequence_files(uri))]
+    pending = sorted(set(sequence_uris) - set(cached))
+
+    # worker processes are forked on the call, before any upload thread is
+    # started, uploads then overlap validation from the first sequence
+    validating = iter_validate_sequences(pending, schema_path,
+                                         jobs=validation_jobs)
+
+    uploaders = [threading.Thread(target=upload) for _ in range(jobs)]
+    for uploader in uploaders:
+      uploader.start()
 
-          databar = tqdm.tqdm(seqdata)
-          for data in databar:
-            databar.set_description('Pushing {}'.format(data.name))
-            flag = self._push_obj_to_s3(data, source_path, drive_data_repo)
-            s3_push_notif.append(flag)
+    try:
 
-          databar.close()
-        seqpbar.close()
+      for sequence_uri in cached:
+        validated.put(sequence_uri)
 
-      assert np.all(s3_push_notif), \
-          'Failed to push complete drive diary {}'.format(source_path)
+      for idx, sequence_flags in validating:
 
-      logger.info('Done pushing diary '
-                  '{}, {}'.format(self.diary_uuid, drive_data_repo))
+        sequence_uri = pending[idx]
+        flags.extend(sequence_flags)
+
+        if all(sequence_flags):
+          cache.record(sequence_uri, sequence_files(sequence_uri))
+          validated.put(sequence_uri)
+        else:
+          cache.discard(sequence_uri)
+          pbar.update(1)
+
+    finally:
+
+      for _ in uploaders:
+        validated.put(None)
+      for uploader in uploaders:
+        uploader.join()
+
+      pbar.close()
+      cache.save()
+
+    flags.extend(push_flags)
+
+    if not all(flags):
+      logger.error('Invalid or partially pushed diary, not pushing diary '
+                   'and drive tables')
+      return flags
+
+    table_flags, _ = self.s3_connector.put_files(
+        table_transfers, jobs=jobs, put_fn=self._push_obj_to_s3,
+        desc='Pushing diary tables')
+
+    return flags + table_flags
+
+  def _index_entries(self, drive_diary_path, drives, source_path,
+                     drive_data_repo):
+
+    def key_prefix(path):
+      suffix = str(path).split(source_path)[1]
+      return os.path.join(drive_data_repo, suffix) + '/'
+
+    entries = [('diary', self.diary_uuid, key_prefix(drive_diary_path))]
+
+    for drive in drives:
+
+      entries.append(('drive', drive.name, key_prefix(drive)))
+
+      sequences_dir = drive.joinpath('sequences')
+      sequence_uris = [x for x in sequences_dir.iterdir()
+                       if x.is_dir() and re.match(
+                           config.DRIVE_SEQUENCE_URI_PATTERN, x.name)]
+
+      for sequence_uri in sequence_uris:
+        sequence_token = re.search(config.DRIVE_DIARY_TOKEN_PATTERN,
+                                   sequence_uri.name).group()
+        entries.append(('sequence', sequence_token, key_prefix(sequence_uri)))
+
+    return entries
+
+  def _key_index_entries(self, s3_keys, drive_data_repo):
+
+    """Token index entries of diaries from their object keys"""
+
+    delimiter = config.AWS_S3_KEY_DELIMITER
+    entries = set()
+
+    def prefix(n):
+      return drive_data_repo + delimiter.join(parts[:n]) + delimiter
+
+    for s3_key in s3_keys:
+
+      parts = s3_key[len(drive_data_repo):].split(delimiter)
+
+      diary_token = re.search(config.DRIVE_DIARY_TOKEN_PATTERN, parts[0])
+      entries.add(('diary', diary_token.group(), prefix(1)))
+
+      if len(parts) > 4 and parts[2] == 'drives':
+        entries.add(('drive', parts[3], prefix(4)))
+
+      in_sequence = len(parts) > 6 and parts[4] == 'sequences'
+      if in_sequence and re.match(config.DRIVE_SEQUENCE_URI_PATTERN, parts[5]):
+        sequence_token = re.search(config.DRIVE_DIARY_TOKEN_PATTERN,
+                                   parts[5]).group()
+        entries.add(('sequence', sequence_token, prefix(6)))
+
+    return sorted(entries)
+
+  def _verify_copies(self, src_objects, dst_objects, copies):
+
+    """Source keys whose copy is missing or differs"""
+
+    mismatches = []
+
+    for src in src_objects:
+
+      dst = dst_objects.get(copies[src['Key']])
+
+      if dst is None or dst['Size'] != src['Size']:
+        mismatches.append(src['Key'])
+        continue
+
+      if dst['ETag'] == src['ETag']:
+        continue
+
+      # multipart sources uploaded with another part size
+      src_md5 = self.s3_connector.head(src['Key'])['Metadata'].get('md5')
+      dst_md5 = self.s3_connector.head(dst['Key'])['Metadata'].get('md5')
+
+      if src_md5 is None or src_md5 != dst_md5:
+        mismatches.append(src['Key'])
+
+    return mismatches
+
+  def _promote(self, args):
+
+    self._set_diary_uuid(args.token)
+
+    try:
+
+      repo_uris = config.get_aws_repo_uris(args.avro_schema_version)
+      src_repo, dst_repo = repo_uris['dump'], repo_uris['master']
+
+      self.s3_connector = get_connector()
+
+      diary_uri = self._validate_drive_s3(src_repo)
+
+      if diary_uri == []:
+        logger.error('Diary with token : {}, '
+                     'does not exist at {}'.format(self.diary_uuid, src_repo))
+        return False
+
+      src_prefix = os.path.join(src_repo, diary_uri[0]) + '/'
+      # listed in full, the copies are verified against both listings
+      src_objects = self.s3_connector.list_object_info(src_prefix,
+                                                       refresh=True)
+
+      copies = {obj['Key']: dst_repo + obj['Key'][len(src_repo):]
+                for obj in src_objects}
+      # copied in the parts of the source, so ETags verify the copies
+      transfers = [(obj['Key'], copies[obj['Key']], obj['Size'], obj['ETag'])
+                   for obj in src_objects]
+
+      flags, _ = self.s3_connector.copy_files(transfers, jobs=args.jobs,
+                                              desc='Promoting diary')
+      assert all(flags), 'Failed to copy diary {}'.format(self.diary_uuid)
+
+      dst_prefix = dst_repo + src_prefix[len(src_repo):]
+      dst_objects = {obj['Key']: obj for obj in
+                     self.s3_connector.list_object_info(dst_prefix,
+                                                        refresh=True)}
+
+      mismatches = self._verify_copies(src_objects, dst_objects, copies)
+      for s3_key in mismatches:
+        logger.error('Copy of {} does not match the source'.format(s3_key))
+      assert not mismatches, '{}/{} copies of diary {} do not match, ' \
+          'source kept'.format(len(mismatches), len(src_objects),
+                               self.diary_uuid)
+
+      src_keys = [obj['Key'] for obj in src_objects]
+
+      assert TokenIndex(self.s3_connector, dst_repo).update(
+          self._key_index_entries(copies.values(), dst_repo),
+          jobs=args.jobs), \
+          'Failed to update token index for {}'.format(dst_repo)
+
+      logger.info('Promoted diary {}, {} objects verified at {}'.format(
+          self.diary_uuid, len(src_objects), dst_prefix))
+
+      if args.delete_source:
+
+        src_entries = self._key_index_entries(src_keys, src_repo)
+        assert TokenIndex(self.s3_connector, src_repo).remove(
+            [(kind, token) for kind, token, _ in src_entries],
+            jobs=args.jobs), \
+            'Failed to update token index for {}'.format(src_repo)
+
+        assert self.s3_connector.delete_files(src_keys, jobs=args.jobs), \
+            'Failed to delete source of diary {}'.format(self.diary_uuid)
+        logger.info('Deleted {} source objects at {}'.format(
+            len(src_keys), src_prefix))
+
+      return True
 
     except Exception as err:
+      logger.error('Error promoting diary {}, {}'.format(self.diary_uuid, err))
+      return False
 
-      logger.error('Error pushing drive : {}'.format(err))
+  def _delete_diaries(self, drive_data_repo, diary_prefixes, jobs=None,
+                      objects=None):
 
-  def _push_obj_to_s3(self, drive_file, source_path,
-                      drive_data_repo, verbose=False):
+    """Deletes diaries and their token index entries"""
 
-    s3_file_prefix = str(drive_file).split(source_path)[1]
-    s3_file_key = os.path.join(drive_data_repo, s3_file_prefix)
-    flag = self.s3_connector.put_file(str(drive_file), s3_file_key)
+    objects = self.s3_connector.list_prefixes(diary_prefixes, jobs=jobs) \
+        if objects is None else objects
+    s3_keys = [obj['Key'] for prefix in diary_prefixes
+               for obj in objects[prefix]]
 
-    if verbose:
-      logger.info('Pushed {}'.format(s3_file_key))
+    # unindex first, a failed delete leaves objects but no dangling entries
+    index_entries = self._key_index_entries(s3_keys, drive_data_repo)
+    assert TokenIndex(self.s3_connector, drive_data_repo).remove(
+        [(kind, token) for kind, token, _ in index_entries], jobs=jobs), \
+        'Failed to update token index for {}'.format(drive_data_repo)
 
-    return True
+    flag, _ = self.s3_connector.delete_prefixes(diary_prefixes, jobs=jobs,
+                                                objects=objects)
+    assert flag, 'Failed to delete {} diaries'.format(len(diary_prefixes))
+
+    return s3_keys
+
+  def _delete(self, args):
+
+    self._set_diary_uuid(args.token)
+
+    try:
+
+      repo_uris = config.get_aws_repo_uris(args.avro_schema_version)
+      drive_data_repo = repo_uris[args.repo]
+
+      self.s3_connector = get_connector()
+
+      diary_uri = self._validate_drive_s3(drive_data_repo)
+
+      if diary_uri == []:
+        logger.error('Diary with token : {}, '
+                     'does not exist at {}'.format(self.diary_uuid,
+                                                   drive_data_repo))
+        return False
+
+      diary_prefix = os.path.join(drive_data_repo, diary_uri[0]) + '/'
+      s3_keys = self._delete_diaries(drive_data_repo, [diary_prefix],
+                                     jobs=args.jobs)
+
+      logger.info('Deleted diary {}, {} objects at {}'.format(
+          self.diary_uuid, len(s3_keys), diary_prefix))
+      return True
+
+    except Exception as err:
+      logger.error('Error deleting diary {}, {}'.format(self.diary_uuid, err))
+      return False
+
+  def _prune(self, args):
+
+    try:
+
+      repo_uris = config.get_aws_repo_uris(args.avro_schema_version)
+      drive_data_repo = repo_uris['scratch']
+
+      self.s3_connector = get_connector()
+
+      diary_prefixes = [prefix for prefix in self.s3_connector.list_subdirs(
+          drive_data_repo)
+          if re.match(config.DRIVE_DIARY_URI_PATTERN,
+                      os.path.basename(prefix.rstrip('/')))]
+
+      objects = self.s3_connector.list_prefixes(diary_prefixes,
+                                                jobs=args.jobs)
+
+      # a diary is as old as its most recently written object
+      now = datetime.datetime.now(datetime.timezone.utc)
+      max_age = datetime.timedelta(days=args.older_than)
+
+      def age(prefix):
+        return now - max(obj['LastModified'] for obj in objects[prefix])
+
+      stale = [prefix for prefix in diary_prefixes
+               if objects[prefix] and age(prefix) > max_age]
+
+      for prefix in stale:
+        logger.info('{} {}, {} objects'.format(
+            'Would prune' if args.dry_run else 'Pruning', prefix,
+            len(objects[prefix])))
+
+      if args.dry_run or not stale:
+        logger.info('{}/{} diaries in {} older than {} days'.format(
+            len(stale), len(diary_prefixes), drive_data_repo,
+            args.older_than))
+        return True
+
+      s3_keys = self._delete_diaries(drive_data_repo, stale, jobs=args.jobs,
+                                     objects=objects)
+
+      logger.info('Pruned {} diaries, {} objects from {}'.format(
+          len(stale), len(s3_keys), drive_data_repo))
+      return True
+
+    except Exception as err:
+      logger.error('Error pruning scratch diaries, {}'.format(err))
+      return False
+
+  def _migrate(self, args):
+
+    """Rewrites diaries of one schema version repo into another
+
+      Avro tables (loose and in sequence bundles) are rewritten in the
+      layout of the target version (see avro_io.get_layout), other objects
+      copied server side, objects migrated concurrently. The source is
+      kept, rerun to retry failed objects.
+    """
+
+    try:
+
+      src_repo = config.get_aws_repo_uris(args.from_version)[args.repo]
+      dst_repo = config.get_aws_repo_uris(args.to_version)[args.repo]
+      assert src_repo != dst_repo, 'Expected different schema versions, ' \
+          'found {} twice'.format(args.from_version)
+
+      layout = get_layout(args.to_version)
+
+      self.s3_connector = get_connector()
+
+      if args.token is not None:
+
+        self._set_diary_uuid(args.token)
+        diary_uri = self._validate_drive_s3(src_repo)
+        assert diary_uri != [], 'Diary with token {} does not exist at ' \
+            '{}'.format(self.diary_uuid, src_repo)
+        diary_prefixes = [os.path.join(src_repo, diary_uri[0]) + '/']
+
+      else:
+
+        diary_prefixes = [prefix for prefix in
+                          self.s3_connector.list_subdirs(src_repo)
+                          if re.match(config.DRIVE_DIARY_URI_PATTERN,
+                                      os.path.basename(prefix.rstrip('/')))]
+
+      objects = self.s3_connector.list_prefixes(diary_prefixes,
+                                                jobs=args.jobs)
+      src_objects = [obj for prefix in diary_prefixes
+                     for obj in objects[prefix]]
+
+      copies = {obj['Key']: dst_repo + obj['Key'][len(src_repo):]
+                for obj in src_objects}
+      transfers = [(obj['Key'], copies[obj['Key']], obj['Size'], layout)
+                   for obj in src_objects]
+
+      with self.s3_connector.track('migrate') as telemetry:
+        try:
+          pool = TransferPool(jobs=args.jobs, desc='Migrating diaries')
+          flags, failures = pool.run(
+              functools.partial(migrate_object, self.s3_connector),
+              transfers, sizes=[obj['Size'] for obj in src_objects])
+          pool.summarize(failures, len(transfers))
+        finally:
+          telemetry.save(self._report_path(args, 'migrate'))
+
+      assert all(flags), 'Failed to migrate {}/{} objects, rerun to ' \
+          'retry'.format(len(failures), len(transfers))
+
+      dst_prefixes = [dst_repo + prefix[len(src_repo):]
+                      for prefix in diary_prefixes]
+      dst_objects = self.s3_connector.list_prefixes(dst_prefixes,
+                                                    jobs=args.jobs)
+      dst_keys = {obj['Key'] for prefix in dst_prefixes
+                  for obj in dst_objects[prefix]}
+
+      missing = set(copies.values()) - dst_keys
+      assert not missing, '{}/{} migrated objects missing at {}, f.ex ' \
+          '{}'.format(len(missing), len(copies), dst_repo, min(missing))
+
+      assert TokenIndex(self.s3_connector, dst_repo).update(
+          self._key_index_entries(copies.values(), dst_repo),
+          jobs=args.jobs), \
+          'Failed to update token index for {}'.format(dst_repo)
+
+      logger.info('Migrated {} diaries, {} objects from {} to {} ({} '
+                  'layout)'.format(len(diary_prefixes), len(copies),
+                                   src_repo, dst_repo, layout))
+      return True
+
+    except Exception as err:
+      logger.error('Error migrating diaries, {}'.format(err))
+      return False
+
+  def _load_push_manifest(self, drive_data_repo, drive_diary_uri):
+
+    manifest_path = get_manifest_path(self.s3_connector.bucket_name,
+                                      drive_data_repo, drive_diary_uri)
+    self.push_manifest = PushManifest(manifest_path).load()
+
+    diary_s3_key = os.path.join(drive_data_repo, drive_diary_uri)
+    # always list remotely, a stale snapshot could skip deleted objects
+    remote_objects = self.s3_connector.list_object_info(diary_s3_key,
+                                                        refresh=True)
+    self.remote_objects = {obj['Key']: obj for obj in remote_objects}
+
+  def _report_path(self, args, operation):
+
+    """Transfer report of the run, --report or a per run file in the cache"""
+
+    if args.report is not None:
+      return args.report
+
+    return get_report_path(operation, self.diary_uuid)
+
+  def _push_obj_to_s3(self, drive_file, s3_file_key):
+
+    if self.push_manifest is None:
+      return self.s3_connector.put_checked(drive_file, s3_file_key)
+
+    start = time.perf_counter()
+
+    if self.push_manifest.is_pushed(drive_file, s3_file_key,
+                                    self.remote_objects):
+      self.s3_connector.record('put_skipped', s3_file_key, 0, start)
+      return True
+
+    md5, etag = self.push_manifest.checksum(drive_file, s3_file_key)
+    flag = self.s3_connector.put_file(str(drive_file), s3_file_key,
+                                      md5=md5, etag=etag)
+
+    if flag:
+      self.push_manifest.record(drive_file, s3_file_key)
+
+    return flag
 
   def _validate(self, args):
 
@@ -320,16 +930,33 @@ class Diary(object):
 
     self._set_diary_uuid(diary_token)
 
+    if args.remote is not None:
+      return self._validate_remote(args)
+
     try:
 
+      assert source_path is not None, 'Expected a diary --source on disk ' \
+          'or a --remote repo'
+
       drive_diary_uri = self._validate_drive_source(source_path)
 
       drive_path = Path(source_path).joinpath(drive_diary_uri)
 
-      drive_valid_flags = self._validate_drive(drive_path)
+      references = not args.skip_references
+      cache = self._load_validation_cache(drive_path, references=references,
+                                          force=args.force,
+                                          with_hash=args.hash)
+
+      try:
+        drive_valid_flags = self._validate_drive(drive_path, jobs=args.jobs,
+                                                 cache=cache,
+                                                 references=references)
+      finally:
+        cache.save()
 
-      logger.info('Drive {} validated : {}'.format(drive_path,
-                                                   all(drive_valid_flags)))
+      logger.info('Drive {} validated : {}, {} unchanged skipped, validation '
+                  'cache {}'.format(drive_path, all(drive_valid_flags),
+                                    cache.skipped, cache.cache_path))
 
       logger.info('Now run : data-catalogue diary -t '
                   '{} push -r dump -s {}'.format(self.diary_uuid, source_path))
@@ -339,6 +966,77 @@ class Diary(object):
       logger.error('Drive data should'
                    ' confirm with {}'.format(config.DRIVE_DATA_STRUCTURE_URL))
 
+  def _validate_remote(self, args):
+
+    """Validates a diary on S3 without fetching it
+
+      Avro objects (and bundle members) are streamed with range GETs into
+      the validators, nothing is staged on disk. Sequences are validated
+      on a bounded pool of threads, mostly waiting on S3.
+    """
+
+    try:
+
+      drive_data_repo = config.get_aws_repo_uris(
+          args.avro_schema_version)[args.remote]
+
+      self.s3_connector = get_connector()
+
+      diary_uri = self._validate_drive_s3(drive_data_repo)
+      assert diary_uri != [], 'Diary with token {} does not exist at ' \
+          '{}'.format(self.diary_uuid, drive_data_repo)
+
+      diary = RemoteDiary(self.s3_connector,
+                          os.path.join(drive_data_repo, diary_uri[0]))
+
+      references = not args.skip_references
+      schemas = read_avro_schemas(config.get_avro_schema_path())
+
+      def validate_table(uri, schema_name):
+        with diary.open(uri) as pfile:
+          return validate_with_schema(pfile, schemas[schema_name],
+                                      args.trust_header)
+
+      def validate_remote_sequence(sequence_uri):
+        return all(validate_sequence(
+            sequence_uri, schemas, references,
+            opener=diary.open_sequence_member,
+            trust_header=args.trust_header))
+
+      with self.s3_connector.track('validate') as telemetry:
+        try:
+
+          flags = [validate_table(diary.vehicle_uri.joinpath(
+              'drive_diary.avro'), 'diary')]
+          flags += [validate_table(drive_uri.joinpath('drive.avro'), 'drive')
+                    for drive_uri in diary.drive_uris]
+
+          pool = TransferPool(jobs=args.jobs or config.S3_TRANSFER_JOBS,
+                              desc='Validating sequences')
+          sequence_flags, _ = pool.run(validate_remote_sequence,
+                                       [(uri, ) for uri in
+                                        diary.sequence_uris])
+          flags += sequence_flags
+
+          if references:
+            flags.append(self._check_references(
+                diary.vehicle_uri, diary.drive_uris, diary.drive_sequences,
+                opener=diary.open))
+
+        finally:
+          telemetry.save(self._report_path(args, 'validate'))
+
+      logger.info('Drive {} validated on S3 : {}, {} of {} sequences '
+                  'valid'.format(diary.diary_key, all(flags),
+                                 sum(sequence_flags), len(sequence_flags)))
+
+      return all(flags)
+
+    except Exception as err:
+      logger.error('Error validating Drive'
+                   ' {} on S3, {}'.format(self.diary_uuid, err))
+      return False
+
   def _fetch(self, args):
 
     repo_type = args.repo
@@ -354,9 +1052,7 @@ class Diary(object):
       repo_uris = config.get_aws_repo_uris(avro_schema_version)
       drive_data_repo = repo_uris[repo_type]
 
-      self.s3_connector = S3Connector()
-      self.s3_connector.connect(env_name=None)
-      s3_resource = self.s3_connector.s3_resource
+      self.s3_connector = get_connector()
 
       diary_uri = self._validate_drive_s3(drive_data_repo)
 
@@ -367,29 +1063,27 @@ class Diary(object):
         return False
 
       diary_s3_key = os.path.join(drive_data_repo, diary_uri[0])
-      list_objects = self.s3_connector.list_objects
-      drive_data_files = list_objects(config.AWS_DRIVE_DATA_BUCKET,
-                                      diary_s3_key)
-
-      drive_pbar = tqdm.tqdm(drive_data_files)
 
-      # [TODO] : multi-thread
-      for drive_file in drive_pbar:
+      exclude = get_excluded_sensors(args)
 
+      with self.s3_connector.track('fetch') as telemetry:
         try:
+          fetched = fetch_prefix(self.s3_connector, diary_s3_key,
+                                 drive_data_repo, destination, jobs=args.jobs,
+                                 desc='Fetching diary', exclude=exclude)
+        finally:
+          telemetry.save(self._report_path(args, 'fetch'))
+
+      if not fetched:
+        logger.error('Failed to fetch complete diary {}, rerun to resume '
+                     'partial downloads'.format(self.diary_uuid))
+        return False
 
-          _, drive_suffix = drive_file.split(drive_data_repo)
-          destination_file = os.path.join(destination, drive_suffix)
-          destination_folder, _ = os.path.split(destination_file)
-
-          os.makedirs(destination_folder, exist_ok=True)
-
-          obj = s3_resource.Object(config.AWS_DRIVE_DATA_BUCKET, drive_file)
-          obj.download_file('{}'.format(destination_file))
-          # drive_pbar.set_description('Pulling %s' % os.path.join(drive_file))
+      apply_exclusions(Path(destination).joinpath(diary_uri[0]), exclude)
 
-        except Exception as err:
-          logger.error('Error fetching {}, {}'.format(drive_file, err))
+      if args.unbundle:
+        self._repack_diary(Path(destination).joinpath(diary_uri[0]),
+                           unbundle=True)
 
       logger.info('Done fetching diary with'
                   'token {} to {}'.format(self.diary_uuid, destination))
@@ -398,14 +1092,71 @@ class Diary(object):
     except Exception as err:
       logger.error('Error fetching drive diary, {}'.format(err))
 
+  def _sequence_uris(self, drive_path):
+
+    sequence_dirs = drive_path.glob('vehicle_*/drives/*/sequences/*')
+
+    sequence_uris = [uri for uri in sequence_dirs if uri.is_dir()]
+
+    return sorted([uri for uri in sequence_uris
+                   if re.match(config.DRIVE_SEQUENCE_URI_PATTERN, uri.name)])
+
+  def _repack_diary(self, drive_path, unbundle=False):
+
+    sequence_uris = self._sequence_uris(drive_path)
+    sequence_uris = [uri for uri in sequence_uris
+                     if is_bundled(uri) == unbundle]
+
+    pbar = tqdm.tqdm(sequence_uris)
+
+    for sequence_uri in pbar:
+      pbar.set_description('{} sequence {}'.format(
+          'Unbundling' if unbundle else 'Bundling', sequence_uri.name))
+      if unbundle:
+        unpack_sequence(sequence_uri)
+      else:
+        pack_sequence(sequence_uri)
+
+    return len(sequence_uris)
+
+  def _repack(self, args):
+
+    self._set_diary_uuid(args.token)
+
+    try:
+
+      drive_diary_uri = self._validate_drive_source(args.source)
+      drive_path = Path(args.source).joinpath(drive_diary_uri)
+
+      repacked = self._repack_diary(drive_path, unbundle=args.unbundle)
+
+      logger.info('Repacked {} sequences of {} to {} layout'.format(
+          repacked, drive_path, 'loose' if args.unbundle else 'bundled'))
+
+    except Exception as err:
+      logger.error('Error repacking diary {}, {}'.format(self.diary_uuid, err))
+
   def _info(self, args):
 
     self._set_diary_uuid(args.token)
 
+  def _token_required(self, parser, main):
+
+    """Wraps an op on one diary, a missing -t is a usage error"""
+
+    def run(args):
+      if args.token is None:
+        parser.error('the following arguments are required: -t/--token')
+      return main(args)
+
+    return run
+
   def build_parser(self, parser):
 
-    parser.add_argument('-t', '--token',
-                        help='Drive diary token (UUID)', required=True)
+    # required by every op but prune and migrate (every diary of a repo)
+    parser.add_argument('-t', '--token', default=None,
+                        help='Drive diary token (UUID), required but for '
+                        'prune and migrate')
 
     subparsers = parser.add_subparsers(title='Diary Operations', dest='op',
                                        description='Valid diary operation',
@@ -415,6 +1166,16 @@ class Diary(object):
     push = subparsers.add_parser('push', help='Push drive diary to S3')
     validate = subparsers.add_parser('validate', help='Validate drive'
                                      ' data structure')
+    repack = subparsers.add_parser('repack', help='Convert sequences between'
+                                   ' loose files and bundles')
+    promote = subparsers.add_parser('promote', help='Copy drive diary from '
+                                    'dump to master on S3')
+    delete = subparsers.add_parser('delete', help='Delete drive diary '
+                                   'from S3')
+    prune = subparsers.add_parser('prune', help='Delete scratch diaries '
+                                  'older than N days from S3')
+    migrate = subparsers.add_parser('migrate', help='Rewrite drive diaries '
+                                    'on S3 for another schema version')
 
     fetch.add_argument('-r', '--repo', dest='repo', required=True,
                        choices=['dump', 'master'],
@@ -426,10 +1187,22 @@ class Diary(object):
                        'specified gets from submodule')
     fetch.add_argument('-d', '--dest', dest='dest', required=True,
                        help='Save path for drive diary on disk')
-    fetch.add_argument('-e', '--exclude', dest='exclude',
+    fetch.add_argument('-e', '--exclude', dest='exclude', nargs='+',
                        choices=config.DRIVE_DATA_SENSORS, default=None,
-                       help='Destination where to write the diary')
-    fetch.set_defaults(main=self._fetch)
+                       help='Sensors excluded from the fetched diary')
+    fetch.add_argument('-m', '--metadata-only', dest='metadata_only',
+                       action='store_true', default=False,
+                       help='Fetch avro files only, skips videos')
+    fetch.add_argument('-j', '--jobs', dest='jobs', type=int,
+                       default=config.S3_TRANSFER_JOBS,
+                       help='Number of files downloaded concurrently')
+    fetch.add_argument('-u', '--unbundle', dest='unbundle',
+                       action='store_true', default=False,
+                       help='Expand bundled sequences into loose files')
+    fetch.add_argument('--report', dest='report', default=None,
+                       help='Transfer report (JSON) path, defaults to '
+                       '{}'.format(config.TRANSFER_REPORT_DIR))
+    fetch.set_defaults(main=self._token_required(parser, self._fetch))
 
     info.add_argument('-a', '--avro-schema-version',
                       dest='avro_schema_version',
@@ -444,7 +1217,7 @@ class Diary(object):
                       help='Get image compression sensor data in diary')
     info.add_argument('sensor_suite', action='store_true', default=False,
                       help='Get available sensor suit description')
-    info.set_defaults(main=self._info)
+    info.set_defaults(main=self._token_required(parser, self._info))
 
     push.add_argument('-r', '--repo', dest='repo', required=True,
                       choices=['dump', 'master', 'scratch'],
@@ -456,13 +1229,128 @@ class Diary(object):
                       'specified gets from submodule')
     push.add_argument('-s', '--source', dest='source', required=True,
                       help='Source of drive data on disk (uncompressed)')
-    push.set_defaults(main=self._push)
+    push.add_argument('-j', '--jobs', dest='jobs', type=int,
+                      default=config.S3_TRANSFER_JOBS,
+                      help='Number of files uploaded concurrently')
+    push.add_argument('-f', '--force', dest='force', action='store_true',
+                      default=False,
+                      help='Push every file, ignoring the push manifest')
+    push.add_argument('-v', '--validate', dest='validate',
+                      action='store_true', default=False,
+                      help='Validate sequences while pushing them, '
+                      'pushes nothing of an invalid diary but its valid '
+                      'sequences')
+    push.add_argument('--validation-jobs', dest='validation_jobs', type=int,
+                      default=config.DRIVE_VALIDATION_JOBS,
+                      help='Number of processes validating sequences')
+    push.add_argument('--report', dest='report', default=None,
+                      help='Transfer report (JSON) path, defaults to '
+                      '{}'.format(config.TRANSFER_REPORT_DIR))
+    push.set_defaults(main=self._token_required(parser, self._push))
 
     validate.add_argument('-a', '--avro-schema-version',
                           dest='avro_schema_version',
                           default=config.get_avro_schema_version(),
                           help='Avro schema version if not'
                           'specified gets from submodule')
-    validate.add_argument('-s', '--source', dest='source', required=True,
+    validate.add_argument('-s', '--source', dest='source', default=None,
                           help='Source of drive data on disk (uncompressed)')
-    validate.set_defaults(main=self._validate)
+    validate.add_argument('-r', '--remote', dest='remote', default=None,
+                          choices=['dump', 'master', 'scratch'],
+                          help='Validate the diary in this repo on S3, '
+                          'streamed without fetching it')
+    validate.add_argument('-j', '--jobs', dest='jobs', type=int,
+                          default=None,
+                          help='Number of processes validating sequences '
+                          '(threads with --remote), defaults to {} '
+                          '({} with --remote)'.format(
+                              config.DRIVE_VALIDATION_JOBS,
+                              config.S3_TRANSFER_JOBS))
+    validate.add_argument('-f', '--force', dest='force', action='store_true',
+                          default=False,
+                          help='Validate every file, ignoring the '
+                          'validation cache')
+    validate.add_argument('--hash', dest='hash', action='store_true',
+                          default=False,
+                          help='Compare file contents (MD5) besides size '
+                          'and mtime to detect changed files')
+    validate.add_argument('--skip-references', dest='skip_references',
+                          action='store_true', default=False,
+                          help='Skip checking the tokens referenced across '
+                          'tables and directories')
+    validate.add_argument('--trust-header', dest='trust_header',
+                          action='store_true', default=False,
+                          help='With --remote, accept avro files whose '
+                          'header holds the expected schema without '
+                          'reading their rows')
+    validate.add_argument('--report', dest='report', default=None,
+                          help='Transfer report (JSON) of --remote, '
+                          'defaults to {}'.format(config.TRANSFER_REPORT_DIR))
+    validate.set_defaults(main=self._token_required(parser, self._validate))
+
+    repack.add_argument('-s', '--source', dest='source', required=True,
+                        help='Source of drive data on disk (uncompressed)')
+    repack.add_argument('-u', '--unbundle', dest='unbundle',
+                        action='store_true', default=False,
+                        help='Expand bundles into loose files instead')
+    repack.set_defaults(main=self._token_required(parser, self._repack))
+
+    promote.add_argument('-a', '--avro-schema-version',
+                         dest='avro_schema_version',
+                         default=config.get_avro_schema_version(),
+                         help='Avro schema version if not'
+                         'specified gets from submodule')
+    promote.add_argument('-j', '--jobs', dest='jobs', type=int,
+                         default=config.S3_TRANSFER_JOBS,
+                         help='Number of objects copied concurrently')
+    promote.add_argument('-x', '--delete-source', dest='delete_source',
+                         action='store_true', default=False,
+                         help='Delete the diary from dump once verified')
+    promote.set_defaults(main=self._token_required(parser, self._promote))
+
+    delete.add_argument('-r', '--repo', dest='repo', required=True,
+                        choices=['dump', 'scratch'],
+                        help='Repo to delete the diary from')
+    delete.add_argument('-a', '--avro-schema-version',
+                        dest='avro_schema_version',
+                        default=config.get_avro_schema_version(),
+                        help='Avro schema version if not'
+                        'specified gets from submodule')
+    delete.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        default=config.S3_TRANSFER_JOBS,
+                        help='Number of delete batches in flight')
+    delete.set_defaults(main=self._token_required(parser, self._delete))
+
+    prune.add_argument('-o', '--older-than', dest='older_than', type=float,
+                       required=True,
+                       help='Age in days of the newest object of a diary')
+    prune.add_argument('-a', '--avro-schema-version',
+                       dest='avro_schema_version',
+                       default=config.get_avro_schema_version(),
+                       help='Avro schema version if not'
+                       'specified gets from submodule')
+    prune.add_argument('-j', '--jobs', dest='jobs', type=int,
+                       default=config.S3_TRANSFER_JOBS,
+                       help='Number of listings / delete batches in flight')
+    prune.add_argument('-n', '--dry-run', dest='dry_run',
+                       action='store_true', default=False,
+                       help='List the diaries that would be pruned')
+    prune.set_defaults(main=self._prune)
+
+    migrate.add_argument('-r', '--repo', dest='repo', required=True,
+                         choices=['dump', 'master', 'scratch'],
+                         help='Repo of the diaries, migrated within it')
+    migrate.add_argument('--from-version', dest='from_version',
+                         default='v3',
+                         help='Avro schema version of the source diaries')
+    migrate.add_argument('--to-version', dest='to_version',
+                         default='v{}'.format(
+                             config.AVRO_ROWS_SCHEMA_VERSION),
+                         help='Avro schema version written')
+    migrate.add_argument('-j', '--jobs', dest='jobs', type=int,
+                         default=config.S3_TRANSFER_JOBS,
+                         help='Number of objects migrated concurrently')
+    migrate.add_argument('--report', dest='report', default=None,
+                         help='Transfer report (JSON) path, defaults to '
+                         '{}'.format(config.TRANSFER_REPORT_DIR))
+    migrate.set_defaults(main=self._migrate)
@@ -1,4 +1,12 @@
+import os
+
 from fleet.configs import drive_config
+from fleet.s3_ops.s3_connector import get_connector
+from fleet.s3_ops.token_index import TokenIndex
+from fleet.s3_ops.exclude import apply_exclusions, get_excluded_sensors
+from fleet.s3_ops.transfer import fetch_prefix
+
+logger = drive_config.get_logger(__name__)
 
 
 class Drive(object):
@@ -6,11 +14,42 @@ class Drive(object):
   def __init__(self):
 
     self.uuid = None
+    self.s3_connector = None
 
   def _fetch(self, args):
 
     self._set_uuid(args.token)
-    pass
+
+    try:
+
+      repo_uris = drive_config.get_aws_repo_uris(args.avro_schema_version)
+      drive_data_repo = repo_uris[args.repo]
+
+      self.s3_connector = get_connector()
+
+      drive_prefix = TokenIndex(self.s3_connector,
+                                drive_data_repo).lookup('drive', self.uuid)
+
+      if drive_prefix is None:
+        logger.error('Drive with token : {}, not indexed '
+                     'at {}'.format(self.uuid, drive_data_repo))
+        return False
+
+      exclude = get_excluded_sensors(args)
+
+      if not fetch_prefix(self.s3_connector, drive_prefix, drive_data_repo,
+                          args.dest, jobs=args.jobs, desc='Fetching drive',
+                          exclude=exclude):
+        return False
+
+      _, drive_path = drive_prefix.split(drive_data_repo, 1)
+      apply_exclusions(os.path.join(args.dest, drive_path), exclude)
+
+      return True
+
+    except Exception as err:
+      logger.error('Error fetching drive {}, {}'.format(self.uuid, err))
+      return False
 
   def _info(self, args):
 
@@ -39,9 +78,20 @@ class Drive(object):
     fetch.add_argument('-r', '--repo', dest='repo', required=True,
                        choices=['dump', 'master'],
                        help='Repo to fetch datda from')
-    fetch.add_argument('-e', '--exclude', dest='exclude',
+    fetch.add_argument('-e', '--exclude', dest='exclude', nargs='+',
                        choices=drive_config.DRIVE_DATA_SENSORS,
                        help='Excluded sensor list from fetched drive')
+    fetch.add_argument('-m', '--metadata-only', dest='metadata_only',
+                       action='store_true', default=False,
+                       help='Fetch avro files only, skips videos')
+    fetch.add_argument('-a', '--avro-schema-version',
+                       dest='avro_schema_version',
+                       default=drive_config.get_avro_schema_version(),
+                       help='Avro schema version if not'
+                       'specified gets from submodule')
+    fetch.add_argument('-j', '--jobs', dest='jobs', type=int,
+                       default=drive_config.S3_TRANSFER_JOBS,
+                       help='Number of files downloaded concurrently')
     fetch.set_defaults(main=self._fetch)
 
     info.add_argument('duration', action='store_true',
@@ -0,0 +1,160 @@
+import os
+import re
+from pathlib import Path
+
+from fleet.configs import drive_config as config
+from fleet.utils import avro_io
+
+logger = config.get_logger(__name__)
+
+
+def excluded_members(exclude):
+
+  """Sequence members (relative path prefixes) skipped by key layout"""
+
+  exclude = exclude or []
+  return [member for sensor in exclude
+          for member in config.DRIVE_DATA_SENSOR_MEMBERS.get(sensor, [])]
+
+
+def is_excluded_key(s3_key, exclude):
+
+  """True if the key holds data of excluded sensors only (f.ex videos)"""
+
+  delimiter = config.AWS_S3_KEY_DELIMITER
+  return any(delimiter + member in s3_key
+             for member in excluded_members(exclude))
+
+
+def needs_row_filter(exclude):
+
+  filtered = list(config.DRIVE_DATA_SENSOR_MODALITIES)
+  filtered += list(config.DRIVE_DATA_SENSOR_FIELDS)
+  return any(sensor in filtered for sensor in exclude or [])
+
+
+def read_table(avro_path):
+
+  """Table, schema and layout of an avro file, see avro_io.read_table"""
+
+  return avro_io.read_table(avro_path)
+
+
+def write_table(avro_path, table, schema, layout=None):
+
+  """Rewrites an avro file, in place once complete"""
+
+  part_path = avro_path + config.S3_PARTIAL_SUFFIX
+
+  avro_io.write_table(part_path, table, schema, layout=layout)
+
+  os.replace(part_path, avro_path)
+
+
+def filter_sequence_sensors(sequence_uri, exclude):
+
+  """Drops excluded sensors from the sensordata.avro of a sequence
+
+    Rows of excluded modalities are removed (and their tokens removed from
+    data.avro sensor_tokens), excluded fields of shared modalities are
+    nulled, rows left without any of their modality fields are removed.
+    References to removed rows (f.ex matched_gnss_token) are nulled.
+
+    Returns:
+      Number of sensor rows removed
+  """
+
+  sensordata_avro = os.path.join(sequence_uri, 'sensordata.avro')
+  data_avro = os.path.join(sequence_uri, 'data.avro')
+
+  modalities = [config.DRIVE_DATA_SENSOR_MODALITIES[sensor]
+                for sensor in exclude
+                if sensor in config.DRIVE_DATA_SENSOR_MODALITIES]
+  fields = [field for sensor in exclude
+            for field in config.DRIVE_DATA_SENSOR_FIELDS.get(sensor, [])]
+
+  table, schema, layout = read_table(sensordata_avro)
+  table_name = list(table.keys())[0]
+
+  kept, dropped = [], set()
+
+  for row in table[table_name]:
+
+    modality = row['sensor_modality_type']
+
+    if modality in modalities:
+      dropped.add(row['sensor_token'])
+      continue
+
+    for field in fields:
+      if field in row:
+        row[field] = None
+
+    modality_fields = [k for k in row if k.startswith(modality + '_')]
+    emptied = all(row[k] is None for k in modality_fields)
+    if fields and modality_fields and emptied:
+      dropped.add(row['sensor_token'])
+      continue
+
+    kept.append(row)
+
+  for row in kept:
+    for field in config.DRIVE_DATA_SENSOR_REFERENCES:
+      if row.get(field) in dropped:
+        row[field] = None
+
+  table[table_name] = kept
+  write_table(sensordata_avro, table, schema, layout)
+
+  if dropped and os.path.isfile(data_avro):
+
+    data_table, data_schema, data_layout = read_table(data_avro)
+    data_name = list(data_table.keys())[0]
+
+    for row in data_table[data_name]:
+      row['sensor_tokens'] = [token for token in row['sensor_tokens']
+                              if token not in dropped]
+
+    write_table(data_avro, data_table, data_schema, data_layout)
+
+  return len(dropped)
+
+
+def apply_exclusions(fetch_path, exclude):
+
+  """Filters excluded sensors out of every sequence fetched under fetch_path
+
+    fetch_path is a diary, drive or sequence directory.
+  """
+
+  if not needs_row_filter(exclude):
+    return 0
+
+  fetch_path = Path(fetch_path)
+  sequence_uris = [fetch_path] if fetch_path.parent.name == 'sequences' \
+      else fetch_path.glob('**/sequences/*')
+  sequence_uris = [uri for uri in sequence_uris
+                   if re.match(config.DRIVE_SEQUENCE_URI_PATTERN, uri.name)]
+  sequence_uris = [uri for uri in sequence_uris
+                   if uri.joinpath('sensordata.avro').is_file()]
+
+  dropped = 0
+  for sequence_uri in sequence_uris:
+    dropped += filter_sequence_sensors(sequence_uri.as_posix(), exclude)
+
+  logger.info('Excluded {} sensor rows ({}) from {} sequences'.format(
+      dropped, ', '.join(exclude), len(sequence_uris)))
+
+  return dropped
+
+
+def get_excluded_sensors(args):
+
+  """Excluded sensors from fetch arguments, --metadata-only excludes image"""
+
+  exclude = list(args.exclude or [])
+
+  if getattr(args, 'metadata_only', False) and 'image' not in exclude:
+    exclude.append('image')
+
+  return exclude
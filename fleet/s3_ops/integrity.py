@@ -0,0 +1,188 @@
+import re
+import collections
+from pathlib import Path
+
+import numpy as np
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.bundle import open_sequence_member
+from fleet.utils.avro_io import read_rows
+
+logger = config.get_logger(__name__)
+
+# bytes of a uuid4 token, longer tokens widen the arrays
+TOKEN_WIDTH = 36
+
+
+def token_array(tokens):
+
+  """Fixed width bytes array of tokens, S36 but for longer tokens"""
+
+  chars = np.array([token.encode() for token in tokens], dtype=np.bytes_)
+  width = max(TOKEN_WIDTH, chars.dtype.itemsize if len(chars) else 0)
+
+  return chars.astype('S{}'.format(width))
+
+
+def dangling(refs, targets):
+
+  """Indices of the tokens of refs missing from targets, matched exactly"""
+
+  refs, targets = token_array(refs), token_array(targets)
+  # one width for both, shorter tokens are null padded
+  width = 'S{}'.format(max(refs.dtype.itemsize, targets.dtype.itemsize))
+  refs, targets = refs.astype(width), np.unique(targets.astype(width))
+
+  if not len(targets):
+    return np.arange(len(refs))
+
+  # sorted lookup, cheaper than np.isin for millions of tokens
+  idx = np.searchsorted(targets, refs)
+  idx[idx == len(targets)] = 0
+
+  return np.flatnonzero(targets[idx] != refs)
+
+
+def read_token_columns(pfile, fields):
+
+  """Token columns of an avro table, in either layout
+
+    Rows are decoded with a projected reader schema, other fields are
+    skipped without being materialised. Array fields (f.ex sensor_tokens)
+    are flattened, missing (null) tokens dropped.
+
+    Returns:
+      Dict field -> list of tokens
+  """
+
+  columns = {field: [] for field in fields}
+
+  for row in read_rows(pfile, fields):
+    for field in fields:
+      value = row.get(field)
+      if isinstance(value, list):
+        columns[field].extend(value)
+      elif value is not None:
+        columns[field].append(value)
+
+  return columns
+
+
+def directory_token(uri):
+
+  return re.search(config.DRIVE_DIARY_TOKEN_PATTERN, Path(uri).name).group()
+
+
+def describe(refs, missing, src, dst):
+
+  return '{} of {} {}.{} not in {}.{}, f.ex {}'.format(
+      len(missing), len(refs), src[0], src[1], dst[0], dst[1],
+      refs[missing[0]])
+
+
+def check_sequence_references(sequence_uri, references=None, opener=None):
+
+  """Checks the tokens referenced across the tables of a sequence
+
+    Args:
+      sequence_uri: Sequence directory, loose or bundled
+      references: List of ((table, field), (table, field)), tokens of the
+        first column must be in the second, defaults to
+        DRIVE_SEQUENCE_REFERENCES. The directory table holds the sequence
+        and drive tokens of the sequence path.
+      opener: Context manager (sequence_uri, member) -> file object,
+        defaults to bundle.open_sequence_member
+
+    Returns:
+      List of broken references, empty if all resolve
+  """
+
+  references = references if references is not None \
+      else config.DRIVE_SEQUENCE_REFERENCES
+  opener = opener if opener is not None else open_sequence_member
+  avro_names = {name: avro_name
+                for avro_name, name in config.DRIVE_SEQUENCE_AVROS}
+
+  table_fields = collections.defaultdict(set)
+  for src, dst in references:
+    table_fields[src[0]].add(src[1])
+    table_fields[dst[0]].add(dst[1])
+
+  sequence_uri = Path(sequence_uri)
+  columns = {'directory': {
+      'sequence_token': [directory_token(sequence_uri)],
+      'drive_token': [directory_token(sequence_uri.parents[1])]}}
+  table_fields.pop('directory', None)
+
+  for table, fields in table_fields.items():
+    with opener(sequence_uri, avro_names[table]) as pfile:
+      columns[table] = read_token_columns(pfile, fields)
+
+  problems = []
+
+  for src, dst in references:
+    refs = columns[src[0]][src[1]]
+    missing = dangling(refs, columns[dst[0]][dst[1]])
+    if len(missing):
+      problems.append(describe(refs, missing, src, dst))
+
+  return problems
+
+
+def _open_file(path):
+
+  return open(Path(path).as_posix(), 'rb')
+
+
+def check_drive_references(vehicle_uri, drive_uris, sequence_uris,
+                           opener=None):
+
+  """Checks the tokens of the diary and drive tables against the drive and
+    sequence directories on disk
+
+    Args:
+      vehicle_uri: Vehicle directory holding drive_diary.avro
+      drive_uris: Drive directories
+      sequence_uris: Dict drive directory -> sequence directories
+      opener: Path -> binary file object, defaults to open
+
+    Returns:
+      List of broken references, empty if all resolve
+  """
+
+  opener = opener if opener is not None else _open_file
+  problems = []
+
+  diary_avro = Path(vehicle_uri).joinpath('drive_diary.avro')
+  with opener(diary_avro) as pfile:
+    diary = read_token_columns(pfile, {'diary_token', 'drive_tokens'})
+
+  diary_token = [directory_token(Path(vehicle_uri).parent)]
+  drive_tokens = [directory_token(uri) for uri in drive_uris]
+
+  references = [(diary, 'diary_token', diary_token, 'diary'),
+                (diary, 'drive_tokens', drive_tokens, 'drives')]
+
+  for drive_uri in drive_uris:
+
+    drive_avro = Path(drive_uri).joinpath('drive.avro')
+    with opener(drive_avro) as pfile:
+      drive = read_token_columns(pfile, {'diary_token', 'drive_token',
+                                         'sequence_tokens'})
+
+    sequence_tokens = [directory_token(uri)
+                       for uri in sequence_uris.get(drive_uri, [])]
+
+    references += [(drive, 'diary_token', diary_token, 'diary'),
+                   (drive, 'drive_token', [directory_token(drive_uri)],
+                    'drive'),
+                   (drive, 'sequence_tokens', sequence_tokens, 'sequences')]
+
+  for columns, field, tokens, directory in references:
+    missing = dangling(columns[field], tokens)
+    if len(missing):
+      table = 'diary' if columns is diary else 'drive'
+      problems.append(describe(columns[field], missing, (table, field),
+                               ('directory', directory)))
+
+  return problems
@@ -0,0 +1,181 @@
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from fleet.configs import drive_config as config
+
+logger = config.get_logger(__name__)
+
+OBJECTS = 'objects'
+SUBDIRS = 'subdirs'
+
+_CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+  env TEXT, bucket TEXT, prefix TEXT, kind TEXT, refreshed REAL,
+  PRIMARY KEY (env, bucket, prefix, kind));
+CREATE TABLE IF NOT EXISTS entries (
+  env TEXT, bucket TEXT, prefix TEXT, kind TEXT,
+  key TEXT, size INTEGER, etag TEXT,
+  PRIMARY KEY (env, bucket, prefix, kind, key));
+'''
+
+
+class ListingCache(object):
+
+  """Persistent snapshot of S3 listings stored in SQLite
+
+    Snapshots are keyed by environment, bucket, prefix and kind (objects or
+    sub directories). Within S3_LISTING_CACHE_REFRESH seconds a snapshot is
+    served as is, up to S3_LISTING_CACHE_TTL seconds it is refreshed
+    incrementally by listing keys after the last cached key (StartAfter),
+    beyond that it is listed again in full. Incremental refreshes only pick
+    up keys sorting after the last cached key, objects written through
+    S3Connector are added to the matching snapshots directly.
+
+    Args:
+      cache_path: SQLite database path
+      ttl: Age in seconds after which a snapshot is listed again in full
+      refresh: Age in seconds after which a snapshot is refreshed
+        incrementally
+  """
+
+  def __init__(self, cache_path=None, ttl=None, refresh=None):
+
+    self.cache_path = Path(cache_path if cache_path is not None
+                           else config.S3_LISTING_CACHE_PATH)
+    self.ttl = ttl if ttl is not None else config.S3_LISTING_CACHE_TTL
+    self.refresh = refresh if refresh is not None \
+        else config.S3_LISTING_CACHE_REFRESH
+
+    self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(self.cache_path.as_posix(),
+                              check_same_thread=False)
+    self.db.executescript(_CACHE_SCHEMA)
+
+  def close(self):
+
+    with self.lock:
+      self.db.close()
+
+  def state(self, env, bucket, prefix, kind):
+
+    """Returns the snapshot prefix covering prefix and its refresh state
+
+      An objects snapshot of a parent prefix covers every prefix below it.
+
+      Returns:
+        Snapshot prefix, None if no snapshot covers prefix
+        One of 'fresh', 'stale' (incremental refresh) or 'expired'
+    """
+
+    query = 'SELECT prefix, refreshed FROM snapshots WHERE env=? AND ' \
+        'bucket=? AND kind=? AND substr(?, 1, length(prefix))=prefix'
+    if kind == SUBDIRS:
+      query += ' AND prefix=?'
+    query += ' ORDER BY length(prefix) DESC LIMIT 1'
+
+    params = (env, bucket, kind, prefix)
+    if kind == SUBDIRS:
+      params += (prefix,)
+
+    with self.lock:
+      row = self.db.execute(query, params).fetchone()
+
+    if row is None:
+      return None, 'expired'
+
+    age = time.time() - row[1]
+    if age > self.ttl:
+      return row[0], 'expired'
+
+    return row[0], 'stale' if age > self.refresh else 'fresh'
+
+  def entries(self, env, bucket, snapshot_prefix, prefix, kind):
+
+    query = 'SELECT key, size, etag FROM entries WHERE env=? AND bucket=? ' \
+        'AND prefix=? AND kind=? AND substr(key, 1, ?)=? ORDER BY key'
+
+    with self.lock:
+      rows = self.db.execute(query, (env, bucket, snapshot_prefix, kind,
+                                     len(prefix), prefix)).fetchall()
+
+    return [{'Key': key, 'Size': size, 'ETag': etag}
+            for key, size, etag in rows]
+
+  def last_key(self, env, bucket, prefix, kind):
+
+    query = 'SELECT max(key) FROM entries WHERE env=? AND bucket=? ' \
+        'AND prefix=? AND kind=?'
+
+    with self.lock:
+      row = self.db.execute(query, (env, bucket, prefix, kind)).fetchone()
+
+    return row[0]
+
+  def store(self, env, bucket, prefix, kind, entries, replace=True):
+
+    """Stores listed entries for a snapshot and marks it refreshed
+
+      Args:
+        entries: List of dicts with Key (and Size, ETag for objects)
+        replace: Drop the previous snapshot entries (full listing)
+    """
+
+    rows = [(env, bucket, prefix, kind, e['Key'], e.get('Size'),
+             e.get('ETag')) for e in entries]
+
+    with self.lock, self.db:
+      if replace:
+        self.db.execute('DELETE FROM entries WHERE env=? AND bucket=? AND '
+                        'prefix=? AND kind=?', (env, bucket, prefix, kind))
+      self.db.executemany('INSERT OR REPLACE INTO entries '
+                          'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+      self.db.execute('INSERT OR REPLACE INTO snapshots VALUES '
+                      '(?, ?, ?, ?, ?)', (env, bucket, prefix, kind,
+                                          time.time()))
+
+  def add(self, env, bucket, key, size, etag):
+
+    """Writes an uploaded object through to every snapshot covering it"""
+
+    delimiter = config.AWS_S3_KEY_DELIMITER
+
+    with self.lock, self.db:
+
+      snapshots = self.db.execute(
+          'SELECT prefix, kind FROM snapshots WHERE env=? AND bucket=? AND '
+          'substr(?, 1, length(prefix))=prefix', (env, bucket, key))
+
+      for prefix, kind in snapshots.fetchall():
+
+        if kind == OBJECTS:
+          entry = (env, bucket, prefix, kind, key, size, etag)
+        else:
+          suffix = key[len(prefix):]
+          if delimiter not in suffix:
+            continue
+          subdir = prefix + suffix.split(delimiter)[0] + delimiter
+          entry = (env, bucket, prefix, kind, subdir, None, None)
+
+        self.db.execute('INSERT OR REPLACE INTO entries '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)', entry)
+
+  def remove(self, env, bucket, keys, kind=OBJECTS):
+
+    with self.lock, self.db:
+      self.db.executemany('DELETE FROM entries WHERE env=? AND bucket=? '
+                          'AND kind=? AND key=?',
+                          [(env, bucket, kind, key) for key in keys])
+
+  def invalidate(self, env, bucket, prefix):
+
+    """Drops every snapshot at or below prefix"""
+
+    with self.lock, self.db:
+      for table in ['snapshots', 'entries']:
+        self.db.execute('DELETE FROM {} WHERE env=? AND bucket=? AND '
+                        'substr(prefix, 1, ?)=?'.format(table),
+                        (env, bucket, len(prefix), prefix))
@@ -0,0 +1,131 @@
+import os
+import json
+import threading
+from pathlib import Path
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.transfer import compute_etag, file_checksums
+
+logger = config.get_logger(__name__)
+
+
+def get_manifest_path(bucket_name, drive_data_repo, drive_diary_uri):
+
+  manifest_dir = config.DATA_CATALOGUE_CACHE_DIR.joinpath('push', bucket_name,
+                                                          drive_data_repo)
+  return manifest_dir.joinpath(drive_diary_uri + '.json')
+
+
+class PushManifest(object):
+
+  """Record of the objects pushed for a single drive diary
+
+    Entries are keyed by S3 key and hold the local size, mtime, content MD5
+    and the ETag of the pushed object. Local checksums are reused as long as
+    size and mtime are unchanged, so unchanged files are never re-hashed.
+
+    Args:
+      manifest_path: JSON file the manifest is stored in
+  """
+
+  def __init__(self, manifest_path):
+
+    self.manifest_path = Path(manifest_path)
+    self.entries = {}
+    self.checksums = {}
+    self.skipped = 0
+    self.lock = threading.Lock()
+
+  def load(self):
+
+    if not self.manifest_path.is_file():
+      return self
+
+    try:
+      with self.manifest_path.open() as pfile:
+        self.entries = json.load(pfile)
+      logger.info('Read push manifest {}, {} objects'.format(
+          self.manifest_path, len(self.entries)))
+    except Exception as err:
+      logger.warning('Ignoring push manifest '
+                     '{}, {}'.format(self.manifest_path, err))
+      self.entries = {}
+
+    return self
+
+  def save(self):
+
+    self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = self.manifest_path.with_suffix('.tmp')
+
+    with self.lock:
+      with tmp_path.open('w') as pfile:
+        json.dump(self.entries, pfile, indent=2, sort_keys=True)
+
+    os.replace(tmp_path.as_posix(), self.manifest_path.as_posix())
+
+  def _checksum(self, file_path, s3_key):
+
+    stat = os.stat(str(file_path))
+
+    with self.lock:
+      entry = self.checksums.get(s3_key, self.entries.get(s3_key))
+
+    unchanged = entry is not None and entry['size'] == stat.st_size
+    if unchanged and entry['mtime_ns'] == stat.st_mtime_ns:
+      return entry
+
+    md5, etag = file_checksums(str(file_path))
+    entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+             'md5': md5, 'etag': etag}
+
+    with self.lock:
+      self.checksums[s3_key] = entry
+
+    return entry
+
+  def is_pushed(self, file_path, s3_key, remote_objects):
+
+    """True if s3_key exists remotely with the local size and ETag
+
+      Args:
+        file_path: Local file to be pushed
+        s3_key: Destination S3 key
+        remote_objects: Dict S3 key -> listing info (Size, ETag)
+    """
+
+    remote = remote_objects.get(s3_key)
+    if remote is None:
+      return False
+
+    entry = self._checksum(file_path, s3_key)
+    pushed = remote['Size'] == entry['size'] and \
+        remote['ETag'] == entry['etag']
+
+    # pushed with another multipart part size
+    multipart = remote['ETag'] is not None and '-' in remote['ETag']
+    if not pushed and multipart and remote['Size'] == entry['size']:
+      pushed = compute_etag(str(file_path), remote['ETag']) == remote['ETag']
+      if pushed:
+        entry = dict(entry, etag=remote['ETag'])
+
+    if pushed:
+      with self.lock:
+        self.entries[s3_key] = entry
+        self.skipped += 1
+
+    return pushed
+
+  def checksum(self, file_path, s3_key):
+
+    """Content MD5 and ETag of file_path, cached while it is unchanged"""
+
+    entry = self._checksum(file_path, s3_key)
+    return entry['md5'], entry['etag']
+
+  def record(self, file_path, s3_key):
+
+    entry = self._checksum(file_path, s3_key)
+
+    with self.lock:
+      self.entries[s3_key] = entry
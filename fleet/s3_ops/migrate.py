@@ -0,0 +1,82 @@
+import io
+import shutil
+import tempfile
+from pathlib import Path
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.bundle import pack_sequence, unpack_sequence
+from fleet.utils.avro_io import read_table, write_table
+
+logger = config.get_logger(__name__)
+
+
+def convert_avro(data, layout):
+
+  """Avro table bytes rewritten in layout, None if already in layout"""
+
+  table, schema, src_layout = read_table(io.BytesIO(data))
+
+  if src_layout == layout:
+    return None
+
+  buf = io.BytesIO()
+  # rows were decoded with the header schema, no need to validate again
+  write_table(buf, table, schema, layout=layout, validate=False)
+
+  return buf.getvalue()
+
+
+def migrate_bundle(s3_connector, src_key, dst_key, layout):
+
+  """Rewrites the avro members of a sequence bundle, staged on disk"""
+
+  tmp_dir = Path(tempfile.mkdtemp(prefix='data-catalogue-migrate-'))
+
+  try:
+
+    bundle_path = tmp_dir.joinpath(config.DRIVE_SEQUENCE_BUNDLE)
+    if not s3_connector.get_file(src_key, bundle_path.as_posix()):
+      return False
+
+    unpack_sequence(tmp_dir)
+
+    for avro_path in tmp_dir.rglob('*.avro'):
+      data = convert_avro(avro_path.read_bytes(), layout)
+      if data is not None:
+        avro_path.write_bytes(data)
+
+    return s3_connector.put_checked(pack_sequence(tmp_dir), dst_key)
+
+  finally:
+    shutil.rmtree(tmp_dir.as_posix(), ignore_errors=True)
+
+
+def migrate_object(s3_connector, src_key, dst_key, size, layout):
+
+  """Copies an object of a diary to dst_key, avro tables (loose or in
+    sequence bundles) rewritten in layout, other objects copied server side
+
+    Args:
+      s3_connector: Connected S3Connector
+      src_key: Object key in the source repo
+      dst_key: Object key in the destination repo
+      size: Bytes of the object
+      layout: One of avro_io.AVRO_LAYOUTS
+
+    Returns:
+      True once the object is written to dst_key
+  """
+
+  name = Path(src_key).name
+
+  if name == config.DRIVE_SEQUENCE_BUNDLE:
+    return migrate_bundle(s3_connector, src_key, dst_key, layout)
+
+  if not name.endswith('.avro'):
+    return s3_connector.copy_file(src_key, dst_key, size=size)
+
+  data = convert_avro(s3_connector.get_bytes(src_key), layout)
+  if data is None:
+    return s3_connector.copy_file(src_key, dst_key, size=size)
+
+  return s3_connector.put_bytes(data, dst_key)
@@ -0,0 +1,183 @@
+import io
+import re
+import contextlib
+from pathlib import Path
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.bundle import fetch_bundle_index
+
+logger = config.get_logger(__name__)
+
+
+class S3ObjectReader(io.RawIOBase):
+
+  """Seekable read only view of an S3 object (or a byte range of it)
+
+    Reads are served with range GETs, nothing is staged on disk. Wrap in
+    io.BufferedReader (see open_remote) so small reads share a GET.
+
+    Args:
+      s3_connector: Connected S3Connector
+      s3_key: Object key
+      size: Bytes of the view
+      offset: Start of the view in the object, f.ex a bundle member
+  """
+
+  def __init__(self, s3_connector, s3_key, size, offset=0):
+
+    super().__init__()
+
+    self.s3_connector = s3_connector
+    self.s3_key = s3_key
+    self.name = s3_key
+    self.size = size
+    self.offset = offset
+    self.position = 0
+
+  def readable(self):
+
+    return True
+
+  def seekable(self):
+
+    return True
+
+  def tell(self):
+
+    return self.position
+
+  def seek(self, position, whence=io.SEEK_SET):
+
+    if whence == io.SEEK_CUR:
+      position += self.position
+    elif whence == io.SEEK_END:
+      position += self.size
+
+    assert position >= 0, 'Negative seek position {} in {}'.format(
+        position, self.s3_key)
+    self.position = position
+
+    return self.position
+
+  def readinto(self, buffer):
+
+    end = min(self.position + len(buffer), self.size)
+    if end <= self.position:
+      return 0
+
+    data = self.s3_connector.get_range(self.s3_key,
+                                       self.offset + self.position,
+                                       self.offset + end - 1)
+    buffer[:len(data)] = data
+    self.position += len(data)
+
+    return len(data)
+
+
+def open_remote(s3_connector, s3_key, size, offset=0):
+
+  """Buffered, seekable file object streaming an S3 object"""
+
+  return io.BufferedReader(S3ObjectReader(s3_connector, s3_key, size,
+                                          offset=offset),
+                           buffer_size=config.S3_STREAM_CHUNKSIZE)
+
+
+class RemoteDiary(object):
+
+  """Layout of a diary on S3, from one listing of its prefix
+
+    Keys are handled as paths, so directory tokens and the sequence to
+    drive relations resolve as for a diary on disk.
+
+    Args:
+      s3_connector: Connected S3Connector
+      diary_key: S3 prefix of the diary
+  """
+
+  def __init__(self, s3_connector, diary_key):
+
+    self.s3_connector = s3_connector
+    self.diary_key = Path(diary_key)
+    # listed in full, ranged reads trust the listed sizes
+    self.sizes = {obj['Key']: obj['Size'] for obj in
+                  s3_connector.list_object_info(
+                      self.diary_key.as_posix() + config.AWS_S3_KEY_DELIMITER,
+                      refresh=True)}
+    self.bundle_indices = {}
+
+    keys = [Path(key) for key in self.sizes]
+
+    vehicle_uris = {key.parent for key in keys
+                    if key.name == 'drive_diary.avro'}
+    assert len(vehicle_uris) == 1, 'Expecting one vehicle id at {}, ' \
+        'found {}'.format(diary_key, len(vehicle_uris))
+    self.vehicle_uri = vehicle_uris.pop()
+
+    self.drive_uris = sorted(key.parent for key in keys
+                             if key.name == 'drive.avro')
+
+    self.drive_sequences = {drive_uri: set() for drive_uri in self.drive_uris}
+    for key in keys:
+      for sequence_uri in key.parents:
+        if sequence_uri.parent.name != 'sequences':
+          continue
+        drive_uri = sequence_uri.parents[1]
+        is_sequence = re.match(config.DRIVE_SEQUENCE_URI_PATTERN,
+                               sequence_uri.name)
+        if is_sequence and drive_uri in self.drive_sequences:
+          self.drive_sequences[drive_uri].add(sequence_uri)
+
+    self.drive_sequences = {drive_uri: sorted(sequence_uris)
+                            for drive_uri, sequence_uris
+                            in self.drive_sequences.items()}
+
+  @property
+  def sequence_uris(self):
+
+    return [sequence_uri for drive_uri in self.drive_uris
+            for sequence_uri in self.drive_sequences[drive_uri]]
+
+  def open(self, uri):
+
+    """Streams the object at uri, see open_remote"""
+
+    key = Path(uri).as_posix()
+    if key not in self.sizes:
+      raise FileNotFoundError('{} not on S3'.format(key))
+
+    return open_remote(self.s3_connector, key, self.sizes[key])
+
+  @contextlib.contextmanager
+  def open_sequence_member(self, sequence_uri, member):
+
+    """Streams a sequence file in either layout, see
+      bundle.open_sequence_member
+    """
+
+    sequence_uri = Path(sequence_uri)
+    member_key = sequence_uri.joinpath(member).as_posix()
+
+    if member_key in self.sizes:
+      with self.open(member_key) as pfile:
+        yield pfile
+      return
+
+    bundle_key = sequence_uri.joinpath(config.DRIVE_SEQUENCE_BUNDLE).as_posix()
+    if bundle_key not in self.sizes:
+      raise FileNotFoundError('{} not on S3'.format(member_key))
+
+    # one index GET per bundle, shared by its members
+    index = self.bundle_indices.get(bundle_key)
+    if index is None:
+      index = fetch_bundle_index(self.s3_connector, bundle_key)
+      self.bundle_indices[bundle_key] = index
+
+    if member not in index:
+      raise FileNotFoundError('{} not in bundle {}'.format(member,
+                                                           bundle_key))
+
+    offset, size = index[member]
+    with open_remote(self.s3_connector, bundle_key, size,
+                     offset=offset) as pfile:
+      yield pfile
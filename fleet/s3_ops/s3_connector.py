@@ -1,5 +1,19 @@
+import os
+import time
+import threading
+import contextlib
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
 from fleet.configs import drive_config as config
+from fleet.s3_ops.transfer import TransferPool, compute_etag, \
+    file_checksums, file_sizes, folder_transfers
+from fleet.s3_ops.listing_cache import ListingCache, OBJECTS, SUBDIRS
+from fleet.s3_ops.throttle import TransferController
+from fleet.s3_ops.telemetry import TransferTelemetry
 
 logger = config.get_logger(__name__)
 
@@ -18,13 +32,91 @@ class S3ConnectorError(Exception):
   pass
 
 
+def is_precondition_failed(err):
+
+  return err.response['Error']['Code'] in ('PreconditionFailed', '412')
+
+
+def is_invalid_range(err):
+
+  # resumed past the end of an object changed since listed
+  return err.response['Error']['Code'] in ('InvalidRange', '416')
+
+
+# connected S3Connector per environment, see get_connector
+_connectors = {}
+_connectors_lock = threading.Lock()
+
+
+def get_client_config():
+
+  """botocore client config sized for concurrent transfers"""
+
+  # retries are left to the connector's TransferController
+  kwargs = {'max_pool_connections': config.S3_MAX_POOL_CONNECTIONS,
+            'retries': {'max_attempts': 0},
+            'tcp_keepalive': config.S3_TCP_KEEPALIVE}
+
+  try:
+    return Config(**kwargs)
+  except TypeError:
+    # botocore < 1.19, pooled connections are still reused (HTTP keep-alive)
+    kwargs.pop('tcp_keepalive')
+    return Config(**kwargs)
+
+
+def get_connector(env_name=None):
+
+  """Process wide connected S3Connector for env_name
+
+    The session, credentials and connection pool are set up once per
+    environment and shared by every operation (and thread) of the process.
+
+    Args:
+      env_name: Environment (AWS_PROFILE_NAMES), None reads the environment
+        set by data-catalogue env set
+  """
+
+  with _connectors_lock:
+
+    if env_name is None:
+      env_name, _ = S3Connector().get_credentials()
+
+    if env_name not in _connectors:
+      s3_connector = S3Connector()
+      s3_connector.connect(env_name=env_name)
+      _connectors[env_name] = s3_connector
+
+    return _connectors[env_name]
+
+
+def close_connectors():
+
+  """Closes and forgets every connector created by get_connector"""
+
+  with _connectors_lock:
+    for s3_connector in _connectors.values():
+      s3_connector.close()
+    _connectors.clear()
+
+
 class S3Connector(object):
 
-  def __init__(self):
+  def __init__(self, listing_cache=None):
 
     self.session = None
     self.s3_resource = None
+    self.s3_client = None
     self.s3_bucket = None
+    self.env_name = None
+    self.listing_cache = listing_cache
+    self.controller = TransferController()
+    self.telemetry = None
+    self.transfer_config = TransferConfig(
+        multipart_threshold=config.S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=config.S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=config.S3_MULTIPART_CONCURRENCY,
+        use_threads=True)
 
   def connect(self, env_name=None):
 
@@ -35,17 +127,52 @@ class S3Connector(object):
       else:
         profile_name = config.AWS_PROFILE_NAMES[env_name]
 
+      self.env_name = env_name
       self.bucket_name = config.AWS_DRIVE_DATA_BUCKETS[env_name]
 
       self.session = boto3.Session(profile_name=profile_name)
-      self.s3_resource = self.session.resource('s3')
+      self.s3_resource = self.session.resource('s3',
+                                               config=get_client_config())
+      # clients (unlike resources) are thread safe, shared by all transfers
+      self.s3_client = self.s3_resource.meta.client
       self.s3_bucket = self.s3_resource.Bucket(self.bucket_name)
 
+      if self.listing_cache is None:
+        self.listing_cache = ListingCache()
+
     except Exception as err:
 
       logger.error('Error setting up S3 connector, {}'.format(err))
       raise S3ConnectorError('unable to connect to S3. Environment set up? (data-catalogue env set)')
 
+  def _call(self, fn, *args, **kwargs):
+
+    """Runs an S3 call under the adaptive limit, retrying throttling"""
+
+    return self.controller.call(fn, *args, **kwargs)
+
+  def record(self, op, s3_key, nbytes, start, ok=True):
+
+    if self.telemetry is not None:
+      self.telemetry.record(op, s3_key, nbytes, start, ok)
+
+  @contextlib.contextmanager
+  def track(self, operation):
+
+    """Records the objects transferred within the block in a telemetry
+
+      Yields:
+        TransferTelemetry of the block
+    """
+
+    telemetry = TransferTelemetry(operation, controller=self.controller)
+    previous, self.telemetry = self.telemetry, telemetry
+
+    try:
+      yield telemetry
+    finally:
+      self.telemetry = previous
+
   def get_credentials(self):
 
     with open(config.AWS_CREDENTIALS_FILE) as pfile:
@@ -58,7 +185,9 @@ class S3Connector(object):
 
     try:
 
-      pass
+      if self.listing_cache is not None:
+        self.listing_cache.close()
+        self.listing_cache = None
 
     except Exception as err:
 
@@ -68,18 +197,88 @@ class S3Connector(object):
 
     return self.s3_bucket is not None
 
-  def put_folder(self, source_dir, dest_dir):
+  def put_folder(self, source_dir, dest_dir, formats=None, jobs=None,
+                 put_fn=None, desc=None):
+
+    """Uploads every file below source_dir to the dest_dir prefix
+
+      Args:
+        source_dir: Local directory, walked lazily
+        dest_dir: Destination key prefix
+        formats: Optional list of file extensions to upload
+        jobs: Number of files uploaded concurrently
+        put_fn: See put_files
+        desc: Progress bar description
+
+      Returns:
+        True if every file was uploaded
+    """
+
+    desc = desc if desc is not None else 'Pushing {}'.format(source_dir)
+
+    flags, _ = self.put_files(folder_transfers(source_dir, dest_dir,
+                                               formats),
+                              jobs=jobs, put_fn=put_fn, desc=desc)
+
+    return all(flags)
+
+  def put_files(self, transfers, jobs=None, put_fn=None, desc='Pushing'):
+
+    """Uploads (file_path, s3_key) transfers on a bounded thread pool
 
-    pass
-    # walk throught the source folder and put each file or object on S3
+      All workers share this connector's client, which is thread safe.
+      Large files are split into multipart uploads by transfer_config.
 
-  def put_file(self, file_path, s3_key):
+      Args:
+        transfers: Iterable of (file_path, s3_key)
+        jobs: Number of files uploaded concurrently
+        put_fn: Callable(file_path, s3_key) replacing put_checked, f.ex to
+          skip unchanged files
+        desc: Progress bar description
+
+      Returns:
+        List of upload flags ordered as transfers
+        List of (transfer, error) for failed uploads
+    """
+
+    put_fn = self.put_checked if put_fn is None else put_fn
+
+    pool = TransferPool(jobs=jobs, desc=desc)
+    flags, failures = pool.run(put_fn, transfers,
+                               sizes=lambda t: file_sizes([t[0]])[0])
+    pool.summarize(failures, len(flags))
+    self.controller.summarize()
+
+    return flags, failures
+
+  def put_checked(self, file_path, s3_key):
+
+    md5, etag = file_checksums(str(file_path))
+    return self.put_file(str(file_path), s3_key, md5=md5, etag=etag)
+
+  def put_file(self, file_path, s3_key, md5=None, etag=None):
+
+    """Uploads file_path to s3_key
+
+      Args:
+        md5: Optional content MD5, stored as object metadata
+        etag: Optional expected ETag, recorded in the listing snapshot
+    """
+
+    start = time.perf_counter()
 
     try:
 
-      self.s3_resource.meta.client.upload_file(file_path,
-                                               self.bucket_name,
-                                               s3_key)
+      extra_args = {'Metadata': {'md5': md5}} if md5 is not None else None
+
+      self._call(self.s3_client.upload_file, file_path, self.bucket_name,
+                 s3_key, ExtraArgs=extra_args, Config=self.transfer_config)
+
+      # without a known ETag readers fall back to a HEAD when needed
+      size = os.path.getsize(file_path)
+      self.listing_cache.add(self.env_name, self.bucket_name, s3_key, size,
+                             etag)
+      self.record('put', s3_key, size, start)
 
       return True
 
@@ -87,67 +286,465 @@ class S3Connector(object):
 
       logger.error('Error putting file on S3'
                    ': {}, {} , {}'.format(file_path, s3_key, err))
+      self.record('put', s3_key, 0, start, ok=False)
       return False
 
+  def put_bytes(self, data, s3_key):
+
+    start = time.perf_counter()
+
+    try:
+
+      self._call(self.s3_client.put_object, Bucket=self.bucket_name,
+                 Key=s3_key, Body=data)
+      self.listing_cache.add(self.env_name, self.bucket_name, s3_key,
+                             len(data), None)
+      self.record('put', s3_key, len(data), start)
+      return True
+
+    except Exception as err:
+
+      logger.error('Error putting object on S3 : {}, {}'.format(s3_key, err))
+      self.record('put', s3_key, 0, start, ok=False)
+      return False
+
+  def get_bytes(self, s3_key):
+
+    """Reads a (small) object into memory, None if it does not exist"""
+
+    start = time.perf_counter()
+
+    try:
+
+      data = self._call(self._read_object, Bucket=self.bucket_name,
+                        Key=s3_key)
+      self.record('get', s3_key, len(data), start)
+      return data
+
+    except ClientError as err:
+
+      if err.response['Error']['Code'] in ('NoSuchKey', '404'):
+        return None
+      self.record('get', s3_key, 0, start, ok=False)
+      raise
+
+  def get_range(self, s3_key, start, end):
+
+    """Reads the inclusive byte range [start, end] of an object"""
+
+    began = time.perf_counter()
+
+    data = self._call(self._read_object, Bucket=self.bucket_name, Key=s3_key,
+                      Range='bytes={}-{}'.format(start, end))
+    self.record('get_range', s3_key, len(data), began)
+
+    return data
+
+  def _read_object(self, **kwargs):
+
+    # the body is read within the retried call, reads fail mid stream too
+    return self.s3_client.get_object(**kwargs)['Body'].read()
+
   def delete_file(self, s3_key):
 
+    start = time.perf_counter()
+
     try:
 
-      obj = self.s3_resource.Object(self.bucket_name, s3_key)
-      obj.delete()
+      self._call(self.s3_client.delete_object, Bucket=self.bucket_name,
+                 Key=s3_key)
+      self.listing_cache.remove(self.env_name, self.bucket_name, [s3_key])
+      self.record('delete', s3_key, 0, start)
       return True
 
     except Exception as err:
 
       logger.error('Error deleting file on S3 : {}, {}'.format(s3_key, err))
+      self.record('delete', s3_key, 0, start, ok=False)
+      return False
+
+  def delete_files(self, s3_keys, jobs=None):
+
+    """Deletes s3_keys with batched DeleteObjects requests
+
+      Returns:
+        True if every key was deleted
+    """
+
+    batch_size = config.S3_DELETE_BATCH_SIZE
+    batches = [(s3_keys[idx: idx + batch_size], )
+               for idx in range(0, len(s3_keys), batch_size)]
+
+    pool = TransferPool(jobs=jobs, desc='Deleting')
+    flags, failures = pool.run(self._delete_batch, batches,
+                               sizes=[len(b[0]) for b in batches])
+    pool.summarize(failures, len(batches))
+    self.controller.summarize()
+
+    return all(flags)
+
+  def list_prefixes(self, prefixes, jobs=None):
+
+    """Lists the objects under each prefix concurrently, bypassing the cache
+
+      Returns:
+        Dict prefix -> list of objects (Key, Size, ETag, LastModified)
+    """
+
+    objects = {}
+
+    def list_prefix(prefix):
+      objects[prefix] = list(self._list(prefix))
+      return True
+
+    pool = TransferPool(jobs=jobs, desc='Listing')
+    _, failures = pool.run(list_prefix, [(p, ) for p in prefixes])
+    pool.summarize(failures, len(prefixes))
+
+    if failures:
+      raise S3ConnectorError('Failed to list {} prefixes'.format(
+          len(failures)))
+
+    return objects
+
+  def delete_prefixes(self, prefixes, jobs=None, objects=None):
+
+    """Deletes every object under prefixes
+
+      Prefixes are listed concurrently, their keys deleted in concurrent
+      DeleteObjects batches and their listing snapshots dropped.
+
+      Args:
+        prefixes: Key prefixes, ending with the key delimiter
+        jobs: Number of listings / batches in flight
+        objects: Optional listing of prefixes from list_prefixes
+
+      Returns:
+        True if every object was deleted
+        List of the keys deleted
+    """
+
+    objects = self.list_prefixes(prefixes, jobs=jobs) \
+        if objects is None else objects
+    s3_keys = [obj['Key'] for prefix in prefixes for obj in objects[prefix]]
+
+    flag = self.delete_files(s3_keys, jobs=jobs)
+
+    for prefix in prefixes:
+      self.listing_cache.invalidate(self.env_name, self.bucket_name, prefix)
+    self.listing_cache.remove(self.env_name, self.bucket_name, prefixes,
+                              kind=SUBDIRS)
+
+    return flag, s3_keys
+
+  def _delete_batch(self, s3_keys):
+
+    start = time.perf_counter()
+
+    resp = self._call(
+        self.s3_client.delete_objects, Bucket=self.bucket_name,
+        Delete={'Objects': [{'Key': k} for k in s3_keys], 'Quiet': True})
+
+    errors = resp.get('Errors') or []
+    for err in errors:
+      logger.error('Error deleting file on S3 : {}, {}'.format(
+          err['Key'], err.get('Message')))
+
+    failed = set(err['Key'] for err in errors)
+    for s3_key in s3_keys:
+      self.record('delete', s3_key, 0, start, ok=s3_key not in failed)
+
+    self.listing_cache.remove(self.env_name, self.bucket_name,
+                              [k for k in s3_keys if k not in failed])
+
+    return not errors
+
+  def copy_config(self, src_key, etag):
+
+    """Transfer config copying src_key in the parts it was uploaded in
+
+      Multipart ETags (suffixed -<parts>) only tell the number of parts, the
+      part size is read from the size of the first part. Copies then keep
+      the ETag of the source, f.ex of legacy uploads in 8 MB parts.
+    """
+
+    if '-' not in etag:
+      part_size = None
+    else:
+      part_size = self.head(src_key, PartNumber=1)['ContentLength']
+
+    if part_size is None:
+      return TransferConfig(
+          multipart_threshold=config.S3_MAX_SINGLE_PART_SIZE + 1,
+          use_threads=True)
+
+    return TransferConfig(multipart_threshold=part_size,
+                          multipart_chunksize=part_size,
+                          max_concurrency=config.S3_MULTIPART_CONCURRENCY,
+                          use_threads=True)
+
+  def copy_file(self, src_key, dst_key, size=None, etag=None):
+
+    """Copies src_key to dst_key server side
+
+      Objects above the multipart threshold are copied in parts (part copy)
+      with transfer_config, copies of put_file uploads keep their ETag. With
+      the source etag, objects are copied in their own parts instead.
+    """
+
+    start = time.perf_counter()
+
+    try:
+
+      transfer_config = self.transfer_config if etag is None \
+          else self.copy_config(src_key, etag)
+
+      self._call(self.s3_client.copy,
+                 {'Bucket': self.bucket_name, 'Key': src_key},
+                 self.bucket_name, dst_key, Config=transfer_config)
+      self.listing_cache.add(self.env_name, self.bucket_name, dst_key,
+                             size, None)
+      self.record('copy', dst_key, size or 0, start)
+      return True
+
+    except Exception as err:
+
+      logger.error('Error copying file on S3'
+                   ': {}, {} , {}'.format(src_key, dst_key, err))
+      self.record('copy', dst_key, 0, start, ok=False)
+      return False
+
+  def copy_files(self, transfers, jobs=None, desc='Copying'):
+
+    """Copies (src_key, dst_key, size[, etag]) transfers on a bounded thread
+      pool
+
+      Returns:
+        List of copy flags ordered as transfers
+        List of (transfer, error) for failed copies
+    """
+
+    pool = TransferPool(jobs=jobs, desc=desc)
+    flags, failures = pool.run(self.copy_file, transfers,
+                               sizes=[t[2] for t in transfers])
+    pool.summarize(failures, len(transfers))
+    self.controller.summarize()
+
+    return flags, failures
+
+  def head(self, s3_key, **kwargs):
+
+    return self._call(self.s3_client.head_object, Bucket=self.bucket_name,
+                      Key=s3_key, **kwargs)
+
+  def get_file(self, s3_key, file_path, size=None, etag=None):
+
+    """Downloads s3_key to file_path through a temporary file
+
+      Files already on disk with the same size and ETag are skipped, a
+      partially written temporary file is resumed with a ranged GET. The
+      temporary file is renamed into place once complete.
+    """
+
+    start = time.perf_counter()
+
+    try:
+
+      if size is None or etag is None:
+        head = self.head(s3_key)
+        size, etag = head['ContentLength'], head['ETag'].strip('"')
+
+      on_disk = os.path.isfile(file_path) and \
+          os.path.getsize(file_path) == size
+      if on_disk and compute_etag(file_path, etag) == etag:
+        self.record('get_skipped', s3_key, 0, start)
+        return True
+
+      part_path = file_path + config.S3_PARTIAL_SUFFIX
+      resumed = os.path.isfile(part_path)
+
+      try:
+        # retried downloads resume from the bytes written so far
+        self._call(self._download, s3_key, part_path, size, etag)
+        changed = os.path.getsize(part_path) != size
+      except ClientError as err:
+        if not is_precondition_failed(err) and not is_invalid_range(err):
+          raise
+        changed = True
+
+      # changed since listed, caught by the If-Match (412) or, where If-Match
+      # is ignored (f.ex moto), by the size of the file, or a partial file
+      # left by a download of another version
+      if not changed and resumed:
+        changed = compute_etag(part_path, etag) != etag
+
+      if changed:
+        # start over with its current version
+        head = self.head(s3_key)
+        size, etag = head['ContentLength'], head['ETag'].strip('"')
+        if os.path.isfile(part_path):
+          os.remove(part_path)
+        self._call(self._download, s3_key, part_path, size, etag)
+
+      assert os.path.getsize(part_path) == size, \
+          'Expected {} bytes, found {}'.format(size,
+                                               os.path.getsize(part_path))
+
+      os.replace(part_path, file_path)
+      self.record('get', s3_key, size, start)
+
+      return True
+
+    except Exception as err:
+
+      logger.error('Error getting file from S3'
+                   ': {}, {} , {}'.format(s3_key, file_path, err))
+      self.record('get', s3_key, 0, start, ok=False)
       return False
 
-  def list_objects(self, s3_key):
+  def get_file_range(self, s3_key, file_path, offset, size, etag=None):
 
-    # TODO : This should move to get_paginator
+    """Downloads bytes [offset, offset + size) of s3_key to file_path, f.ex
+      a bundle member, streamed through a temporary file as get_file
 
-    obj_list = []
-    ContToken = None
+      Retried reads resume from the bytes written so far. Partial files of
+      earlier runs are dropped, a range of another version of the object
+      can not be told apart.
+    """
+
+    start = time.perf_counter()
 
     try:
-      s3_list_objects = self.s3_resource.meta.client.list_objects_v2
-      kwargs = {'Bucket': self.bucket_name,
-                'Prefix': s3_key}
 
-      while True:
+      if etag is None:
+        etag = self.head(s3_key)['ETag'].strip('"')
+
+      part_path = file_path + config.S3_PARTIAL_SUFFIX
+      if os.path.isfile(part_path):
+        os.remove(part_path)
 
-        resp = s3_list_objects(**kwargs)
+      if size > 0:
+        self._call(self._download, s3_key, part_path, size, etag,
+                   offset=offset, ranged=True)
+      else:
+        open(part_path, 'wb').close()
 
-        new_objects = [obj['Key'] for obj in resp['Contents']]
-        obj_list.extend(new_objects)
+      assert os.path.getsize(part_path) == size, \
+          'Expected {} bytes, found {}'.format(size,
+                                               os.path.getsize(part_path))
 
-        try:
-            kwargs['ContinuationToken'] = resp['NextContinuationToken']
-        except KeyError:
-            break
+      os.replace(part_path, file_path)
+      self.record('get_range', s3_key, size, start)
 
-      return obj_list
+      return True
 
     except Exception as err:
 
-      logger.error('Error fetching file on S3 : {}, {}'.format(s3_key, err))
-      return []
+      logger.error('Error getting byte range {}+{} from S3 : {}, {}, '
+                   '{}'.format(offset, size, s3_key, file_path, err))
+      self.record('get_range', s3_key, 0, start, ok=False)
+      return False
+
+  def _download(self, s3_key, part_path, size, etag, offset=0,
+                ranged=False):
+
+    # size bytes from offset, to the end of the object unless ranged
+    written = os.path.getsize(part_path) \
+        if os.path.isfile(part_path) else 0
+
+    if written > size:
+      written = 0
+
+    if written == size:
+      return
+
+    end = offset + size - 1 if ranged else None
 
-  def list_subdirs(self, s3_key):
+    # If-Match fails (412) once the object is not the version of etag
+    self._get_range_to_file(s3_key, part_path, offset + written, end, etag,
+                            append=written > 0)
 
-    sub_dirs = []
+  def _get_range_to_file(self, s3_key, part_path, start, end, etag,
+                         append=False):
+
+    kwargs = {'Bucket': self.bucket_name, 'Key': s3_key,
+              'IfMatch': '"{}"'.format(etag)}
+    if start > 0 or end is not None:
+      kwargs['Range'] = 'bytes={}-{}'.format(start,
+                                             '' if end is None else end)
+
+    resp = self.s3_client.get_object(**kwargs)
+    body = resp['Body']
+
+    with open(part_path, 'ab' if append else 'wb') as pfile:
+      for chunk in iter(lambda: body.read(config.S3_READ_CHUNKSIZE), b''):
+        pfile.write(chunk)
+
+  def _list(self, s3_key, delimiter=None, start_after=None):
+
+    kwargs = {'Bucket': self.bucket_name, 'Prefix': s3_key}
+    if delimiter is not None:
+      kwargs['Delimiter'] = delimiter
+    if start_after is not None:
+      kwargs['StartAfter'] = start_after
+
+    # pages are requested one by one so each is retried on its own
+    while True:
+
+      page = self._call(self.s3_client.list_objects_v2, **kwargs)
+
+      if delimiter is not None:
+        for prefix in page.get('CommonPrefixes') or []:
+          yield {'Key': prefix['Prefix']}
+      else:
+        for obj in page.get('Contents') or []:
+          yield {'Key': obj['Key'], 'Size': obj['Size'],
+                 'ETag': obj['ETag'].strip('"'),
+                 'LastModified': obj['LastModified']}
+
+      if not page.get('IsTruncated'):
+        break
+      kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+  def _list_cached(self, s3_key, kind, refresh=False):
+
+    cache = self.listing_cache
+    env, bucket = self.env_name, self.bucket_name
+    delimiter = config.AWS_S3_KEY_DELIMITER if kind == SUBDIRS else None
+
+    snapshot, state = cache.state(env, bucket, s3_key, kind)
+
+    if refresh or state == 'expired':
+      cache.store(env, bucket, s3_key, kind, self._list(s3_key, delimiter))
+      snapshot = s3_key
+    elif state == 'stale':
+      start_after = cache.last_key(env, bucket, snapshot, kind)
+      entries = self._list(snapshot, delimiter, start_after)
+      cache.store(env, bucket, snapshot, kind, entries, replace=False)
+
+    return cache.entries(env, bucket, snapshot, s3_key, kind)
+
+  def list_object_info(self, s3_key, refresh=False):
 
     try:
 
-      kwargs = {'Bucket': self.bucket_name, 'Delimiter': '/', 'Prefix': s3_key}
-      p = self.s3_resource.meta.client.get_paginator('list_objects')
+      return self._list_cached(s3_key, OBJECTS, refresh)
+
+    except Exception as err:
+
+      logger.error('Error fetching file on S3 : {}, {}'.format(s3_key, err))
+      return []
+
+  def list_objects(self, s3_key, refresh=False):
+
+    return [obj['Key'] for obj in self.list_object_info(s3_key, refresh)]
 
-      page_iterator = p.paginate(**kwargs)
+  def list_subdirs(self, s3_key, refresh=False):
 
-      sub_dirs = [prefix.get('Prefix') for page in page_iterator
-                  for prefix in page.get('CommonPrefixes')]
+    try:
 
-      return sub_dirs
+      sub_dirs = self._list_cached(s3_key, SUBDIRS, refresh)
+      return [sub_dir['Key'] for sub_dir in sub_dirs]
 
     except Exception as err:
 
@@ -1,4 +1,15 @@
+import os
+
 from fleet.configs import drive_config
+from fleet.s3_ops.s3_connector import get_connector
+from fleet.s3_ops.token_index import TokenIndex
+from fleet.s3_ops.bundle import fetch_bundle_index
+from fleet.s3_ops.exclude import apply_exclusions, get_excluded_sensors
+from fleet.s3_ops.exclude import read_table
+from fleet.s3_ops.transfer import fetch_prefix
+from fleet.s3_ops.video import RemoteVideo, frame_window
+
+logger = drive_config.get_logger(__name__)
 
 
 class Sequence(object):
@@ -6,9 +17,110 @@ class Sequence(object):
   def __init__(self):
 
     self.uuid = None
+    self.s3_connector = None
 
   def _fetch(self, args):
-    pass
+
+    self._set_uuid(args.token)
+
+    try:
+
+      repo_uris = drive_config.get_aws_repo_uris(args.avro_schema_version)
+      drive_data_repo = repo_uris[args.repo]
+
+      self.s3_connector = get_connector()
+
+      sequence_prefix = TokenIndex(self.s3_connector,
+                                   drive_data_repo).lookup('sequence',
+                                                           self.uuid)
+
+      if sequence_prefix is None:
+        logger.error('Sequence with token : {}, not indexed '
+                     'at {}'.format(self.uuid, drive_data_repo))
+        return False
+
+      exclude = get_excluded_sensors(args)
+      window = args.frames or args.seconds
+
+      # the clip replaces the full video
+      if window is not None and 'image' not in exclude:
+        exclude.append('image')
+
+      if not fetch_prefix(self.s3_connector, sequence_prefix,
+                          drive_data_repo, args.dest, jobs=args.jobs,
+                          desc='Fetching sequence', exclude=exclude):
+        return False
+
+      _, sequence_path = sequence_prefix.split(drive_data_repo, 1)
+      sequence_uri = os.path.join(args.dest, sequence_path)
+      apply_exclusions(sequence_uri, exclude)
+
+      if window is not None:
+        return self._fetch_clip(sequence_prefix, sequence_uri, window,
+                                by_time=args.seconds is not None,
+                                jobs=args.jobs)
+
+      return True
+
+    except Exception as err:
+      logger.error('Error fetching sequence {}, {}'.format(self.uuid, err))
+      return False
+
+  def _remote_video(self, sequence_prefix):
+
+    # listed in full, ranged reads trust the listed sizes
+    objects = self.s3_connector.list_object_info(sequence_prefix,
+                                                 refresh=True)
+    video_dir = drive_config.DRIVE_SEQUENCE_VIDEO_DIR
+
+    for obj in objects:
+      if '/' + video_dir in obj['Key']:
+        return RemoteVideo(self.s3_connector, obj['Key'], obj['Size']), \
+            os.path.basename(obj['Key'])
+
+    for obj in objects:
+      if obj['Key'].endswith(drive_config.DRIVE_SEQUENCE_BUNDLE):
+        index = fetch_bundle_index(self.s3_connector, obj['Key'])
+        for member in sorted(index):
+          if member.startswith(video_dir):
+            offset, size = index[member]
+            return RemoteVideo(self.s3_connector, obj['Key'], size,
+                               base_offset=offset), os.path.basename(member)
+
+    return None, None
+
+  def _fetch_clip(self, sequence_prefix, sequence_uri, window, by_time=False,
+                  jobs=None):
+
+    video, video_name = self._remote_video(sequence_prefix)
+
+    if video is None:
+      logger.error('No video for sequence {}'.format(self.uuid))
+      return False
+
+    sensor_rows = []
+    if by_time:
+      table, _, _ = read_table(os.path.join(sequence_uri, 'sensordata.avro'))
+      sensor_rows = list(table.values())[0]
+
+    start_frame, end_frame = frame_window(sensor_rows, *window,
+                                          by_time=by_time)
+
+    video_dir = os.path.join(sequence_uri,
+                             drive_config.DRIVE_SEQUENCE_VIDEO_DIR)
+    os.makedirs(video_dir, exist_ok=True)
+
+    stem, ext = os.path.splitext(video_name)
+    clip_path = os.path.join(video_dir, '{}_{}-{}{}'.format(
+        stem, start_frame, end_frame, ext))
+
+    first_frame, last_frame = video.fetch_frames(start_frame, end_frame,
+                                                 clip_path, jobs=jobs)
+
+    logger.info('Saved frames [{}, {}] of sequence {} to {}'.format(
+        first_frame, last_frame, self.uuid, clip_path))
+
+    return True
 
   def _info(self, args):
     pass
@@ -42,9 +154,28 @@ class Sequence(object):
     fetch.add_argument('-r', '--repo', dest='repo', required=True,
                        choices=['dump', 'master'],
                        help='Repo to fetch datda from')
-    fetch.add_argument('-e', '--exclude', dest='exclude',
+    fetch.add_argument('-e', '--exclude', dest='exclude', nargs='+',
                        choices=drive_config.DRIVE_DATA_SENSORS,
                        help='Exclude sensor from fetched sequence')
+    fetch.add_argument('-m', '--metadata-only', dest='metadata_only',
+                       action='store_true', default=False,
+                       help='Fetch avro files only, skips videos')
+    fetch.add_argument('-a', '--avro-schema-version',
+                       dest='avro_schema_version',
+                       default=drive_config.get_avro_schema_version(),
+                       help='Avro schema version if not'
+                       'specified gets from submodule')
+    fetch.add_argument('-j', '--jobs', dest='jobs', type=int,
+                       default=drive_config.S3_TRANSFER_JOBS,
+                       help='Number of files downloaded concurrently')
+    window = fetch.add_mutually_exclusive_group()
+    window.add_argument('-f', '--frames', dest='frames', type=int, nargs=2,
+                        metavar=('START', 'END'), default=None,
+                        help='Fetch only video frames [START, END]')
+    window.add_argument('-s', '--seconds', dest='seconds', type=float,
+                        nargs=2, metavar=('START', 'END'), default=None,
+                        help='Fetch only video frames between START and END '
+                        'seconds from the first camera frame')
     fetch.set_defaults(main=self._fetch)
 
     info.add_argument('duration', action='store_true',
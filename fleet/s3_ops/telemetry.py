@@ -0,0 +1,151 @@
+import json
+import time
+import datetime
+import threading
+import collections
+from pathlib import Path
+
+import numpy as np
+
+from fleet.configs import drive_config as config
+
+logger = config.get_logger(__name__)
+
+Record = collections.namedtuple('Record', ['op', 's3_key', 'nbytes',
+                                           'start', 'latency', 'ok'])
+
+
+def get_report_path(operation, token):
+
+  stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+  return config.TRANSFER_REPORT_DIR.joinpath(
+      '{}-{}-{}.json'.format(operation, token, stamp))
+
+
+class TransferTelemetry(object):
+
+  """Per object statistics of the S3 calls of a single run
+
+    S3Connector primitives record one entry per object (operation, key,
+    bytes, latency, outcome), report() aggregates them together with the
+    retries and throttling seen by the connector's TransferController.
+
+    Args:
+      operation: Name of the run, f.ex push or fetch
+      controller: Optional TransferController of the connector
+  """
+
+  def __init__(self, operation, controller=None):
+
+    self.operation = operation
+    self.controller = controller
+    self.records = []
+    self.lock = threading.Lock()
+
+    self.started = time.time()
+    self.start = time.perf_counter()
+    self.retries = controller.retries if controller is not None else 0
+    self.throttled = controller.throttled if controller is not None else 0
+
+  def record(self, op, s3_key, nbytes, start, ok=True):
+
+    """Records an object, start is the time.perf_counter() it started at"""
+
+    record = Record(op, s3_key, nbytes, start - self.start,
+                    time.perf_counter() - start, ok)
+
+    with self.lock:
+      self.records.append(record)
+
+  def _latency(self, records):
+
+    latencies = np.array([r.latency for r in records]) * 1000.0
+    if not len(latencies):
+      return {}
+
+    bounds = config.TRANSFER_LATENCY_BUCKETS_MS
+    counts = np.histogram(latencies, bins=[0] + bounds + [np.inf])[0]
+    labels = ['<={}'.format(b) for b in bounds] + ['>{}'.format(bounds[-1])]
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+
+    return {'p50_ms': round(p50, 1), 'p90_ms': round(p90, 1),
+            'p99_ms': round(p99, 1), 'max_ms': round(latencies.max(), 1),
+            'histogram_ms': dict(zip(labels, counts.tolist()))}
+
+  def _timeline(self, records, duration):
+
+    """Bytes and objects completed per TRANSFER_TIMELINE_STEP seconds"""
+
+    step = config.TRANSFER_TIMELINE_STEP
+    bins = int(duration // step) + 1
+    nbytes, objects = np.zeros(bins), np.zeros(bins, dtype=int)
+
+    for r in records:
+      idx = min(int((r.start + r.latency) // step), bins - 1)
+      nbytes[idx] += r.nbytes
+      objects[idx] += 1
+
+    return [{'t_s': round(idx * step, 3), 'objects': int(objects[idx]),
+             'mb_per_s': round(nbytes[idx] / 1024.0 ** 2 / step, 3)}
+            for idx in range(bins)]
+
+  def report(self):
+
+    with self.lock:
+      records = list(self.records)
+
+    duration = time.perf_counter() - self.start
+    transferred = sum(r.nbytes for r in records if r.ok)
+
+    operations = {}
+    for op in sorted(set(r.op for r in records)):
+      op_records = [r for r in records if r.op == op]
+      operations[op] = {'objects': len(op_records),
+                        'failed': sum(not r.ok for r in op_records),
+                        'bytes': sum(r.nbytes for r in op_records if r.ok),
+                        'latency': self._latency(op_records)}
+
+    slowest = sorted(records, key=lambda r: r.latency, reverse=True)
+    slowest = [{'op': r.op, 's3_key': r.s3_key, 'bytes': r.nbytes,
+                'latency_ms': round(r.latency * 1000.0, 1), 'ok': r.ok}
+               for r in slowest[:config.TRANSFER_SLOWEST_OBJECTS]]
+
+    report = {'operation': self.operation,
+              'started': datetime.datetime.utcfromtimestamp(
+                  self.started).isoformat() + 'Z',
+              'duration_s': round(duration, 3),
+              'objects': len(records),
+              'failed': sum(not r.ok for r in records),
+              'bytes': transferred,
+              'mb_per_s': round(transferred / 1024.0 ** 2 / duration, 3)
+              if duration > 0 else 0.0,
+              'latency': self._latency(records),
+              'operations': operations,
+              'timeline': self._timeline(records, duration),
+              'slowest': slowest}
+
+    if self.controller is not None:
+      report.update({'retries': self.controller.retries - self.retries,
+                     'throttled': self.controller.throttled - self.throttled,
+                     'concurrency_limit': int(self.controller.limiter.limit)})
+
+    return report
+
+  def save(self, report_path):
+
+    report = self.report()
+
+    report_path = Path(report_path)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with report_path.open('w') as pfile:
+      json.dump(report, pfile, indent=2)
+
+    logger.info('{} : {} objects, {:.1f} MB in {:.1f} s ({:.1f} MB/s), '
+                '{} failed, report {}'.format(
+                    self.operation, report['objects'],
+                    report['bytes'] / 1024.0 ** 2, report['duration_s'],
+                    report['mb_per_s'], report['failed'], report_path))
+
+    return report
@@ -0,0 +1,221 @@
+import time
+import random
+import threading
+
+from botocore import exceptions as botocore_errors
+from botocore.exceptions import ClientError
+
+from fleet.configs import drive_config as config
+
+logger = config.get_logger(__name__)
+
+# S3 error codes asking clients to slow down
+THROTTLE_ERROR_CODES = {'SlowDown', 'Throttling', 'ThrottlingException',
+                        'RequestLimitExceeded', 'TooManyRequests', '503',
+                        'ServiceUnavailable'}
+# transient S3 error codes, retried without reducing concurrency
+TRANSIENT_ERROR_CODES = {'RequestTimeout', 'RequestTimeTooSkewed',
+                         'InternalError', '500', '502', '504'}
+# connection failures, timeouts and truncated reads, retried as transient
+RETRYABLE_ERRORS = (botocore_errors.ConnectionError,
+                    botocore_errors.EndpointConnectionError,
+                    botocore_errors.ReadTimeoutError,
+                    botocore_errors.ConnectTimeoutError,
+                    botocore_errors.IncompleteReadError)
+
+
+def error_code(err):
+
+  """S3 error code of a failed call, None if it carries none
+
+    Failed managed transfers (upload_file, copy) only keep the code in the
+    error message, "An error occurred (<code>) when calling ...".
+  """
+
+  if isinstance(err, ClientError):
+    return err.response.get('Error', {}).get('Code')
+
+  message = str(err)
+  if 'An error occurred (' in message:
+    return message.split('An error occurred (', 1)[1].split(')', 1)[0]
+
+  return None
+
+
+def is_throttled(err):
+
+  return error_code(err) in THROTTLE_ERROR_CODES
+
+
+def is_retryable(err):
+
+  # other botocore errors (credentials, parameters, ...) do not go away
+  if isinstance(err, RETRYABLE_ERRORS):
+    return True
+
+  return error_code(err) in THROTTLE_ERROR_CODES | TRANSIENT_ERROR_CODES
+
+
+class RetryBudget(object):
+
+  """Token bucket bounding retries to a fraction of successful calls
+
+    Every retry withdraws a token, every success deposits ratio tokens.
+    Once the bucket is empty failures are reported instead of retried, so
+    a persistent outage does not multiply the load on the bucket.
+
+    Args:
+      tokens: Bucket capacity (and initial tokens)
+      ratio: Tokens deposited per successful call
+  """
+
+  def __init__(self, tokens=None, ratio=None):
+
+    self.capacity = float(tokens if tokens is not None
+                          else config.S3_RETRY_BUDGET)
+    self.ratio = ratio if ratio is not None else config.S3_RETRY_BUDGET_RATIO
+    self.tokens = self.capacity
+    self.lock = threading.Lock()
+
+  def success(self):
+
+    with self.lock:
+      self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+  def withdraw(self):
+
+    with self.lock:
+      if self.tokens < 1:
+        return False
+      self.tokens -= 1
+      return True
+
+
+class AdaptiveLimiter(object):
+
+  """AIMD limit on the number of S3 calls in flight
+
+    The limit grows by one per limit successful calls (additive increase)
+    and is multiplied by decrease on throttling (multiplicative decrease),
+    at most once per cooldown seconds so a burst of throttled calls
+    counts as one congestion signal.
+
+    Args:
+      limit: Initial limit
+      min_limit: Lower bound of the limit
+      max_limit: Upper bound of the limit
+  """
+
+  def __init__(self, limit=None, min_limit=None, max_limit=None):
+
+    self.limit = float(limit if limit is not None else config.S3_TRANSFER_JOBS)
+    self.min_limit = min_limit if min_limit is not None \
+        else config.S3_CONCURRENCY_MIN
+    self.max_limit = max_limit if max_limit is not None \
+        else config.S3_MAX_POOL_CONNECTIONS
+    self.decrease = config.S3_CONCURRENCY_DECREASE
+    self.cooldown = config.S3_CONCURRENCY_COOLDOWN
+
+    self.in_flight = 0
+    self.last_decrease = 0.0
+    self.condition = threading.Condition()
+
+  def acquire(self):
+
+    with self.condition:
+      while self.in_flight >= int(self.limit):
+        self.condition.wait()
+      self.in_flight += 1
+
+  def release(self, throttled=False):
+
+    with self.condition:
+
+      self.in_flight -= 1
+      now = time.monotonic()
+
+      if throttled:
+        if now - self.last_decrease >= self.cooldown:
+          self.limit = max(self.min_limit, self.limit * self.decrease)
+          self.last_decrease = now
+          logger.warning('S3 throttling, concurrency limit '
+                         '{}'.format(int(self.limit)))
+      else:
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+      self.condition.notify_all()
+
+
+class TransferController(object):
+
+  """Runs S3 calls under an AIMD limit with backoff and a retry budget
+
+    Throttled and transient failures are retried with exponential backoff
+    and full jitter, up to max_attempts per call and while the retry
+    budget lasts. Other failures, and calls out of retries, raise.
+
+    Args:
+      limiter: AdaptiveLimiter, shared by every call of a connector
+      budget: RetryBudget
+      max_attempts: Attempts per call
+  """
+
+  def __init__(self, limiter=None, budget=None, max_attempts=None):
+
+    self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+    self.budget = budget if budget is not None else RetryBudget()
+    self.max_attempts = max_attempts if max_attempts is not None \
+        else config.S3_RETRY_MAX_ATTEMPTS
+
+    self.retries = 0
+    self.throttled = 0
+    self.lock = threading.Lock()
+
+  def backoff(self, attempt):
+
+    delay = min(config.S3_RETRY_MAX_DELAY,
+                config.S3_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, delay)
+
+  def call(self, fn, *args, **kwargs):
+
+    attempt = 0
+
+    while True:
+
+      throttled = False
+      self.limiter.acquire()
+
+      try:
+        result = fn(*args, **kwargs)
+        self.budget.success()
+        return result
+
+      except Exception as err:
+
+        throttled = is_throttled(err)
+
+        with self.lock:
+          self.throttled += int(throttled)
+
+        if not is_retryable(err) or attempt + 1 >= self.max_attempts:
+          raise
+        if not self.budget.withdraw():
+          logger.error('S3 retry budget exhausted')
+          raise
+
+        with self.lock:
+          self.retries += 1
+
+      finally:
+        self.limiter.release(throttled)
+
+      time.sleep(self.backoff(attempt))
+      attempt += 1
+
+  def summarize(self):
+
+    if self.retries or self.throttled:
+      logger.warning('S3 calls retried {} times, {} throttled, concurrency '
+                     'limit {}'.format(self.retries, self.throttled,
+                                       int(self.limiter.limit)))
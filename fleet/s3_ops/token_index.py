@@ -0,0 +1,119 @@
+import os
+import bisect
+import collections
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.transfer import TransferPool
+
+logger = config.get_logger(__name__)
+
+
+def read_shard(data):
+
+  """Parses a shard object into sorted token and prefix lists
+
+    A shard holds one `<token>\\t<key prefix>` line per token, sorted by
+    token.
+  """
+
+  tokens, prefixes = [], []
+
+  if not data:
+    return tokens, prefixes
+
+  for line in data.decode('utf-8').splitlines():
+    token, prefix = line.split('\t')
+    tokens.append(token)
+    prefixes.append(prefix)
+
+  return tokens, prefixes
+
+
+def write_shard(entries):
+
+  lines = ['{}\t{}\n'.format(token, entries[token])
+           for token in sorted(entries)]
+  return ''.join(lines).encode('utf-8')
+
+
+class TokenIndex(object):
+
+  """Token -> S3 key prefix index stored as sorted shard objects
+
+    Each diary, drive and sequence token maps to the key prefix it is
+    stored under. A lookup is a single GET of a small shard and a binary
+    search over its sorted tokens. Shards are updated read-modify-write, so
+    concurrent pushes touching the same shard may race (last writer wins),
+    re-running a push restores its entries.
+
+    Args:
+      s3_connector: Connected S3Connector
+      drive_data_repo: Repo key prefix the index belongs to
+  """
+
+  def __init__(self, s3_connector, drive_data_repo):
+
+    self.s3_connector = s3_connector
+    self.index_prefix = os.path.join(drive_data_repo,
+                                     config.DRIVE_DATA_INDEX_PREFIX)
+
+  def _shard_key(self, kind, token):
+
+    assert kind in config.DRIVE_DATA_INDEX_KINDS, \
+        'Unknown token kind {}'.format(kind)
+
+    shard = token[:config.DRIVE_DATA_INDEX_SHARD_WIDTH]
+    return os.path.join(self.index_prefix, kind, shard + '.idx')
+
+  def lookup(self, kind, token):
+
+    """Returns the key prefix for token, None if not indexed"""
+
+    data = self.s3_connector.get_bytes(self._shard_key(kind, token))
+    tokens, prefixes = read_shard(data)
+
+    idx = bisect.bisect_left(tokens, token)
+    if idx < len(tokens) and tokens[idx] == token:
+      return prefixes[idx]
+
+    return None
+
+  def _update_shard(self, shard_key, entries):
+
+    tokens, prefixes = read_shard(self.s3_connector.get_bytes(shard_key))
+
+    merged = dict(zip(tokens, prefixes))
+    merged.update(entries)
+    # removed tokens are updated to None
+    merged = {t: p for t, p in merged.items() if p is not None}
+
+    return self.s3_connector.put_bytes(write_shard(merged), shard_key)
+
+  def update(self, entries, jobs=None):
+
+    """Adds entries to the index
+
+      Args:
+        entries: List of (kind, token, key prefix)
+        jobs: Number of shards updated concurrently
+
+      Returns:
+        True if every touched shard was written
+    """
+
+    shards = collections.defaultdict(dict)
+    for kind, token, prefix in entries:
+      shards[self._shard_key(kind, token)][token] = prefix
+
+    pool = TransferPool(jobs=jobs, desc='Updating token index')
+    flags, failures = pool.run(self._update_shard, list(shards.items()))
+    pool.summarize(failures, len(shards))
+
+    return all(flags)
+
+  def remove(self, entries, jobs=None):
+
+    """Removes entries, list of (kind, token), from the index"""
+
+    return self.update([(kind, token, None) for kind, token in entries],
+                       jobs=jobs)
@@ -0,0 +1,263 @@
+import os
+import hashlib
+from concurrent import futures
+
+import tqdm
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.bundle import fetch_bundle_members
+from fleet.s3_ops.exclude import excluded_members, is_excluded_key
+
+logger = config.get_logger(__name__)
+
+
+class TransferPool(object):
+
+  """Bounded pool of worker threads running S3 transfers
+
+    A single aggregated progress bar tracks all transfers in flight, every
+    failure is collected and reported once the pool drains.
+
+    Args:
+      jobs: Number of transfers in flight at once
+      desc: Progress bar description
+  """
+
+  def __init__(self, jobs=None, desc='Transferring'):
+
+    self.jobs = jobs if jobs is not None else config.S3_TRANSFER_JOBS
+    assert self.jobs > 0, 'Expected at-least 1 transfer job, ' \
+        'found {}'.format(self.jobs)
+    self.desc = desc
+
+  def run(self, transfer_fn, transfers, sizes=None):
+
+    """Runs transfer_fn(*transfer) for each transfer on the pool
+
+      Transfers are consumed lazily, at most 2 x jobs are queued at once so
+      streamed transfers (generators) are never materialised.
+
+      Args:
+        transfer_fn: Callable returning True on a successful transfer
+        transfers: Iterable of argument tuples, one per transfer
+        sizes: Optional list of transfer sizes (bytes), or a callable
+          returning the size of a transfer, for the progress bar
+
+      Returns:
+        List of transfer flags ordered as transfers
+        List of (transfer, error) for failed transfers
+    """
+
+    results = {}
+    failures = []
+
+    if sizes is None:
+      total = len(transfers) if hasattr(transfers, '__len__') else None
+      pbar = tqdm.tqdm(total=total, desc=self.desc, unit='file')
+    else:
+      total = sum(sizes) if not callable(sizes) else None
+      pbar = tqdm.tqdm(total=total, desc=self.desc, unit='B',
+                       unit_scale=True, unit_divisor=1024)
+
+    def size_of(idx, transfer):
+      if sizes is None:
+        return 1
+      return sizes(transfer) if callable(sizes) else sizes[idx]
+
+    def collect(done):
+      for future in done:
+        idx, transfer = pending.pop(future)
+        try:
+          results[idx] = bool(future.result())
+          if not results[idx]:
+            failures.append((transfer, 'transfer failed'))
+        except Exception as err:
+          results[idx] = False
+          failures.append((transfer, err))
+        pbar.update(size_of(idx, transfer))
+
+    pending = {}
+
+    with futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+
+      for idx, transfer in enumerate(transfers):
+
+        if len(pending) >= 2 * self.jobs:
+          done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+          collect(done)
+
+        pending[executor.submit(transfer_fn, *transfer)] = (idx, transfer)
+
+      collect(futures.as_completed(list(pending)))
+
+    pbar.close()
+
+    return [results[idx] for idx in sorted(results)], failures
+
+  def summarize(self, failures, total):
+
+    if not failures:
+      logger.info('{} : {}/{} transfers done'.format(self.desc, total, total))
+      return
+
+    logger.error('{} : {}/{} transfers failed'.format(
+        self.desc, len(failures), total))
+    for transfer, err in failures:
+      logger.error('Failed {}, {}'.format(transfer[0], err))
+
+
+def walk_files(source_dir, formats=None):
+
+  """Streams file paths below source_dir, optionally filtered by extension"""
+
+  with os.scandir(source_dir) as entries:
+    for entry in entries:
+      if entry.is_dir(follow_symlinks=False):
+        yield from walk_files(entry.path, formats)
+      elif entry.is_file():
+        if formats is None or entry.name.rsplit('.', 1)[-1] in formats:
+          yield entry.path
+
+
+def folder_transfers(source_dir, dest_dir, formats=None):
+
+  """Streams (file_path, s3_key) of the files below source_dir, keyed by
+    their path relative to source_dir under the dest_dir prefix
+  """
+
+  for file_path in walk_files(source_dir, formats):
+    yield file_path, os.path.join(dest_dir,
+                                  os.path.relpath(file_path, source_dir))
+
+
+def file_sizes(file_paths):
+
+  # missing files are reported by the transfer itself, not here
+  return [os.path.getsize(str(f)) if os.path.isfile(str(f)) else 0
+          for f in file_paths]
+
+
+def file_checksums(file_path, chunk_size=None, multipart=None):
+
+  """Computes the content MD5 and the S3 ETag of a local file in one pass
+
+    Single part uploads carry the MD5 of the content, multipart uploads the
+    MD5 of the concatenated part digests suffixed with -<number of parts>.
+
+    Args:
+      file_path: Local file path
+      chunk_size: Multipart part size, defaults to the put_file part size
+      multipart: Force (or prevent) a multipart ETag, by default decided by
+        the put_file multipart threshold
+
+    Returns:
+      Content MD5 hex digest
+      ETag string without quotes
+  """
+
+  chunk_size = config.S3_MULTIPART_CHUNKSIZE \
+      if chunk_size is None else chunk_size
+
+  md5 = hashlib.md5()
+  digests = []
+
+  with open(file_path, 'rb') as pfile:
+    for chunk in iter(lambda: pfile.read(chunk_size), b''):
+      md5.update(chunk)
+      digests.append(hashlib.md5(chunk).digest())
+
+  if multipart is None:
+    multipart = os.path.getsize(file_path) >= config.S3_MULTIPART_THRESHOLD
+
+  if not multipart:
+    return md5.hexdigest(), md5.hexdigest()
+
+  etag = '{}-{}'.format(hashlib.md5(b''.join(digests)).hexdigest(),
+                        len(digests))
+
+  return md5.hexdigest(), etag
+
+
+def compute_etag(file_path, etag=None):
+
+  """Computes the S3 ETag of a local file
+
+    Args:
+      file_path: Local file path
+      etag: Optional remote ETag, its part count picks the part size. When
+        None the ETag put_file would produce is computed
+
+    Returns:
+      ETag string without quotes
+  """
+
+  if etag is None:
+    return file_checksums(file_path)[1]
+
+  if '-' not in etag:
+    return file_checksums(file_path, multipart=False)[1]
+
+  parts = int(etag.split('-')[1])
+  file_size = os.path.getsize(file_path)
+  chunk_size = config.S3_MULTIPART_CHUNKSIZE
+
+  # uploads with a non default part size, round to the next MB
+  if -(-file_size // chunk_size) != parts:
+    mb = 1024 ** 2
+    chunk_size = -(-file_size // parts)
+    chunk_size = -(-chunk_size // mb) * mb
+
+  return file_checksums(file_path, chunk_size, multipart=True)[1]
+
+
+def fetch_prefix(s3_connector, s3_prefix, drive_data_repo, destination,
+                 jobs=None, desc='Fetching', exclude=None):
+
+  """Fetches every object under s3_prefix to destination
+
+    Local paths mirror the keys relative to drive_data_repo. With excluded
+    sensors, objects holding only their data are skipped and bundled
+    sequences are fetched member by member as loose files.
+
+    Returns:
+      True if every object was fetched
+  """
+
+  transfers = []
+  skipped = 0
+
+  # listed from the snapshot, objects changed since are fetched again at
+  # their current version by get_file (If-Match)
+  for obj in s3_connector.list_object_info(s3_prefix):
+
+    if is_excluded_key(obj['Key'], exclude):
+      skipped += 1
+      continue
+
+    _, suffix = obj['Key'].split(drive_data_repo, 1)
+    destination_file = os.path.join(destination, suffix)
+
+    os.makedirs(os.path.dirname(destination_file), exist_ok=True)
+    transfers.append((obj['Key'], destination_file, obj['Size'],
+                      obj['ETag']))
+
+  if skipped:
+    logger.info('Skipping {} objects of excluded sensors '
+                '{}'.format(skipped, ', '.join(exclude)))
+
+  def get_obj(s3_key, destination_file, size, etag):
+
+    if exclude and s3_key.endswith(config.DRIVE_SEQUENCE_BUNDLE):
+      return fetch_bundle_members(s3_connector, s3_key,
+                                  os.path.dirname(destination_file),
+                                  skip=excluded_members(exclude), etag=etag)
+
+    return s3_connector.get_file(s3_key, destination_file, size, etag)
+
+  pool = TransferPool(jobs=jobs, desc=desc)
+  flags, failures = pool.run(get_obj, transfers,
+                             sizes=[t[2] for t in transfers])
+  pool.summarize(failures, len(transfers))
+  s3_connector.controller.summarize()
+
+  return all(flags)
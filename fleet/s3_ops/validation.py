@@ -0,0 +1,321 @@
+import os
+import json
+import hashlib
+import threading
+import concurrent.futures
+from pathlib import Path
+
+import tqdm
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.bundle import is_bundled, open_sequence_member
+from fleet.s3_ops.integrity import check_sequence_references
+from fleet.s3_ops.transfer import file_checksums
+from fleet.utils.helpers import read_avro_schemas, validate_with_schema
+
+logger = config.get_logger(__name__)
+
+# schemas of a worker process per schema directory, parsed on its first
+# task, the validators compiled for them are cached along (see
+# compile_validator)
+_worker_schemas = {}
+
+
+def _load_schemas(schema_path):
+
+  schemas = _worker_schemas.get(schema_path)
+  if schemas is None:
+    schemas = read_avro_schemas(schema_path)
+    _worker_schemas[schema_path] = schemas
+
+  return schemas
+
+
+def _validate_worker(sequence_uri, schema_path, references):
+
+  return validate_sequence(sequence_uri, _load_schemas(schema_path),
+                           references)
+
+
+def validate_sequence(sequence_uri, schemas, references=True, opener=None,
+                      trust_header=False):
+
+  """Validates the avro files of a (loose or bundled) sequence
+
+    Args:
+      sequence_uri: Sequence directory
+      schemas: Parsed schemas, see helpers.read_avro_schemas
+      references: Also check the tokens referenced across its tables
+      opener: Context manager (sequence_uri, member) -> file object,
+        defaults to bundle.open_sequence_member (f.ex
+        RemoteDiary.open_sequence_member for sequences on S3)
+      trust_header: See helpers.validate_with_schema
+
+    Returns:
+      List of flags, one per DRIVE_SEQUENCE_AVROS and one for references
+  """
+
+  opener = opener if opener is not None else open_sequence_member
+  sequence_flags = []
+
+  for avro_name, schema_name in config.DRIVE_SEQUENCE_AVROS:
+
+    try:
+      with opener(sequence_uri, avro_name) as pfile:
+        avro_flag = validate_with_schema(pfile, schemas[schema_name],
+                                         trust_header)
+    except Exception as err:
+      logger.error('Error reading {} at {}, {}'.format(avro_name,
+                                                       sequence_uri, err))
+      avro_flag = False
+
+    sequence_flags.append(avro_flag)
+
+  if references:
+    # references of unreadable files are not checked
+    resolved = all(sequence_flags)
+    if resolved:
+      resolved = _check_references(sequence_uri, opener)
+    sequence_flags.append(resolved)
+
+  return sequence_flags
+
+
+def _check_references(sequence_uri, opener=None):
+
+  try:
+    problems = check_sequence_references(sequence_uri, opener=opener)
+  except Exception as err:
+    problems = ['error checking references, {}'.format(err)]
+
+  for problem in problems:
+    logger.error('Broken references at {}, {}'.format(sequence_uri, problem))
+
+  return not problems
+
+
+def iter_validate_sequences(sequence_uris, schema_path, jobs=None,
+                            references=True):
+
+  """Validates sequences on a process pool, one task per sequence
+
+    Avro decoding is CPU bound, worker processes (unlike threads) scale
+    with cores. Each worker parses the schemas once, on its first task.
+    Tasks are submitted on the call, so worker processes are started
+    before it returns (f.ex before upload threads are started).
+
+    Args:
+      sequence_uris: Sequence directories
+      schema_path: Directory of the avro schemas
+      jobs: Number of worker processes, 1 validates in process
+      references: Also check the tokens referenced across tables
+
+    Returns:
+      Iterator of the index in sequence_uris and flags (see
+      validate_sequence) of each sequence, as validated
+  """
+
+  jobs = jobs if jobs is not None else config.DRIVE_VALIDATION_JOBS
+  jobs = max(1, min(jobs, len(sequence_uris)))
+
+  if jobs == 1:
+    return _iter_in_process(sequence_uris, schema_path, references)
+
+  # no pool initializer, Python 3.6 has none
+  executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+  futures = {executor.submit(_validate_worker, uri, schema_path,
+                             references): idx
+             for idx, uri in enumerate(sequence_uris)}
+
+  return _iter_completed(executor, futures, sequence_uris, references)
+
+
+def _iter_in_process(sequence_uris, schema_path, references):
+
+  schemas = read_avro_schemas(schema_path)
+  for idx, uri in enumerate(sequence_uris):
+    yield idx, validate_sequence(uri, schemas, references)
+
+
+def _iter_completed(executor, futures, sequence_uris, references):
+
+  with executor:
+
+    for future in concurrent.futures.as_completed(futures):
+
+      idx = futures[future]
+
+      try:
+        sequence_flags = future.result()
+      except Exception as err:
+        logger.error('Error validating {}, {}'.format(sequence_uris[idx],
+                                                      err))
+        flag_count = len(config.DRIVE_SEQUENCE_AVROS) + int(references)
+        sequence_flags = [False] * flag_count
+
+      yield idx, sequence_flags
+
+
+def validate_sequences(sequence_uris, schema_path, jobs=None,
+                       references=True, desc='Validating sequences'):
+
+  """Flags of each sequence (see validate_sequence), ordered as
+    sequence_uris, see iter_validate_sequences
+  """
+
+  sequence_flags = [None] * len(sequence_uris)
+
+  results = iter_validate_sequences(sequence_uris, schema_path, jobs=jobs,
+                                    references=references)
+
+  for idx, flags in tqdm.tqdm(results, total=len(sequence_uris), desc=desc):
+    sequence_flags[idx] = flags
+
+  return sequence_flags
+
+
+def schema_fingerprint(schema_path):
+
+  """Schema submodule version and a digest of the schema files"""
+
+  digest = hashlib.sha1()
+
+  pattern = '*.{}'.format(config.DRIVE_SCHEMA_FORMAT)
+  for schema_file in sorted(Path(schema_path).glob(pattern)):
+    digest.update(schema_file.name.encode())
+    digest.update(schema_file.read_bytes())
+
+  return '{}-{}'.format(config.get_avro_schema_version(),
+                        digest.hexdigest()[:16])
+
+
+def sequence_files(sequence_uri):
+
+  """Files validated for a sequence, its bundle or its loose avro files"""
+
+  sequence_uri = Path(sequence_uri)
+
+  if is_bundled(sequence_uri):
+    return [sequence_uri.joinpath(config.DRIVE_SEQUENCE_BUNDLE)]
+
+  return [sequence_uri.joinpath(avro_name)
+          for avro_name, _ in config.DRIVE_SEQUENCE_AVROS]
+
+
+class ValidationCache(object):
+
+  """Record of the files of a diary found valid
+
+    Entries are keyed by path relative to the diary and hold the size and
+    mtime (and optionally the MD5) of each file validated together, f.ex
+    the avro files of a sequence. Entries are only reused while the files
+    are unchanged and the schemas are those they were validated against,
+    a change of schemas drops every entry. Failures are never recorded.
+
+    Args:
+      diary_path: Drive diary directory, the cache is stored within
+      schema_version: Fingerprint of the schemas, see schema_fingerprint
+      with_hash: Also compare file contents (MD5), for file systems with
+        unreliable mtimes
+  """
+
+  def __init__(self, diary_path, schema_version, with_hash=False):
+
+    self.diary_path = Path(diary_path)
+    self.cache_path = self.diary_path.joinpath(config.DRIVE_VALIDATION_CACHE)
+    self.schema_version = schema_version
+    self.with_hash = with_hash
+    self.entries = {}
+    self.skipped = 0
+    self.lock = threading.Lock()
+
+  def load(self):
+
+    if not self.cache_path.is_file():
+      return self
+
+    try:
+
+      with self.cache_path.open() as pfile:
+        cache = json.load(pfile)
+
+      if cache['schema_version'] != self.schema_version:
+        logger.info('Schemas changed since {} ({} != {}), revalidating'.format(
+            self.cache_path, cache['schema_version'], self.schema_version))
+      else:
+        self.entries = cache['entries']
+
+    except Exception as err:
+      logger.warning('Ignoring validation cache '
+                     '{}, {}'.format(self.cache_path, err))
+      self.entries = {}
+
+    return self
+
+  def save(self):
+
+    tmp_path = self.cache_path.with_suffix('.tmp')
+
+    with self.lock:
+      with tmp_path.open('w') as pfile:
+        json.dump({'schema_version': self.schema_version,
+                   'entries': self.entries}, pfile, indent=2, sort_keys=True)
+
+    os.replace(tmp_path.as_posix(), self.cache_path.as_posix())
+
+  def _key(self, path):
+
+    return Path(path).relative_to(self.diary_path).as_posix()
+
+  def _fingerprint(self, file_paths):
+
+    fingerprint = []
+
+    for file_path in file_paths:
+      stat = os.stat(str(file_path))
+      md5 = file_checksums(str(file_path))[0] if self.with_hash else None
+      fingerprint.append([self._key(file_path), stat.st_size,
+                          stat.st_mtime_ns, md5])
+
+    return fingerprint
+
+  def is_valid(self, path, file_paths=None):
+
+    """True if path was found valid and its files are unchanged
+
+      Args:
+        path: File or sequence directory
+        file_paths: Files validated for path, defaults to [path]
+    """
+
+    with self.lock:
+      entry = self.entries.get(self._key(path))
+
+    if entry is None:
+      return False
+
+    try:
+      fingerprint = self._fingerprint(file_paths or [path])
+    except OSError:
+      return False
+
+    # entries recorded without hashes do not match hashed lookups
+    valid = fingerprint == entry
+
+    if valid:
+      with self.lock:
+        self.skipped += 1
+
+    return valid
+
+  def record(self, path, file_paths=None):
+
+    fingerprint = self._fingerprint(file_paths or [path])
+
+    with self.lock:
+      self.entries[self._key(path)] = fingerprint
+
+  def discard(self, path):
+
+    with self.lock:
+      self.entries.pop(self._key(path), None)
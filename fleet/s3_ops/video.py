@@ -0,0 +1,359 @@
+import os
+import struct
+import bisect
+
+import ffmpeg
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.transfer import TransferPool
+
+logger = config.get_logger(__name__)
+
+# largest box header, size (4) type (4) largesize (8)
+MP4_BOX_HEADER = 16
+
+
+def parse_box_header(data, offset=0):
+
+  """Returns (box size, box type, header size) of the box at offset
+
+    A size of 0 (box runs to the end of the file) is returned as None.
+  """
+
+  size, box_type = struct.unpack('>I4s', data[offset: offset + 8])
+
+  if size == 1:
+    size, = struct.unpack('>Q', data[offset + 8: offset + 16])
+    return size, box_type, 16
+
+  return (size or None), box_type, 8
+
+
+def iter_boxes(data, start=0, end=None):
+
+  """Yields (box type, payload start, box end) of boxes in data[start:end]"""
+
+  end = len(data) if end is None else end
+  offset = start
+
+  while offset + 8 <= end:
+    size, box_type, header = parse_box_header(data, offset)
+    box_end = end if size is None else offset + size
+    yield box_type, offset + header, box_end
+    offset = box_end
+
+
+def find_box(data, path, start=0, end=None):
+
+  """Payload (start, end) of the first box along path
+
+    f.ex [b'mdia', b'hdlr'] finds the handler box of a track.
+  """
+
+  for box_type, payload, box_end in iter_boxes(data, start, end):
+    if box_type != path[0]:
+      continue
+    if len(path) == 1:
+      return payload, box_end
+    found = find_box(data, path[1:], payload, box_end)
+    if found is not None:
+      return found
+
+  return None
+
+
+def _table(data, box, fmt):
+
+  """Entries of a full box table (version, flags, entry count, entries)"""
+
+  start, _ = box
+  count, = struct.unpack('>I', data[start + 4: start + 8])
+  end = start + 8 + count * struct.calcsize(fmt)
+
+  return list(struct.iter_unpack(fmt, data[start + 8: end]))
+
+
+class VideoIndex(object):
+
+  """Sample table of the video track of an MP4 moov box
+
+    Frames are numbered from 0 in decode order, as bsens_seq_frame. With
+    B-frames the presentation time of a frame is its decode time plus its
+    composition offset (ctts).
+
+    Args:
+      moov: Bytes of the complete moov box
+  """
+
+  def __init__(self, moov):
+
+    stbl = None
+
+    for box_type, payload, box_end in iter_boxes(moov, 8):
+
+      if box_type != b'trak':
+        continue
+
+      hdlr = find_box(moov, [b'mdia', b'hdlr'], payload, box_end)
+      if hdlr is None or moov[hdlr[0] + 8: hdlr[0] + 12] != b'vide':
+        continue
+
+      mdhd = find_box(moov, [b'mdia', b'mdhd'], payload, box_end)
+      stbl = find_box(moov, [b'mdia', b'minf', b'stbl'], payload, box_end)
+      elst = find_box(moov, [b'edts', b'elst'], payload, box_end)
+      break
+
+    if stbl is None:
+      raise ValueError('No video track in moov')
+
+    version = moov[mdhd[0]]
+    timescale_at = mdhd[0] + (20 if version == 1 else 12)
+    self.timescale, = struct.unpack('>I', moov[timescale_at: timescale_at + 4])
+
+    def box(name):
+      return find_box(moov, [name], *stbl)
+
+    # sample sizes
+    stsz = box(b'stsz')
+    sample_size, count = struct.unpack('>II', moov[stsz[0] + 4: stsz[0] + 12])
+    self.sizes = [sample_size] * count if sample_size else \
+        list(struct.unpack('>{}I'.format(count),
+                           moov[stsz[0] + 12: stsz[0] + 12 + 4 * count]))
+
+    # decode times
+    self.times = []
+    dts = 0
+    for sample_count, delta in _table(moov, box(b'stts'), '>II'):
+      for _ in range(sample_count):
+        self.times.append(dts)
+        dts += delta
+
+    # composition offsets, signed in version 1 boxes
+    self.composition = [0] * count
+    ctts = box(b'ctts')
+    if ctts is not None:
+      fmt = '>Ii' if moov[ctts[0]] == 1 else '>II'
+      self.composition = [offset for sample_count, offset
+                          in _table(moov, ctts, fmt)
+                          for _ in range(sample_count)]
+
+    # presentation starts at the media time of the first edit, at the first
+    # presented frame without an edit list (empty edits have media time -1)
+    edits = []
+    if elst is not None:
+      fmt = '>Qqi' if moov[elst[0]] == 1 else '>Iii'
+      edits = [media_time for _, media_time, _ in _table(moov, elst, fmt)
+               if media_time >= 0]
+    presentation = [t + c for t, c in zip(self.times, self.composition)]
+    self.start_time = edits[0] if edits else min(presentation, default=0)
+
+    # key frames, every frame when there is no stss box
+    stss = box(b'stss')
+    self.keyframes = [s - 1 for s, in _table(moov, stss, '>I')] \
+        if stss is not None else list(range(count))
+
+    # sample offsets from chunk offsets and samples per chunk
+    stco = box(b'stco')
+    chunk_offsets = _table(moov, stco, '>I') if stco is not None \
+        else _table(moov, box(b'co64'), '>Q')
+    stsc = _table(moov, box(b'stsc'), '>III')
+
+    self.offsets = []
+    sample = 0
+    for idx, (chunk_offset, ) in enumerate(chunk_offsets):
+      chunk = idx + 1
+      per_chunk = [n for first, n, _ in stsc if first <= chunk][-1]
+      for _ in range(per_chunk):
+        if sample == count:
+          break
+        self.offsets.append(chunk_offset)
+        chunk_offset += self.sizes[sample]
+        sample += 1
+
+    assert len(self.offsets) == count, 'Sample table mismatch, {} offsets ' \
+        'for {} samples'.format(len(self.offsets), count)
+
+  def __len__(self):
+
+    return len(self.sizes)
+
+  def keyframe(self, frame):
+
+    """Last key frame at or before frame"""
+
+    idx = bisect.bisect_right(self.keyframes, frame) - 1
+    return self.keyframes[max(idx, 0)]
+
+  def seconds(self, frame):
+
+    """Presentation time of frame, from the start of the video"""
+
+    pts = self.times[frame] + self.composition[frame] - self.start_time
+    return pts / float(self.timescale)
+
+  def byte_ranges(self, start_frame, end_frame):
+
+    """Merged inclusive byte ranges holding the frames [start, end]"""
+
+    ranges = []
+
+    for frame in range(start_frame, end_frame + 1):
+      start = self.offsets[frame]
+      end = start + self.sizes[frame] - 1
+      if ranges and ranges[-1][1] + 1 >= start:
+        ranges[-1][1] = max(ranges[-1][1], end)
+      else:
+        ranges.append([start, end])
+
+    return [tuple(r) for r in ranges]
+
+
+class RemoteVideo(object):
+
+  """MP4 video on S3 read through range GETs
+
+    Args:
+      s3_connector: Connected S3Connector
+      s3_key: Key of the video, or of the bundle holding it
+      size: Size of the video in bytes
+      base_offset: Offset of the video within the object (bundle member)
+  """
+
+  def __init__(self, s3_connector, s3_key, size, base_offset=0):
+
+    self.s3_connector = s3_connector
+    self.s3_key = s3_key
+    self.size = size
+    self.base_offset = base_offset
+    self.boxes = []
+
+  def read(self, start, end):
+
+    return self.s3_connector.get_range(self.s3_key, self.base_offset + start,
+                                       self.base_offset + end)
+
+  def read_header(self):
+
+    """Reads every top level box but the mdat payload, returns a VideoIndex
+
+      One small range GET per top level box header plus one per box, the
+      moov box is usually far smaller than the video.
+    """
+
+    offset = 0
+    moov = None
+
+    while offset < self.size:
+
+      header = self.read(offset, min(offset + MP4_BOX_HEADER, self.size) - 1)
+      size, box_type, header_size = parse_box_header(header)
+      size = self.size - offset if size is None else size
+
+      # mdat keeps its header only, samples are read by frame
+      if box_type == b'mdat':
+        self.boxes.append((offset, header[:header_size]))
+      else:
+        data = self.read(offset, offset + size - 1)
+        self.boxes.append((offset, data))
+        if box_type == b'moov':
+          moov = data
+
+      offset += size
+
+    if moov is None:
+      raise ValueError('No moov box in {}'.format(self.s3_key))
+
+    return VideoIndex(moov)
+
+  def fetch_frames(self, start_frame, end_frame, clip_path, jobs=None):
+
+    """Fetches the GOPs covering [start_frame, end_frame] into a local clip
+
+      Header boxes and the needed samples are written at their offsets into
+      a sparse copy of the video, which is then remuxed (stream copy) into
+      clip_path. Clips start at the key frame preceding start_frame.
+
+      Returns:
+        First frame of the clip (key frame)
+        Last frame of the clip
+    """
+
+    index = self.read_header()
+
+    end_frame = min(end_frame, len(index) - 1)
+    assert 0 <= start_frame <= end_frame, 'Invalid frame window ' \
+        '[{}, {}] for {} frames'.format(start_frame, end_frame, len(index))
+
+    key_frame = index.keyframe(start_frame)
+    ranges = index.byte_ranges(key_frame, end_frame)
+
+    logger.info('Fetching frames [{}, {}] of {}, {} bytes in {} '
+                'ranges'.format(key_frame, end_frame, self.s3_key,
+                                sum(e - s + 1 for s, e in ranges),
+                                len(ranges)))
+
+    sparse_path = clip_path + config.S3_PARTIAL_SUFFIX
+    fd = os.open(sparse_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+
+    try:
+
+      os.ftruncate(fd, self.size)
+      for offset, data in self.boxes:
+        os.pwrite(fd, data, offset)
+
+      def fetch_range(start, end):
+        return os.pwrite(fd, self.read(start, end), start) == end - start + 1
+
+      pool = TransferPool(jobs=jobs, desc='Fetching frames')
+      flags, failures = pool.run(fetch_range, ranges,
+                                 sizes=[e - s + 1 for s, e in ranges])
+      pool.summarize(failures, len(ranges))
+
+    finally:
+      os.close(fd)
+
+    if not all(flags):
+      os.remove(sparse_path)
+      raise IOError('Failed to fetch frames of {}'.format(self.s3_key))
+
+    clip_args = {'c:v': 'copy', 'frames': end_frame - key_frame + 1}
+
+    vid = ffmpeg.input(sparse_path, ss=round(index.seconds(key_frame), 3))
+    clip = ffmpeg.output(vid.video, clip_path, **clip_args)
+    clip.overwrite_output().run(capture_stdout=True, capture_stderr=True)
+
+    os.remove(sparse_path)
+
+    return key_frame, end_frame
+
+
+def frame_window(sensor_rows, start, end, by_time=False):
+
+  """Maps a window onto video frames with the camera rows of a sequence
+
+    Args:
+      sensor_rows: sensordata.avro rows of the sequence
+      start: First frame, or seconds from the first camera frame
+      end: Last frame, or seconds from the first camera frame
+      by_time: Window given in seconds (cam_time_stamp)
+
+    Returns:
+      First and last frame (bsens_seq_frame) in the window
+  """
+
+  if not by_time:
+    return int(start), int(end)
+
+  rows = [r for r in sensor_rows if r['sensor_modality_type'] == 'camera']
+  rows = [r for r in rows if r['bsens_seq_frame'] is not None]
+  rows = [r for r in rows if r['cam_time_stamp'] is not None]
+  assert len(rows), 'No camera time stamps in sensor data'
+
+  begin = min(r['cam_time_stamp'] for r in rows)
+  start_us, end_us = begin + start * 1e6, begin + end * 1e6
+
+  frames = [r['bsens_seq_frame'] for r in rows
+            if start_us <= r['cam_time_stamp'] <= end_us]
+  assert len(frames), 'No camera frames in [{}, {}] s'.format(start, end)
+
+  return min(frames), max(frames)
@@ -0,0 +1,382 @@
+import io
+import re
+import copy
+import json
+import functools
+from pathlib import Path
+
+from avro.datafile import DataFileReader, DataFileWriter, VALID_CODECS
+from avro.io import DatumReader, DatumWriter
+from avro.schema import Parse as schema_parser
+
+from fleet.configs import drive_config as config
+from fleet.utils.avro_validator import compile_validator
+
+try:
+  import fastavro
+except ImportError:
+  fastavro = None
+
+logger = config.get_logger(__name__)
+
+AVRO_BACKENDS = ['fastavro', 'avro']
+AVRO_LAYOUTS = ['table', 'rows']
+# header metadata of rows layout files, the {table: [rows]} schema
+TABLE_SCHEMA_META = 'fleet.table.schema'
+# short names of avro codecs
+CODEC_ALIASES = {'zstd': 'zstandard'}
+
+
+def get_backend(backend=None):
+
+  """Avro serialization backend, fastavro (C extension) when installed
+
+    Args:
+      backend: One of AVRO_BACKENDS or 'auto', defaults to
+        config.AVRO_BACKEND
+  """
+
+  backend = backend if backend is not None else config.AVRO_BACKEND
+
+  if backend == 'auto':
+    return 'fastavro' if fastavro is not None else 'avro'
+
+  assert backend in AVRO_BACKENDS, 'Unknown avro backend {}, expected ' \
+      'one of {}'.format(backend, AVRO_BACKENDS)
+
+  if backend == 'fastavro' and fastavro is None:
+    raise ImportError('fastavro is not installed')
+
+  return backend
+
+
+@functools.lru_cache(maxsize=None)
+def _fastavro_writes(codec):
+
+  # codecs missing their library (f.ex cramjam) only fail on write
+  try:
+    fastavro.writer(io.BytesIO(), 'null', [None], codec=codec)
+    return True
+  except ValueError:
+    return False
+
+
+def available_codecs(backend=None):
+
+  """Block codecs written by backend, and read by avro (every reader)"""
+
+  backend = get_backend(backend)
+
+  return sorted(codec for codec in VALID_CODECS
+                if backend == 'avro' or _fastavro_writes(codec))
+
+
+def get_codec(codec=None, backend=None):
+
+  """Block codec of writers, see config.AVRO_CODEC
+
+    Args:
+      codec: Avro codec name or alias (zstd), defaults to config.AVRO_CODEC
+      backend: See get_backend
+  """
+
+  codec = codec if codec is not None else config.AVRO_CODEC
+  codec = CODEC_ALIASES.get(codec, codec)
+  codecs = available_codecs(backend)
+
+  if codec not in codecs:
+    raise ValueError('Avro codec {} is not available, expected one of {} '
+                     '(snappy and zstandard need their compression '
+                     'libraries)'.format(codec, codecs))
+
+  return codec
+
+
+def get_layout(avro_schema_version=None):
+
+  """Avro file layout written for a schema version, see config.AVRO_LAYOUT
+
+    Args:
+      avro_schema_version: f.ex v4, defaults to the schema submodule version
+  """
+
+  if avro_schema_version is None and config.AVRO_LAYOUT is not None:
+    return config.AVRO_LAYOUT
+
+  avro_schema_version = avro_schema_version or \
+      config.get_avro_schema_version()
+  version = re.match(r'v(\d+)', avro_schema_version or '')
+  version = int(version.group(1)) if version is not None else 0
+
+  if version >= config.AVRO_ROWS_SCHEMA_VERSION:
+    return 'rows'
+
+  return 'table'
+
+
+def row_schema(schema):
+
+  """Row record of a {table: [rows]} schema"""
+
+  return schema.fields[0].type.items
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_schema(schema_json):
+
+  return schema_parser(schema_json)
+
+
+def read_layout(reader):
+
+  """Layout of an open avro DataFileReader and its {table: [rows]} schema"""
+
+  table_schema = reader.GetMeta(TABLE_SCHEMA_META)
+  if table_schema is None:
+    return 'table', reader.datum_reader.writer_schema
+
+  return 'rows', _parse_schema(table_schema.decode('utf-8'))
+
+
+def read_table(avro_file):
+
+  """Reads a table written in either layout
+
+    Args:
+      avro_file: Path or binary file object
+
+    Returns:
+      Table {table_name: rows}
+      Schema of the table
+      Layout of the file
+  """
+
+  if not hasattr(avro_file, 'read'):
+    with Path(avro_file).open('rb') as pfile:
+      return read_table(pfile)
+
+  reader = DataFileReader(avro_file, DatumReader())
+  layout, schema = read_layout(reader)
+
+  if layout == 'rows':
+    return {schema.fields[0].name: list(reader)}, schema, layout
+
+  return next(reader), schema, layout
+
+
+def project_schema(schema_json, fields, layout='table'):
+
+  """Schema JSON keeping fields of the rows, of a {table: [rows]} schema
+    or of a row schema (rows layout)
+  """
+
+  projected = copy.deepcopy(schema_json)
+  items = projected['fields'][0]['type']['items'] if layout == 'table' \
+      else projected
+  items['fields'] = [f for f in items['fields'] if f['name'] in fields]
+
+  return projected
+
+
+def _fastavro_reader(avro_file, fields):
+
+  # the layout and writer schema are in the header, read twice to decode
+  # with the projected reader schema
+  start = avro_file.tell()
+  metadata = fastavro.reader(avro_file).metadata
+  layout = 'rows' if TABLE_SCHEMA_META in metadata else 'table'
+
+  reader_schema = None
+  if fields is not None:
+    reader_schema = project_schema(json.loads(metadata['avro.schema']),
+                                   fields, layout)
+
+  avro_file.seek(start)
+  return fastavro.reader(avro_file, reader_schema=reader_schema), layout
+
+
+def _avro_reader(avro_file, fields):
+
+  reader = DataFileReader(avro_file, DatumReader())
+  layout, _ = read_layout(reader)
+
+  if fields is not None:
+    writer_schema = reader.datum_reader.writer_schema
+    reader.datum_reader.reader_schema = schema_parser(json.dumps(
+        project_schema(writer_schema.to_json(), fields, layout)))
+
+  return reader, layout
+
+
+def read_rows(avro_file, fields=None, backend=None):
+
+  """Streams the rows of a table written in either layout
+
+    Args:
+      avro_file: Seekable binary file object
+      fields: Row fields decoded, other fields are skipped without being
+        materialised, defaults to every field
+      backend: See get_backend
+
+    Yields:
+      Rows of the table
+  """
+
+  if get_backend(backend) == 'fastavro':
+    reader, layout = _fastavro_reader(avro_file, fields)
+  else:
+    reader, layout = _avro_reader(avro_file, fields)
+
+  for datum in reader:
+    if layout == 'rows':
+      yield datum
+      continue
+    for rows in datum.values():
+      yield from rows
+
+
+class _DataFileWriter(DataFileWriter):
+
+  # DataFileWriter flushing blocks past sync_interval bytes, avro flushes
+  # them past a fixed SYNC_INTERVAL (16 kB)
+
+  def __init__(self, writer, datum_writer, writer_schema, codec,
+               sync_interval):
+
+    super().__init__(writer, datum_writer, writer_schema, codec=codec)
+    self.sync_interval = sync_interval
+
+  def append(self, datum):
+
+    self.datum_writer.write(datum, self.buffer_encoder)
+    self._block_count += 1
+
+    if self._buffer_writer.tell() >= self.sync_interval:
+      self._WriteBlock()
+
+
+def _write_avro(pfile, datums, schema, codec, sync_interval,
+                sync_marker=None, validate=True, metadata=None):
+
+  writer = _DataFileWriter(pfile, DatumWriter(), schema, codec,
+                           sync_interval)
+  if sync_marker is not None:
+    writer._sync_marker = sync_marker
+
+  # header metadata in the order fastavro writes it, schema last
+  for key, value in (metadata or {}).items():
+    writer.SetMeta(key, value)
+  writer.meta['avro.schema'] = writer.meta.pop('avro.schema')
+
+  for datum in datums:
+    writer.append(datum)
+
+  writer.flush()
+
+
+def _validated(datums, schema):
+
+  # datums checked as they are written, datums may be a generator
+  validator = compile_validator(schema)
+
+  for datum in datums:
+    if not validator(datum):
+      raise ValueError('Datum does not match schema {}'.format(
+          getattr(schema, 'fullname', schema.type)))
+    yield datum
+
+
+def _write_fastavro(pfile, datums, schema, codec, sync_interval,
+                    sync_marker=None, validate=True, metadata=None):
+
+  # avro validates every datum it writes, fastavro does not, readers (f.ex
+  # validate --trust-header) rely on datums matching the header schema
+  if validate:
+    datums = _validated(datums, schema)
+
+  # header metadata and blocks as _DataFileWriter writes them, the schema
+  # JSON is str(schema) and a block is flushed past sync_interval bytes
+  fastavro.writer(pfile, json.loads(str(schema)), datums, codec=codec,
+                  metadata=dict({'avro.codec': codec}, **(metadata or {})),
+                  sync_interval=sync_interval,
+                  sync_marker=sync_marker or b'')
+
+
+def write_avro(avro_file, datums, schema, backend=None, sync_marker=None,
+               validate=True, metadata=None, codec=None, sync_interval=None):
+
+  """Writes datums to an avro container file
+
+    Backends produce the same bytes for the same sync marker (random
+    otherwise) and codec (null, deflate, bzip2, xz), files are readable by
+    either.
+
+    Args:
+      avro_file: Path or binary file object
+      datums: Iterable of datums, f.ex [{table_name: rows}]
+      schema: Parsed avro schema
+      backend: See get_backend
+      sync_marker: 16 bytes, for reproducible files
+      validate: Validate datums before writing them, False for datums
+        validated already (avro validates regardless)
+      metadata: Dict of extra header metadata
+      codec: Block codec, see get_codec
+      sync_interval: Block size (bytes before compression), defaults to
+        config.AVRO_SYNC_INTERVAL
+  """
+
+  backend = get_backend(backend)
+  write_fn = _write_fastavro if backend == 'fastavro' else _write_avro
+
+  codec = get_codec(codec, backend)
+  sync_interval = sync_interval if sync_interval is not None \
+      else config.AVRO_SYNC_INTERVAL
+
+  if hasattr(avro_file, 'write'):
+    write_fn(avro_file, datums, schema, codec, sync_interval, sync_marker,
+             validate, metadata)
+    return
+
+  with Path(avro_file).open('wb') as pfile:
+    write_fn(pfile, datums, schema, codec, sync_interval, sync_marker,
+             validate, metadata)
+
+
+def write_table(avro_file, table, schema, layout=None, **kwargs):
+
+  """Writes a {table_name: rows} table in the given layout
+
+    The table layout holds the whole table in one record, the rows layout
+    one record per row (rows schema, see row_schema) so readers can stream
+    rows and split files at block boundaries. Rows layout files keep the
+    table schema in their header.
+
+    Args:
+      avro_file: Path or binary file object
+      table: Dict {table_name: rows}
+      schema: Schema of the table
+      layout: One of AVRO_LAYOUTS, defaults to get_layout()
+      kwargs: See write_avro
+  """
+
+  layout = layout if layout is not None else get_layout()
+  assert layout in AVRO_LAYOUTS, 'Unknown avro layout {}, expected one ' \
+      'of {}'.format(layout, AVRO_LAYOUTS)
+
+  if layout == 'table':
+    write_avro(avro_file, [table], schema, **kwargs)
+    return
+
+  rows = table[schema.fields[0].name]
+  write_avro(avro_file, rows, row_schema(schema),
+             metadata={TABLE_SCHEMA_META: str(schema)}, **kwargs)
+
+
+def encode_avro(datums, schema, **kwargs):
+
+  """Avro container file bytes of datums, see write_avro"""
+
+  buf = io.BytesIO()
+  write_avro(buf, datums, schema, **kwargs)
+
+  return buf.getvalue()
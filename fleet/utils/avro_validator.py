@@ -0,0 +1,139 @@
+import threading
+
+from avro.io import INT_MIN_VALUE, INT_MAX_VALUE, LONG_MIN_VALUE, \
+    LONG_MAX_VALUE
+
+# compiled validators by id of the schema object, with the schema kept alive
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+class _ValidatorCompiler(object):
+
+  """Generates the python source of a validator for an avro schema
+
+    Records, arrays and maps become functions returning a bool, other
+    types inline expressions over a local variable. The generated checks
+    accept exactly the datums avro.io.Validate accepts.
+  """
+
+  def __init__(self):
+
+    self.functions = []
+    self.names = {}
+    self.env = {'INT_MIN': INT_MIN_VALUE, 'INT_MAX': INT_MAX_VALUE,
+                'LONG_MIN': LONG_MIN_VALUE, 'LONG_MAX': LONG_MAX_VALUE}
+
+  def constant(self, value):
+
+    name = '_c{}'.format(len(self.env))
+    self.env[name] = value
+    return name
+
+  def expr(self, schema, var):
+
+    kind = schema.type
+
+    if kind == 'null':
+      return '{} is None'.format(var)
+    if kind == 'boolean':
+      return 'isinstance({}, bool)'.format(var)
+    if kind == 'string':
+      return 'isinstance({}, str)'.format(var)
+    if kind == 'bytes':
+      return 'isinstance({}, bytes)'.format(var)
+    if kind == 'int':
+      return '(isinstance({0}, int) and INT_MIN <= {0} <= INT_MAX)'.format(var)
+    if kind == 'long':
+      return '(isinstance({0}, int) and LONG_MIN <= {0} <= LONG_MAX)'.format(
+          var)
+    if kind in ('float', 'double'):
+      return 'isinstance({}, (int, float))'.format(var)
+    if kind == 'fixed':
+      return '(isinstance({0}, bytes) and len({0}) == {1})'.format(
+          var, schema.size)
+    if kind == 'enum':
+      return '{} in {}'.format(var, self.constant(tuple(schema.symbols)))
+    if kind in ('union', 'error_union'):
+      return '({})'.format(' or '.join(self.expr(branch, var)
+                                       for branch in schema.schemas))
+    if kind in ('array', 'map', 'record', 'error', 'request'):
+      return '{}({})'.format(self.function(schema), var)
+
+    raise ValueError('Unsupported avro type {}'.format(kind))
+
+  def function(self, schema):
+
+    # named schemas (records) are compiled once, recursive references
+    # resolve to the function being generated
+    key = getattr(schema, 'fullname', None) or id(schema)
+    if key in self.names:
+      return self.names[key]
+
+    name = '_v{}'.format(len(self.names))
+    self.names[key] = name
+
+    if schema.type == 'array':
+      body = ['  if not isinstance(d, list):',
+              '    return False',
+              '  for v in d:',
+              '    if not {}:'.format(self.expr(schema.items, 'v')),
+              '      return False']
+    elif schema.type == 'map':
+      body = ['  if not isinstance(d, dict):',
+              '    return False',
+              '  for k, v in d.items():',
+              '    if not isinstance(k, str) or not {}:'.format(
+                  self.expr(schema.values, 'v')),
+              '      return False']
+    else:
+      fields = self.constant(frozenset(f.name for f in schema.fields))
+      body = ['  if not isinstance(d, dict) or not {}.issuperset(d):'.format(
+          fields), '    return False']
+      for field in schema.fields:
+        body += ['  v = d.get({!r})'.format(field.name),
+                 '  if not {}:'.format(self.expr(field.type, 'v')),
+                 '    return False']
+
+    body += ['  return True']
+    self.functions.append('\n'.join(['def {}(d):'.format(name)] + body))
+    return name
+
+  def compile(self, schema):
+
+    expr = self.expr(schema, 'd')
+    source = '\n\n'.join(self.functions + [
+        'def validate(d):\n  return bool({})'.format(expr)])
+    exec(compile(source, '<avro validator {}>'.format(
+        getattr(schema, 'fullname', schema.type)), 'exec'), self.env)
+
+    return self.env['validate']
+
+
+def compile_validator(schema):
+
+  """Validation function of schema, compiled once per schema object
+
+    Args:
+      schema: Parsed avro schema
+
+    Returns:
+      Function datum -> bool, equivalent to avro.io.Validate(schema, datum)
+  """
+
+  entry = _validators.get(id(schema))
+  if entry is not None and entry[0] is schema:
+    return entry[1]
+
+  with _validators_lock:
+    validator = _ValidatorCompiler().compile(schema)
+    _validators[id(schema)] = (schema, validator)
+
+  return validator
+
+
+def validate(schema, datum):
+
+  """Drop in replacement of avro.io.Validate using compiled validators"""
+
+  return compile_validator(schema)(datum)
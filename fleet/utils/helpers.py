@@ -1,15 +1,17 @@
 import os
 import yaml
 import json
+import hashlib
 from pathlib import Path
 
-from avro.io import Validate
 from avro.schema import Parse as schema_parser
 from avro.datafile import DataFileReader
 from avro.io import DatumReader
 from moviepy.editor import VideoFileClip
 
 from fleet.configs import drive_config as config
+from fleet.utils.avro_io import read_layout, row_schema
+from fleet.utils.avro_validator import compile_validator
 
 logger = config.get_logger(__name__)
 
@@ -103,15 +105,55 @@ def read_avro_schemas(schema_path):
   return schemas
 
 
-def validate_with_schema(avro_file_path, schema):
+def validate_with_schema(avro_file_path, schema, trust_header=False):
+
+  """Validates an avro file (or file object) against schema
+
+    The writer schema in the file header is checked first. avro writers
+    validate every datum against their schema, with trust_header a header
+    holding the expected schema vouches for the rows, which are then not
+    read (f.ex for files streamed from S3). Rows of files written with
+    another schema are always validated.
+  """
+
+  # file objects f.ex members of a sequence bundle
+  if hasattr(avro_file_path, 'read'):
+    return _validate_fileobj(avro_file_path, schema, trust_header)
 
   try:
 
     with open(avro_file_path.as_posix(), 'rb') as pfile:
-      datum = DataFileReader(pfile, DatumReader())
-      datum = [d for d in datum]
-    assert Validate(schema, datum[0]), \
-        'Error validating {}'.format(avro_file_path)
+      return _validate_fileobj(pfile, schema, trust_header)
+
+  except Exception as err:
+    logger.error('Error validating {}, {}'.format(avro_file_path, err))
+    return False
+
+
+def _validate_fileobj(pfile, schema, trust_header=False):
+
+  avro_file_path = getattr(pfile, 'name', pfile)
+
+  try:
+
+    reader = DataFileReader(pfile, DatumReader())
+
+    # rows layout files hold one row per datum, an empty table no datum
+    layout, _ = read_layout(reader)
+    if layout == 'rows':
+      schema = row_schema(schema)
+
+    writer_digest = schema_digest(reader.datum_reader.writer_schema)
+    if writer_digest == schema_digest(schema):
+      if trust_header:
+        return True
+    else:
+      logger.info('{} written with schema {}, expected {}, validating '
+                  'rows'.format(avro_file_path, writer_digest,
+                                schema_digest(schema)))
+
+    error = stream_validate(reader, schema, allow_empty=layout == 'rows')
+    assert error is None, error
     return True
 
   except Exception as err:
@@ -119,6 +161,142 @@ def validate_with_schema(avro_file_path, schema):
     return False
 
 
+def schema_digest(schema):
+
+  """Fingerprint of a parsed avro schema, equal for equal schemas"""
+
+  schema_json = json.dumps(schema.to_json(), sort_keys=True)
+  return hashlib.sha1(schema_json.encode()).hexdigest()[:16]
+
+
+def stream_validate(reader, schema, allow_empty=False):
+
+  """Validates every datum of an avro file without materialising them
+
+    Datums are decoded field by field and array fields item by item, each
+    item validated and dropped before the next is decoded, so memory does
+    not grow with the number of rows of a {table: [rows]} datum (beyond
+    the decompressed block for compressed files). Stops at the first
+    invalid row.
+
+    Args:
+      reader: avro DataFileReader
+      schema: Expected schema of the datums
+      allow_empty: Accept files without datums
+
+    Returns:
+      None if valid, else a description of the first error
+  """
+
+  datum_reader = reader.datum_reader
+  writer_schema = datum_reader.writer_schema
+  datums = 0
+
+  for decoder in _iter_datum_decoders(reader):
+
+    error = _validate_datum(datum_reader, writer_schema, schema, decoder)
+    if error is not None:
+      return 'datum {}, {}'.format(datums, error)
+
+    datums += 1
+
+  return None if datums or allow_empty else 'no datum found'
+
+
+def _iter_datum_decoders(reader):
+
+  # DataFileReader.__next__, yielding the decoder instead of the datum. A
+  # sync marker must follow every block (the header ends with one), unlike
+  # __next__ which never gets past a corrupt block missing it
+  synced = True
+
+  while True:
+
+    while reader.block_count == 0:
+      if reader.is_EOF():
+        return
+      if not synced and not reader._skip_sync():
+        raise ValueError('no sync marker at byte {}, corrupt block'.format(
+            reader.reader.tell()))
+      if reader.is_EOF():
+        return
+      reader._read_block_header()
+      synced = False
+
+    yield reader.datum_decoder
+    reader._block_count -= 1
+
+
+def _validate_datum(datum_reader, writer_schema, schema, decoder):
+
+  if writer_schema.type != 'record' or schema.type != 'record':
+    datum = datum_reader.read_data(writer_schema, writer_schema, decoder)
+    return None if compile_validator(schema)(datum) else 'invalid datum'
+
+  fields = schema.field_map
+
+  for field in writer_schema.fields:
+
+    expected = fields.get(field.name)
+    if expected is None:
+      return 'unexpected field {}'.format(field.name)
+
+    if field.type.type == 'array' and expected.type.type == 'array':
+      error = _validate_items(datum_reader, field.type.items,
+                              expected.type.items, decoder)
+      if error is not None:
+        return '{} {}'.format(field.name, error)
+      continue
+
+    value = datum_reader.read_data(field.type, field.type, decoder)
+    if not compile_validator(expected.type)(value):
+      return 'invalid field {}'.format(field.name)
+
+  for name, field in fields.items():
+    if name in writer_schema.field_map:
+      continue
+    if not compile_validator(field.type)(None):
+      return 'missing field {}'.format(name)
+
+  return None
+
+
+def _validate_items(datum_reader, writer_items, items, decoder):
+
+  # arrays are encoded as blocks of items, ended by an empty block
+  idx = 0
+  validate_item = compile_validator(items)
+  block_count = decoder.read_long()
+
+  while block_count != 0:
+
+    if block_count < 0:
+      block_count = -block_count
+      decoder.skip_long()
+
+    for _ in range(block_count):
+
+      item = datum_reader.read_data(writer_items, writer_items, decoder)
+      if not validate_item(item):
+        return 'row {}{}'.format(idx, _invalid_fields(items, item))
+
+      idx += 1
+
+    block_count = decoder.read_long()
+
+  return None
+
+
+def _invalid_fields(schema, item):
+
+  if schema.type != 'record' or not isinstance(item, dict):
+    return ''
+
+  invalid = [field.name for field in schema.fields
+             if not compile_validator(field.type)(item.get(field.name))]
+  return ', invalid fields {}'.format(invalid) if invalid else ''
+
+
 def list_dir(source_path, ext, with_prefix=False):
 
   pobj = Path(source_path)
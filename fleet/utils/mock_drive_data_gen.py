@@ -1,15 +1,43 @@
 import os
 import uuid
 import json
+import random
 from datetime import datetime
-from avro.datafile import DataFileWriter
-from avro.io import DatumWriter
 from fleet.configs.drive_config import get_logger
+from fleet.utils.avro_io import write_table
 
 # Explaination here :
 # https://gitlab.mobilityservices.io/am/roam/perception/data-catalogue/wikis/Drive-Data-Storage-Schema
 logger = get_logger(__name__)
 
+MOCK_VALUES = {'null': lambda: None, 'boolean': lambda: True,
+               'string': lambda: str(uuid.uuid4()), 'bytes': lambda: b'',
+               'int': lambda: random.randint(0, 2 ** 16),
+               'long': lambda: random.randint(0, 2 ** 48),
+               'float': random.random, 'double': random.random}
+
+
+def build_mock_datum(schema, rows):
+
+  """Random datum of an avro schema, arrays of records get rows items"""
+
+  if schema.type == 'record':
+    return {f.name: build_mock_datum(f.type, rows) for f in schema.fields}
+  if schema.type == 'array':
+    size = rows if schema.items.type == 'record' else 4
+    return [build_mock_datum(schema.items, rows) for _ in range(size)]
+  if schema.type == 'map':
+    return {'key': build_mock_datum(schema.values, rows)}
+  if schema.type == 'union':
+    branches = [s for s in schema.schemas if s.type != 'null']
+    return build_mock_datum(branches[0], rows) if branches else None
+  if schema.type == 'enum':
+    return schema.symbols[0]
+  if schema.type == 'fixed':
+    return bytes(schema.size)
+
+  return MOCK_VALUES[schema.type]()
+
 
 def build_mock_diary(log_path, **kwargs):
 
@@ -155,10 +183,7 @@ def save_table_dump(table_name, meta, save_path, avro_schema):
 
     avro_path = os.path.join(save_path, table_name + ".avro")
 
-    avro_file = open(avro_path, "wb")
-    avro_writer = DataFileWriter(avro_file, DatumWriter(), avro_schema)
-    avro_writer.append(meta)
-    avro_writer.close()
+    write_table(avro_path, meta, avro_schema)
 
   except Exception as err:
     logger.error("Error saving {}, {}".format(table_name, err))
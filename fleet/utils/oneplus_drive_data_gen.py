@@ -6,13 +6,11 @@ import collections
 import ntpath
 
 from avro.schema import Parse as schema_parser
-from avro.io import Validate as validate
-
-from avro.datafile import DataFileWriter
-from avro.io import DatumWriter
 
 import fleet.drive_ops.helpers as hps
 from fleet.configs import drive_config as config
+from fleet.utils.avro_io import get_layout, write_table
+from fleet.utils.avro_validator import validate
 from fleet.utils.helpers import read_avro_schemas
 
 logger = config.get_logger(__name__)
@@ -31,6 +29,7 @@ class DriveDataGenerator:
 
     self.schema_dict = read_avro_schemas(schema_path)
     self.schema_dict_fast = {}
+    self.layout = get_layout()
 
     self.diary_dict = collections.OrderedDict()
     self.data_dict = collections.OrderedDict()
@@ -412,9 +411,8 @@ class DriveDataGenerator:
     logger.info("")
     logger.info("saving {}".format(ntpath.basename(file_name_out)))
 
-    with DataFileWriter(open(file_name_out, "wb"),
-                        DatumWriter(), schema) as writer:
-        writer.append(table_dict)
+    write_table(file_name_out, table_dict, schema, layout=self.layout,
+                validate=False)
 
     logger.info("...done")
 
@@ -11,11 +11,10 @@ import ffmpeg
 from numpy import trapz
 from prettytable import PrettyTable
 from avro.schema import Parse as schema_parser
-from avro.io import Validate as validate
-from avro.datafile import DataFileWriter
-from avro.io import DatumWriter
 
 from fleet.configs import drive_config as config
+from fleet.utils.avro_io import get_layout, write_table
+from fleet.utils.avro_validator import validate
 
 logger = config.get_logger(__name__)
 
@@ -35,6 +34,7 @@ class DriveDataGenerator:
                    '- path does not exist: '.format(schema_path))
 
     self.schema_dict = self.read_schemas(schema_path)
+    self.layout = get_layout()
 
     self.collection = {name: collections.OrderedDict()
                        for name in config.DRIVE_DATA_AVRO_TABLE_NAMES}
@@ -329,9 +329,8 @@ class DriveDataGenerator:
     assert validate(schema, table_dict), \
         'Error validating with avro schema {}'.format(schema_name)
 
-    with DataFileWriter(open(avro_file_path, 'wb'),
-                        DatumWriter(), schema) as writer:
-        writer.append(table_dict)
+    write_table(avro_file_path, table_dict, schema, layout=self.layout,
+                validate=False)
 
   def save_drive(self, vid_path, vid_meta, drive, drives_dest):
 
@@ -0,0 +1,121 @@
+import io
+import re
+import time
+import argparse
+from pathlib import Path
+
+from fleet.configs import drive_config as cfg
+from fleet.s3_ops.bundle import open_sequence_member
+from fleet.utils.avro_io import available_codecs, get_layout, read_table, \
+    write_table
+
+logger = cfg.get_logger(__name__)
+
+
+def read_sequence_tables(source, max_sequences):
+
+  """Tables of the sequences of a diary on disk, per avro file name"""
+
+  sequence_uris = sorted(uri for uri in Path(source).rglob('sequences/*')
+                         if uri.is_dir() and re.match(
+                             cfg.DRIVE_SEQUENCE_URI_PATTERN, uri.name))
+  sequence_uris = sequence_uris[:max_sequences]
+  assert sequence_uris, 'No sequences found at {}'.format(source)
+
+  tables = {avro_name: [] for avro_name, _ in cfg.DRIVE_SEQUENCE_AVROS}
+
+  for sequence_uri in sequence_uris:
+    for avro_name in tables:
+      with open_sequence_member(sequence_uri, avro_name) as pfile:
+        table, schema, _ = read_table(pfile)
+      tables[avro_name].append((table, schema))
+
+  return len(sequence_uris), tables
+
+
+def timed(tables, layout, codec, sync_interval, repeats):
+
+  """Bytes, encode and decode seconds of tables, summed over tables"""
+
+  size, encode, decode = 0, 0.0, 0.0
+
+  for table, schema in tables:
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+      buf = io.BytesIO()
+      write_table(buf, table, schema, layout=layout, codec=codec,
+                  sync_interval=sync_interval, validate=False)
+    encode += (time.perf_counter() - start) / repeats
+
+    data = buf.getvalue()
+    size += len(data)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+      assert read_table(io.BytesIO(data))[0] == table
+    decode += (time.perf_counter() - start) / repeats
+
+  return size, encode, decode
+
+
+def benchmark(args):
+
+  count, tables = read_sequence_tables(args.source, args.sequences)
+  codecs = args.codecs or available_codecs()
+  layout = args.layout or get_layout()
+
+  logger.info('{} sequences of {}, {} layout, codecs {}'.format(
+      count, args.source, layout, codecs))
+
+  for avro_name, sequence_tables in tables.items():
+
+    baseline = None
+
+    for codec in ['null'] + [c for c in codecs if c != 'null']:
+      for sync_interval in args.sync_intervals:
+
+        size, encode, decode = timed(sequence_tables, layout, codec,
+                                     sync_interval, args.repeats)
+        baseline = baseline or size
+
+        logger.info('{:>16} : {:>9} {:5d} kB blocks, {:8.2f} MB ({:5.1f}%), '
+                    'encode {:8.2f} ms, decode {:8.2f} ms'.format(
+                        avro_name, codec, sync_interval // 1024,
+                        size / 1024 ** 2, 100.0 * size / baseline,
+                        encode * 1000.0, decode * 1000.0))
+
+        if codec == 'null':
+          break
+
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser('Benchmarking avro block codecs, size '
+                                   'against encode / decode time, on the '
+                                   'sequences of a diary')
+
+  parser.add_argument('-s', '--source', dest='source', required=True,
+                      help='Drive diary on disk (f.ex fetched waylens '
+                      'diary), loose or bundled sequences')
+  parser.add_argument('-m', '--sequences', dest='sequences', type=int,
+                      default=10, help='Sequences read from the diary')
+  parser.add_argument('-c', '--codecs', dest='codecs', nargs='+',
+                      default=None,
+                      help='Codecs compared, defaults to every available '
+                      'codec')
+  parser.add_argument('-b', '--sync-intervals', dest='sync_intervals',
+                      type=int, nargs='+',
+                      default=[16 * 1024, cfg.AVRO_SYNC_INTERVAL,
+                               1024 * 1024],
+                      help='Block sizes (bytes) compared')
+  parser.add_argument('-l', '--layout', dest='layout', default=None,
+                      choices=['table', 'rows'],
+                      help='Layout written, defaults to the layout of the '
+                      'schema version')
+  parser.add_argument('-n', '--repeats', dest='repeats', type=int, default=3,
+                      help='Encodings / decodings per table')
+
+  args = parser.parse_args()
+
+  benchmark(args)
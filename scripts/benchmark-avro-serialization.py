@@ -0,0 +1,68 @@
+import os
+import time
+import argparse
+
+from fleet.configs import drive_config as cfg
+from fleet.utils.helpers import read_avro_schemas
+from fleet.utils.avro_io import AVRO_BACKENDS, encode_avro, get_backend
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+logger = cfg.get_logger(__name__)
+
+
+def timed(backend, datum, schema, repeats, sync_marker, validate):
+
+  start = time.perf_counter()
+  for _ in range(repeats):
+    data = encode_avro([datum], schema, backend=backend,
+                       sync_marker=sync_marker, validate=validate)
+  return (time.perf_counter() - start) / repeats, data
+
+
+def benchmark(args):
+
+  assert get_backend('auto') == 'fastavro', 'fastavro is not installed'
+
+  schemas = read_avro_schemas(args.schema_path)
+  sync_marker = os.urandom(16)
+
+  for name, schema in sorted(schemas.items()):
+
+    datum = build_mock_datum(schema, args.rows)
+
+    times, encoded = {}, {}
+    for backend in AVRO_BACKENDS:
+      times[backend], encoded[backend] = timed(
+          backend, datum, schema, args.repeats, sync_marker,
+          not args.skip_validation)
+
+    assert encoded['fastavro'] == encoded['avro'], \
+        'Backends disagree on {}'.format(name)
+
+    logger.info('{:>8} : {:6d} rows, {:8.2f} MB, avro {:8.2f} ms, fastavro '
+                '{:8.2f} ms ({:5.1f}x), identical bytes'.format(
+                    name, args.rows, len(encoded['avro']) / 1024 ** 2,
+                    times['avro'] * 1000.0, times['fastavro'] * 1000.0,
+                    times['avro'] / times['fastavro']))
+
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser('Benchmarking avro serialization '
+                                   'backends per table type')
+
+  parser.add_argument('-s', '--schema-path', dest='schema_path',
+                      default=cfg.get_avro_schema_path(),
+                      help='Directory of the avro schemas')
+  parser.add_argument('-r', '--rows', dest='rows', type=int, default=10000,
+                      help='Rows per table')
+  parser.add_argument('-n', '--repeats', dest='repeats', type=int, default=5,
+                      help='Encodings per table and backend')
+  parser.add_argument('--skip-validation', dest='skip_validation',
+                      action='store_true', default=False,
+                      help='Do not validate datums before fastavro writes '
+                      'them (avro always does)')
+
+  args = parser.parse_args()
+
+  benchmark(args)
@@ -0,0 +1,58 @@
+import time
+import argparse
+
+from avro.io import Validate
+
+from fleet.configs import drive_config as cfg
+from fleet.utils.helpers import read_avro_schemas
+from fleet.utils.avro_validator import compile_validator
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+logger = cfg.get_logger(__name__)
+
+
+def timed(fn, datum, repeats):
+
+  start = time.perf_counter()
+  for _ in range(repeats):
+    assert fn(datum)
+  return (time.perf_counter() - start) / repeats
+
+
+def benchmark(args):
+
+  schemas = read_avro_schemas(args.schema_path)
+
+  for name, schema in sorted(schemas.items()):
+
+    datum = build_mock_datum(schema, args.rows)
+
+    start = time.perf_counter()
+    validator = compile_validator(schema)
+    compile_time = time.perf_counter() - start
+
+    reference = timed(lambda d: Validate(schema, d), datum, args.repeats)
+    compiled = timed(validator, datum, args.repeats)
+
+    logger.info('{:>8} : {:6d} rows, Validate {:8.2f} ms, compiled {:8.2f} '
+                'ms ({:5.1f}x), compiled in {:6.2f} ms'.format(
+                    name, args.rows, reference * 1000.0, compiled * 1000.0,
+                    reference / compiled, compile_time * 1000.0))
+
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser('Benchmarking compiled avro validators '
+                                   'against avro.io.Validate')
+
+  parser.add_argument('-s', '--schema-path', dest='schema_path',
+                      default=cfg.get_avro_schema_path(),
+                      help='Directory of the avro schemas')
+  parser.add_argument('-r', '--rows', dest='rows', type=int, default=10000,
+                      help='Rows per table')
+  parser.add_argument('-n', '--repeats', dest='repeats', type=int, default=5,
+                      help='Validations per schema')
+
+  args = parser.parse_args()
+
+  benchmark(args)
@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from argparse import Namespace
+
+import numpy as np
+
+from fleet.configs import drive_config as cfg
+from fleet.s3_ops.diary import Diary
+from fleet.s3_ops.s3_connector import get_connector
+from tests.mock_s3 import mock_s3_env, build_mock_s3_diary
+
+logger = cfg.get_logger(__name__)
+
+
+class Timed(object):
+
+  """Wraps a connector method, recording per object latency and bytes"""
+
+  def __init__(self, fn, size_fn):
+
+    self.fn = fn
+    self.size_fn = size_fn
+    self.latencies = []
+    self.sizes = []
+    self.lock = threading.Lock()
+
+  def __call__(self, *args, **kwargs):
+
+    start = time.perf_counter()
+    flag = self.fn(*args, **kwargs)
+    latency = time.perf_counter() - start
+
+    with self.lock:
+      self.latencies.append(latency)
+      self.sizes.append(self.size_fn(*args, **kwargs))
+
+    return flag
+
+
+def report(name, timed, elapsed):
+
+  latencies = np.array(timed.latencies) * 1000.0
+  total_mb = sum(timed.sizes) / 1024.0 ** 2
+  p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) \
+      else (0.0, 0.0)
+
+  logger.info('{:>6} : {:5d} files {:9.1f} MB in {:7.2f} s, {:8.1f} files/s '
+              '{:8.1f} MB/s, latency p50 {:7.1f} ms p99 {:7.1f} ms'.format(
+                  name, len(latencies), total_mb, elapsed,
+                  len(latencies) / elapsed, total_mb / elapsed, p50, p99))
+
+
+def benchmark(args):
+
+  with mock_s3_env():
+
+    source = tempfile.mkdtemp()
+    dest = tempfile.mkdtemp()
+
+    try:
+
+      token, _ = build_mock_s3_diary(source, drives=args.drives,
+                                     sequences=args.sequences,
+                                     video_size=int(args.video_mb * 1024 ** 2),
+                                     avro_size=args.avro_kb * 1024)
+
+      s3_connector = get_connector()
+
+      put = Timed(s3_connector.put_file,
+                  lambda f, *a, **k: os.path.getsize(str(f)))
+      get = Timed(s3_connector.get_file,
+                  lambda key, path, size=None, *a, **k: size or 0)
+      s3_connector.put_file, s3_connector.get_file = put, get
+
+      start = time.perf_counter()
+      assert Diary()._push(Namespace(repo='dump', avro_schema_version='v3',
+                                     source=source, token=token,
+                                     jobs=args.jobs, force=True,
+                                     report=None, validate=False))
+      report('push', put, time.perf_counter() - start)
+
+      start = time.perf_counter()
+      assert Diary()._fetch(Namespace(repo='dump', avro_schema_version='v3',
+                                      dest=dest, token=token, jobs=args.jobs,
+                                      exclude=None, metadata_only=False,
+                                      unbundle=False, report=None))
+      report('fetch', get, time.perf_counter() - start)
+
+    finally:
+
+      shutil.rmtree(source, ignore_errors=True)
+      shutil.rmtree(dest, ignore_errors=True)
+
+
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser('Benchmarking diary push / fetch against '
+                                   'a local S3 stand-in')
+
+  parser.add_argument('-d', '--drives', dest='drives', type=int, default=2,
+                      help='Drives per synthetic diary')
+  parser.add_argument('-s', '--sequences', dest='sequences', type=int,
+                      default=10, help='Sequences per drive')
+  parser.add_argument('-v', '--video-mb', dest='video_mb', type=float,
+                      default=4.0, help='Video size per sequence (MB)')
+  parser.add_argument('-a', '--avro-kb', dest='avro_kb', type=int,
+                      default=16, help='Avro file size (KB)')
+  parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                      default=cfg.S3_TRANSFER_JOBS,
+                      help='Files transferred concurrently')
+
+  args = parser.parse_args()
+
+  benchmark(args)
@@ -0,0 +1,180 @@
+import os
+import uuid
+import shutil
+import tempfile
+import contextlib
+from pathlib import Path
+
+import boto3
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.s3_connector import close_connectors
+from fleet.utils.avro_io import write_table
+from fleet.utils.helpers import read_avro_schemas
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+try:
+  from moto import mock_aws
+except ImportError:
+  # moto < 5
+  from moto import mock_s3 as mock_aws
+
+logger = config.get_logger(__name__)
+
+MOCK_AWS_REGION = 'us-east-1'
+
+
+@contextlib.contextmanager
+def mock_s3_env(env_name='testing'):
+
+  """In-process S3 stand-in for S3Connector, Diary push / fetch
+
+    Sets up temporary credentials, the data-catalogue env file and local
+    caches, creates the drive data bucket of env_name and restores the
+    configuration on exit. get_connector() connects to env_name.
+
+    Yields:
+      Temporary directory holding credentials and caches
+  """
+
+  tmp_dir = Path(tempfile.mkdtemp(prefix='data-catalogue-mock-s3-'))
+  profile_name = config.AWS_PROFILE_NAMES[env_name]
+
+  credentials_file = tmp_dir.joinpath('credentials')
+  credentials_file.write_text('[{}]\naws_access_key_id = mock\n'
+                              'aws_secret_access_key = mock\n'
+                              'region = {}\n'.format(profile_name,
+                                                     MOCK_AWS_REGION))
+  env_file = tmp_dir.joinpath('data-catalogue-cli-credentials')
+  env_file.write_text('{}\n{}\n'.format(env_name, profile_name))
+
+  environ = {'AWS_SHARED_CREDENTIALS_FILE': credentials_file.as_posix(),
+             'AWS_ACCESS_KEY_ID': 'mock', 'AWS_SECRET_ACCESS_KEY': 'mock',
+             'AWS_DEFAULT_REGION': MOCK_AWS_REGION}
+  saved_environ = {k: os.environ.get(k) for k in environ}
+
+  settings = {'AWS_CREDENTIALS_FILE': env_file,
+              'DATA_CATALOGUE_CACHE_DIR': tmp_dir.joinpath('cache'),
+              'S3_LISTING_CACHE_PATH': tmp_dir.joinpath('cache',
+                                                        'listing.sqlite'),
+              'TRANSFER_REPORT_DIR': tmp_dir.joinpath('cache', 'reports')}
+  saved_settings = {k: getattr(config, k) for k in settings}
+
+  close_connectors()
+  os.environ.update(environ)
+  for key, value in settings.items():
+    setattr(config, key, value)
+
+  try:
+
+    with mock_aws():
+      boto3.client('s3', region_name=MOCK_AWS_REGION).create_bucket(
+          Bucket=config.AWS_DRIVE_DATA_BUCKETS[env_name])
+      yield tmp_dir
+      close_connectors()
+
+  finally:
+
+    for key, value in saved_settings.items():
+      setattr(config, key, value)
+    for key, value in saved_environ.items():
+      if value is None:
+        os.environ.pop(key, None)
+      else:
+        os.environ[key] = value
+    shutil.rmtree(tmp_dir.as_posix(), ignore_errors=True)
+
+
+def build_mock_s3_diary(root, drives=2, sequences=3, video_size=1024 ** 2,
+                        avro_size=4 * 1024, diary_date='2019-09-01'):
+
+  """Writes a synthetic diary with the on disk layout push expects
+
+    File contents are random bytes, avro files are not valid avro.
+
+    Args:
+      root: Directory the diary is written to
+      drives: Number of drives
+      sequences: Number of sequences per drive
+      video_size: Bytes per sequence video
+      avro_size: Bytes per avro file
+
+    Returns:
+      Diary token
+      Diary path
+  """
+
+  diary_token = str(uuid.uuid4())
+  diary_path = Path(root).joinpath('{}_{}'.format(diary_date, diary_token))
+  vehicle_path = diary_path.joinpath('vehicle_mock')
+  vehicle_path.mkdir(parents=True)
+
+  vehicle_path.joinpath('drive_diary.avro').write_bytes(os.urandom(avro_size))
+
+  for _ in range(drives):
+
+    drive_path = vehicle_path.joinpath('drives', str(uuid.uuid4()))
+    drive_path.mkdir(parents=True)
+    drive_path.joinpath('drive.avro').write_bytes(os.urandom(avro_size))
+
+    for idx in range(sequences):
+
+      sequence_path = drive_path.joinpath(
+          'sequences', '{:06d}_{}'.format(idx, uuid.uuid4()))
+      sequence_path.joinpath('video').mkdir(parents=True)
+
+      for avro_file, _ in config.DRIVE_SEQUENCE_AVROS:
+        sequence_path.joinpath(avro_file).write_bytes(os.urandom(avro_size))
+
+      sequence_path.joinpath('video', 'video.mp4').write_bytes(
+          os.urandom(video_size))
+
+  return diary_token, diary_path
+
+
+def write_mock_tables(diary_path, schema_path):
+
+  """Rewrites the avro files of a build_mock_s3_diary diary as valid tables
+
+    One row per table, tokens referenced across tables (and directory
+    tokens) resolve, so the diary validates with references.
+  """
+
+  schemas = read_avro_schemas(Path(schema_path).as_posix())
+  diary_path = Path(diary_path)
+  diary_token = diary_path.name.split('_', 1)[1]
+
+  def write(avro_path, schema_name, **tokens):
+    table = build_mock_datum(schemas[schema_name], 1)
+    list(table.values())[0][0].update(tokens)
+    write_table(avro_path, table, schemas[schema_name])
+
+  vehicle_path = next(p for p in diary_path.iterdir() if p.is_dir())
+  drive_paths = sorted(vehicle_path.joinpath('drives').iterdir())
+
+  write(vehicle_path.joinpath('drive_diary.avro'), 'diary',
+        diary_token=diary_token,
+        drive_tokens=[drive.name for drive in drive_paths])
+
+  for drive_path in drive_paths:
+
+    sequence_paths = sorted(drive_path.joinpath('sequences').iterdir())
+    write(drive_path.joinpath('drive.avro'), 'drive',
+          diary_token=diary_token, drive_token=drive_path.name,
+          sequence_tokens=[p.name.split('_', 1)[1] for p in sequence_paths])
+
+    for sequence_path in sequence_paths:
+
+      sequence_token = sequence_path.name.split('_', 1)[1]
+      element, data, sensor = [str(uuid.uuid4()) for _ in range(3)]
+
+      write(sequence_path.joinpath('sequence.avro'), 'sequence',
+            sequence_token=sequence_token, drive_token=drive_path.name,
+            element_tokens=[element])
+      write(sequence_path.joinpath('element.avro'), 'element',
+            element_token=element, sequence_token=sequence_token,
+            data_token=data)
+      write(sequence_path.joinpath('data.avro'), 'data', data_token=data,
+            element_token=element, sensor_tokens=[sensor])
+      write(sequence_path.joinpath('sensordata.avro'), 'sensor',
+            sensor_token=sensor, data_token=data, matched_gnss_token=None)
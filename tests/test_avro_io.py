@@ -0,0 +1,162 @@
+import io
+import os
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+from avro.datafile import DataFileReader
+from avro.io import DatumReader
+from avro.schema import Parse as schema_parser
+
+from fleet.utils.avro_io import available_codecs, encode_avro, fastavro, \
+    get_codec, get_layout, read_rows, read_table, row_schema, write_table
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+SCHEMA_PATH = Path(__file__).parents[1].joinpath('fleet', 'hardware',
+                                                 'schemas', 'avro')
+
+
+def read_schemas():
+
+  return {avsc.stem: schema_parser(avsc.read_text())
+          for avsc in sorted(SCHEMA_PATH.glob('*.avsc'))}
+
+
+@unittest.skipIf(fastavro is None, 'fastavro is required')
+class TestAvroIO(TestCase):
+
+  def test_backends_identical(self):
+
+    sync_marker = os.urandom(16)
+
+    for name, schema in read_schemas().items():
+
+      datum = build_mock_datum(schema, 50)
+
+      for codec in ['null', 'deflate']:
+
+        data = encode_avro([datum], schema, backend='avro',
+                           sync_marker=sync_marker, codec=codec)
+
+        self.assertEqual(encode_avro([datum], schema, backend='fastavro',
+                                     sync_marker=sync_marker, codec=codec),
+                         data, name)
+        self.assertEqual(list(DataFileReader(io.BytesIO(data),
+                                             DatumReader())), [datum])
+
+  def test_invalid_datum(self):
+
+    schema = read_schemas()['avro_sensor_data']
+
+    with self.assertRaises(ValueError):
+      encode_avro([{'sensor_data': [{}]}], schema, backend='fastavro')
+
+  def test_generator_datums(self):
+
+    schema = read_schemas()['avro_sensor_data']
+    table = build_mock_datum(schema, 50)
+    rows = table['sensor_data']
+
+    # validated rows are all written, not consumed by the validation
+    data = encode_avro((row for row in rows), row_schema(schema),
+                       backend='fastavro')
+    self.assertEqual(list(DataFileReader(io.BytesIO(data), DatumReader())),
+                     rows)
+
+    with self.assertRaises(ValueError):
+      encode_avro((row for row in rows + [{}]), row_schema(schema),
+                  backend='fastavro')
+
+
+class TestAvroCodecs(TestCase):
+
+  def test_get_codec(self):
+
+    self.assertIn('deflate', available_codecs('avro'))
+    self.assertEqual(get_codec('deflate'), 'deflate')
+
+    with self.assertRaises(ValueError):
+      get_codec('gzip')
+
+  def test_blocks(self):
+
+    schema = read_schemas()['avro_sensor_data']
+    table = build_mock_datum(schema, 2000)
+
+    sizes = {}
+    for codec, sync_interval in [('null', 16 * 1024), ('deflate', 16 * 1024),
+                                 ('deflate', 256 * 1024)]:
+
+      buf = io.BytesIO()
+      write_table(buf, table, schema, layout='rows', backend='avro',
+                  codec=codec, sync_interval=sync_interval)
+      sizes[codec, sync_interval] = len(buf.getvalue())
+
+      buf.seek(0)
+      reader = DataFileReader(buf, DatumReader())
+      self.assertEqual(reader.GetMeta('avro.codec').decode(), codec)
+      self.assertEqual(len(list(reader)), 2000)
+
+    self.assertLess(sizes['deflate', 16 * 1024], sizes['null', 16 * 1024])
+    self.assertLess(sizes['deflate', 256 * 1024],
+                    sizes['deflate', 16 * 1024])
+
+
+class TestAvroLayouts(TestCase):
+
+  def test_get_layout(self):
+
+    self.assertEqual(get_layout('v3'), 'table')
+    self.assertEqual(get_layout('v4'), 'rows')
+    self.assertEqual(get_layout('v12'), 'rows')
+
+  def test_roundtrip(self):
+
+    backends = ['avro'] + (['fastavro'] if fastavro is not None else [])
+    sync_marker = os.urandom(16)
+
+    for name, schema in read_schemas().items():
+
+      table = build_mock_datum(schema, 50)
+
+      for layout in ['table', 'rows']:
+
+        written = set()
+        for backend in backends:
+          buf = io.BytesIO()
+          write_table(buf, table, schema, layout=layout, backend=backend,
+                      sync_marker=sync_marker)
+          written.add(buf.getvalue())
+
+        self.assertEqual(len(written), 1, name)
+
+        read, read_schema, read_layout = read_table(io.BytesIO(written.pop()))
+        self.assertEqual((read, str(read_schema), read_layout),
+                         (table, str(schema), layout))
+
+    # one record per row, the rows layout streams
+    buf = io.BytesIO()
+    write_table(buf, table, schema, layout='rows')
+    buf.seek(0)
+    self.assertEqual(len(list(DataFileReader(buf, DatumReader()))), 50)
+
+  def test_read_rows(self):
+
+    backends = ['avro'] + (['fastavro'] if fastavro is not None else [])
+    schema = read_schemas()['avro_sensor_data']
+    table = build_mock_datum(schema, 20)
+    rows = table[schema.fields[0].name]
+    fields = {'sensor_token', 'matched_gnss_token'}
+    projected = [{field: row[field] for field in fields} for row in rows]
+
+    for layout in ['table', 'rows']:
+
+      buf = io.BytesIO()
+      write_table(buf, table, schema, layout=layout)
+
+      for backend in backends:
+        buf.seek(0)
+        self.assertEqual(list(read_rows(buf, backend=backend)), rows)
+        buf.seek(0)
+        self.assertEqual(list(read_rows(buf, fields, backend=backend)),
+                         projected)
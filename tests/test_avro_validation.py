@@ -0,0 +1,308 @@
+import io
+import os
+import json
+import tempfile
+import concurrent.futures
+from pathlib import Path
+from unittest import TestCase, mock
+
+from avro.datafile import DataFileReader, DataFileWriter
+from avro.io import DatumReader, DatumWriter, Validate
+from avro.schema import Parse as schema_parser
+
+from fleet.s3_ops.integrity import dangling, read_token_columns
+from fleet.configs import drive_config as config
+from fleet.s3_ops import validation
+from fleet.s3_ops.validation import ValidationCache, validate_sequences
+from fleet.utils.avro_io import write_table as write_layout
+from fleet.utils.avro_validator import compile_validator
+from fleet.utils.helpers import read_avro_schemas, stream_validate, \
+    validate_with_schema
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+SCHEMA_PATH = Path(__file__).parents[1].joinpath('fleet', 'hardware',
+                                                 'schemas', 'avro')
+
+DEFAULTS = {'string': 'token', 'long': 1, 'int': 1, 'double': 1.0,
+            'float': 1.0, 'boolean': True}
+
+
+def read_schema(datum_type):
+
+  avro_file = SCHEMA_PATH.joinpath('avro_{}_data.avsc'.format(datum_type))
+  return schema_parser(avro_file.read_text())
+
+
+def make_row(row_schema):
+
+  return {field.name: DEFAULTS.get(field.type.type)
+          for field in row_schema.fields}
+
+
+def write_table(schema, rows):
+
+  buf = io.BytesIO()
+  writer = DataFileWriter(buf, DatumWriter(), schema)
+  writer.append({schema.fields[0].name: rows})
+  writer.flush()
+  buf.seek(0)
+
+  return io.BytesIO(buf.getvalue())
+
+
+class TestAvroValidation(TestCase):
+
+  def setUp(self):
+
+    self.schema = read_schema('sensor')
+    self.row_schema = self.schema.fields[0].type.items
+
+  def validate(self, rows):
+
+    return stream_validate(
+        DataFileReader(write_table(self.schema, rows), DatumReader()),
+        self.schema)
+
+  def test_valid_table(self):
+
+    rows = [make_row(self.row_schema) for _ in range(1000)]
+    self.assertIsNone(self.validate(rows))
+    self.assertTrue(validate_with_schema(write_table(self.schema, rows),
+                                         self.schema))
+
+  def test_invalid_row_index(self):
+
+    # written with a looser schema, the sensor schema rejects row 700
+    loose = read_schema('sensor').to_json()
+    field = loose['fields'][0]['type']['items']['fields'][0]
+    field['type'] = ['null', 'string']
+    loose = schema_parser(json.dumps(loose))
+
+    rows = [make_row(self.row_schema) for _ in range(1000)]
+    rows[700][field['name']] = None
+
+    reader = DataFileReader(write_table(loose, rows), DatumReader())
+    error = stream_validate(reader, self.schema)
+
+    self.assertIn('row 700', error)
+    self.assertIn(field['name'], error)
+    self.assertFalse(validate_with_schema(write_table(loose, rows),
+                                          self.schema))
+
+  def test_blocks(self):
+
+    rows = [make_row(self.row_schema) for _ in range(100)]
+
+    buf = io.BytesIO()
+    writer = DataFileWriter(buf, DatumWriter(), self.schema)
+    for _ in range(3):
+      writer.append({'sensor_data': rows})
+      writer.flush()
+    writer.flush()
+    data = buf.getvalue()
+
+    self.assertTrue(validate_with_schema(io.BytesIO(data), self.schema))
+
+    # a corrupt block (no sync marker after it) fails instead of looping
+    half = len(data) // 2
+    corrupt = data[:half] + bytes(len(data) - half)
+    self.assertFalse(validate_with_schema(io.BytesIO(corrupt), self.schema))
+
+  def test_rows_layout(self):
+
+    rows = [make_row(self.row_schema) for _ in range(100)]
+
+    buf = io.BytesIO()
+    write_layout(buf, {'sensor_data': rows}, self.schema, layout='rows')
+    data = buf.getvalue()
+
+    self.assertTrue(validate_with_schema(io.BytesIO(data), self.schema))
+    self.assertTrue(validate_with_schema(io.BytesIO(data), self.schema,
+                                         trust_header=True))
+    self.assertFalse(validate_with_schema(io.BytesIO(data),
+                                          read_schema('data')))
+
+    buf = io.BytesIO()
+    write_layout(buf, {'sensor_data': []}, self.schema, layout='rows')
+    self.assertTrue(validate_with_schema(io.BytesIO(buf.getvalue()),
+                                         self.schema))
+
+  def test_trust_header(self):
+
+    rows = [make_row(self.row_schema) for _ in range(10)]
+    data = write_table(self.schema, rows).getvalue()
+
+    # rows are not read once the header holds the expected schema
+    header_only = data[:len(data) - 64] + bytes(64)
+    self.assertTrue(validate_with_schema(io.BytesIO(header_only), self.schema,
+                                         trust_header=True))
+    self.assertFalse(validate_with_schema(io.BytesIO(header_only),
+                                          self.schema))
+
+    self.assertFalse(validate_with_schema(io.BytesIO(data),
+                                          read_schema('data'),
+                                          trust_header=True))
+
+  def test_compiled_validator(self):
+
+    validator = compile_validator(self.schema)
+    self.assertIs(compile_validator(self.schema), validator)
+
+    row = make_row(self.row_schema)
+    fields = {f.type.type: f.name for f in self.row_schema.fields}
+
+    datums = [{}, [], None, {'sensor_data': []}, {'sensor_data': [row]},
+              {'sensor_data': [row], 'extra': 1}, {'sensor_data': (row, )}]
+
+    for kind, value in [('string', 1), ('long', 2 ** 63), ('long', 1.0),
+                        ('double', True), ('double', '1'), ('union', 1),
+                        ('boolean', 1)]:
+      if kind in fields:
+        datums.append({'sensor_data': [dict(row, **{fields[kind]: value})]})
+
+    datums.append({'sensor_data': [dict(row, extra=1)]})
+    datums.append({'sensor_data': [{k: v for k, v in row.items()
+                                    if k != fields['string']}]})
+
+    for datum in datums:
+      self.assertEqual(validator(datum), Validate(self.schema, datum),
+                       datum)
+
+    for datum_type in ['diary', 'drive', 'sequence', 'element', 'data']:
+      schema = read_schema(datum_type)
+      datum = {schema.fields[0].name: [make_row(schema.fields[0].type.items)]}
+      self.assertEqual(compile_validator(schema)(datum),
+                       Validate(schema, datum))
+
+
+class TestValidationCache(TestCase):
+
+  def setUp(self):
+
+    self.diary_path = Path(tempfile.mkdtemp())
+    self.avro_path = self.diary_path.joinpath('drive.avro')
+    self.avro_path.write_bytes(b'avro')
+
+  def test_unchanged_files_skipped(self):
+
+    cache = ValidationCache(self.diary_path, 'v3-a')
+    self.assertFalse(cache.is_valid(self.avro_path))
+    cache.record(self.avro_path)
+    cache.save()
+
+    cache = ValidationCache(self.diary_path, 'v3-a').load()
+    self.assertTrue(cache.is_valid(self.avro_path))
+
+    stat = self.avro_path.stat()
+    os.utime(str(self.avro_path), ns=(stat.st_atime_ns,
+                                      stat.st_mtime_ns + 1000))
+    self.assertFalse(cache.is_valid(self.avro_path))
+
+  def test_schema_change_invalidates(self):
+
+    cache = ValidationCache(self.diary_path, 'v3-a')
+    cache.record(self.avro_path)
+    cache.save()
+
+    cache = ValidationCache(self.diary_path, 'v3-b').load()
+    self.assertFalse(cache.is_valid(self.avro_path))
+
+
+class TestReferences(TestCase):
+
+  def test_dangling(self):
+
+    refs = ['a-1', 'a-10', 'b', 'a-1']
+    self.assertEqual(dangling(refs, ['a-1', 'b']).tolist(), [1])
+    self.assertEqual(dangling(refs, []).tolist(), [0, 1, 2, 3])
+    self.assertEqual(dangling([], ['a-1']).tolist(), [])
+
+    # exact matches, tokens past the S36 width and repeated targets
+    tokens = ['{:040d}'.format(idx) for idx in range(4)]
+    self.assertEqual(dangling(tokens, tokens[:2] + tokens[:2]).tolist(),
+                     [2, 3])
+    self.assertEqual(dangling([tokens[0][:36]], tokens).tolist(), [0])
+
+  def test_read_token_columns(self):
+
+    schema = read_schema('data')
+    row = make_row(schema.fields[0].type.items)
+    rows = [dict(row, data_token='d{}'.format(idx),
+                 sensor_tokens=['s{}'.format(idx), 'x'])
+            for idx in range(3)]
+
+    columns = read_token_columns(write_table(schema, rows),
+                                 {'data_token', 'sensor_tokens'})
+
+    self.assertEqual(columns['data_token'], ['d0', 'd1', 'd2'])
+    self.assertEqual(columns['sensor_tokens'], ['s0', 'x', 's1', 'x', 's2',
+                                                'x'])
+
+    buf = io.BytesIO()
+    write_layout(buf, {'data': rows}, schema, layout='rows')
+    buf.seek(0)
+    self.assertEqual(read_token_columns(buf, {'data_token', 'sensor_tokens'}),
+                     columns)
+
+
+class TestValidateSequences(TestCase):
+
+  def setUp(self):
+
+    schemas = read_avro_schemas(SCHEMA_PATH.as_posix())
+    root = Path(tempfile.mkdtemp())
+
+    self.sequence_uris = []
+    for idx in range(4):
+      sequence_uri = root.joinpath('{:06d}'.format(idx))
+      sequence_uri.mkdir()
+      for avro_name, schema_name in config.DRIVE_SEQUENCE_AVROS:
+        write_layout(sequence_uri.joinpath(avro_name).as_posix(),
+                     build_mock_datum(schemas[schema_name], 3),
+                     schemas[schema_name])
+      self.sequence_uris.append(sequence_uri.as_posix())
+
+    # a corrupt and a missing avro file
+    root.joinpath('000001', 'sensordata.avro').write_bytes(os.urandom(64))
+    root.joinpath('000002', 'data.avro').unlink()
+
+  def validate(self, sequence_uris, jobs):
+
+    pool = mock.patch.object(validation.concurrent.futures,
+                             'ProcessPoolExecutor',
+                             wraps=concurrent.futures.ProcessPoolExecutor)
+    with pool as executor:
+      flags = validate_sequences(sequence_uris, SCHEMA_PATH.as_posix(),
+                                 jobs=jobs)
+
+    return flags, executor.called
+
+  def test_process_pool(self):
+
+    flags, pooled = self.validate(self.sequence_uris, jobs=1)
+    self.assertFalse(pooled)
+    avro_flags = [[True] * 4, [True, True, False, True],
+                  [False, True, True, True], [True] * 4]
+    self.assertEqual([f[:-1] for f in flags], avro_flags)
+
+    self.assertEqual(self.validate(self.sequence_uris, jobs=3),
+                     (flags, True))
+    # a single sequence is validated in process
+    self.assertEqual(self.validate(self.sequence_uris[:1], jobs=3),
+                     (flags[:1], False))
+
+  def test_worker_schemas(self):
+
+    # parsed on the first task of a worker, reused for the next ones
+    schema_path = SCHEMA_PATH.as_posix()
+    parse = mock.patch.object(validation, 'read_avro_schemas',
+                              wraps=read_avro_schemas)
+    worker_schemas = mock.patch.dict(validation._worker_schemas, clear=True)
+
+    with worker_schemas, parse as read_schemas:
+      flags = [validation._validate_worker(uri, schema_path, False)
+               for uri in self.sequence_uris]
+
+    self.assertEqual(read_schemas.call_count, 1)
+    self.assertEqual(flags, [f[:-1] for f in self.validate(
+        self.sequence_uris, jobs=1)[0]])
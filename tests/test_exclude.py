@@ -0,0 +1,83 @@
+import uuid
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.exclude import apply_exclusions, excluded_members, \
+    needs_row_filter
+from fleet.utils.avro_io import read_table, write_table
+from fleet.utils.helpers import read_avro_schemas
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+SCHEMA_PATH = Path(__file__).parents[1].joinpath('fleet', 'hardware',
+                                                 'schemas', 'avro')
+
+
+class TestExclude(TestCase):
+
+  def setUp(self):
+
+    schemas = read_avro_schemas(SCHEMA_PATH.as_posix())
+
+    self.sequence_uri = Path(tempfile.mkdtemp()).joinpath(
+        'sequences', '000001_{}'.format(uuid.uuid4()))
+    self.sequence_uri.mkdir(parents=True)
+
+    # a gnss row, a camera row matched to it and a vehicle row
+    sensor = build_mock_datum(schemas['sensor'], 3)
+    rows = sensor['sensor_data']
+    for row, modality in zip(rows, ['gnss', 'camera', 'vehicle']):
+      row['sensor_token'] = str(uuid.uuid4())
+      row['sensor_modality_type'] = modality
+    rows[1]['matched_gnss_token'] = rows[0]['sensor_token']
+    rows[2]['matched_gnss_token'] = None
+    self.tokens = [row['sensor_token'] for row in rows]
+
+    data = build_mock_datum(schemas['data'], 1)
+    data['data'][0]['sensor_tokens'] = list(self.tokens)
+
+    write_table(self.sequence_uri.joinpath('sensordata.avro'), sensor,
+                schemas['sensor'])
+    write_table(self.sequence_uri.joinpath('data.avro'), data,
+                schemas['data'])
+
+  def read_rows(self, avro_name):
+
+    table = read_table(self.sequence_uri.joinpath(avro_name))[0]
+    return list(table.values())[0]
+
+  def test_exclude_gps(self):
+
+    self.assertEqual(apply_exclusions(self.sequence_uri, ['gps']), 1)
+
+    rows = self.read_rows('sensordata.avro')
+    self.assertEqual([row['sensor_token'] for row in rows], self.tokens[1:])
+    # no reference left to the dropped gnss row
+    self.assertEqual([row['matched_gnss_token'] for row in rows],
+                     [None, None])
+    self.assertEqual(self.read_rows('data.avro')[0]['sensor_tokens'],
+                     self.tokens[1:])
+
+  def test_exclude_fields(self):
+
+    self.assertEqual(apply_exclusions(self.sequence_uri, ['speed']), 0)
+
+    rows = self.read_rows('sensordata.avro')
+    self.assertEqual([row['sensor_token'] for row in rows], self.tokens)
+    self.assertEqual([row['vehicle_speed'] for row in rows],
+                     [None, None, None])
+    self.assertEqual(rows[1]['matched_gnss_token'], self.tokens[0])
+
+  def test_needs_row_filter(self):
+
+    self.assertTrue(needs_row_filter(['image', 'gps']))
+    self.assertFalse(needs_row_filter(['image']))
+    self.assertFalse(needs_row_filter(None))
+
+  def test_sensors_excluded(self):
+
+    # every --exclude choice skips members, drops rows or nulls fields
+    for sensor in config.DRIVE_DATA_SENSORS:
+      excluded = excluded_members([sensor]) or needs_row_filter([sensor])
+      self.assertTrue(excluded, sensor)
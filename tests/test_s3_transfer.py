@@ -0,0 +1,498 @@
+import io
+import os
+import json
+import argparse
+import shutil
+import hashlib
+import tempfile
+import unittest
+import threading
+from pathlib import Path
+from argparse import Namespace
+from unittest import TestCase, mock
+
+from boto3.s3.transfer import TransferConfig
+
+try:
+  import moto
+except ImportError:
+  moto = None
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.bundle import fetch_bundle_members, pack_sequence
+from fleet.s3_ops.diary import Diary
+from fleet.s3_ops.remote import RemoteDiary
+from fleet.s3_ops.s3_connector import get_connector
+from fleet.s3_ops.token_index import TokenIndex
+from fleet.s3_ops.transfer import fetch_prefix
+from fleet.s3_ops.validation import iter_validate_sequences, sequence_files
+from fleet.utils.avro_io import read_table, write_table
+from fleet.utils.helpers import read_avro_schemas
+from fleet.utils.mock_drive_data_gen import build_mock_datum
+
+
+def file_digests(root):
+
+  root = Path(root)
+  return sorted((p.relative_to(root).as_posix(),
+                 hashlib.md5(p.read_bytes()).hexdigest())
+                for p in root.rglob('*') if p.is_file())
+
+
+@unittest.skipIf(moto is None, 'moto is required for the local S3 stand-in')
+class TestS3Transfer(TestCase):
+
+  def setUp(self):
+
+    from mock_s3 import mock_s3_env, build_mock_s3_diary
+
+    self.mock_env = mock_s3_env()
+    self.mock_env.__enter__()
+
+    self.source = tempfile.mkdtemp()
+    self.token, self.diary_path = build_mock_s3_diary(
+        self.source, drives=2, sequences=2, video_size=64 * 1024)
+
+  def tearDown(self):
+
+    self.mock_env.__exit__(None, None, None)
+
+  def push_args(self, **kwargs):
+
+    args = {'repo': 'dump', 'avro_schema_version': 'v3',
+            'source': self.source, 'token': self.token, 'jobs': 4,
+            'force': False, 'report': None, 'validate': False,
+            'validation_jobs': 1}
+    args.update(kwargs)
+    return Namespace(**args)
+
+  def fetch_args(self, dest, **kwargs):
+
+    args = {'repo': 'dump', 'avro_schema_version': 'v3', 'dest': dest,
+            'token': self.token, 'jobs': 4, 'exclude': None,
+            'metadata_only': False, 'unbundle': False, 'report': None}
+    args.update(kwargs)
+    return Namespace(**args)
+
+  def test_put_get_file(self):
+
+    s3_connector = get_connector()
+
+    data = os.urandom(1024)
+    source_file = Path(self.source).joinpath('object.bin')
+    source_file.write_bytes(data)
+
+    self.assertTrue(s3_connector.put_checked(source_file, 'test/object.bin'))
+    self.assertEqual(s3_connector.list_objects('test/'), ['test/object.bin'])
+
+    dest_file = Path(self.source).joinpath('fetched.bin')
+    self.assertTrue(s3_connector.get_file('test/object.bin',
+                                          dest_file.as_posix()))
+    self.assertEqual(dest_file.read_bytes(), data)
+
+  def put_object(self, s3_key, data):
+
+    s3_connector = get_connector()
+    source_file = Path(self.source).joinpath('object.bin')
+    source_file.write_bytes(data)
+    self.assertTrue(s3_connector.put_checked(source_file, s3_key))
+
+    obj = s3_connector.list_object_info(s3_key, refresh=True)[0]
+    return obj['Size'], obj['ETag']
+
+  def get_file(self, s3_key, dest_file, size, etag):
+
+    s3_connector = get_connector()
+    with mock.patch.object(s3_connector.s3_client, 'get_object',
+                           wraps=s3_connector.s3_client.get_object) as get:
+      self.assertTrue(s3_connector.get_file(s3_key, dest_file.as_posix(),
+                                            size, etag))
+    return [call[1] for call in get.call_args_list]
+
+  def test_get_file_resume(self):
+
+    data = os.urandom(4096)
+    size, etag = self.put_object('test/object.bin', data)
+
+    dest_file = Path(self.source).joinpath('fetched.bin')
+    Path(dest_file.as_posix() + config.S3_PARTIAL_SUFFIX).write_bytes(
+        data[:1000])
+
+    calls = self.get_file('test/object.bin', dest_file, size, etag)
+    self.assertEqual([call.get('Range') for call in calls], ['bytes=1000-'])
+    self.assertEqual(dest_file.read_bytes(), data)
+
+    # up to date files are not downloaded again
+    self.assertEqual(self.get_file('test/object.bin', dest_file, size,
+                                   etag), [])
+
+  def test_get_file_changed(self):
+
+    old_size, old_etag = self.put_object('test/object.bin',
+                                         os.urandom(4096))
+    data = os.urandom(2048)
+    self.put_object('test/object.bin', data)
+
+    # partially fetched at the listed (now stale) version, the If-Match
+    # fails (412) and the current version is fetched from scratch
+    dest_file = Path(self.source).joinpath('fetched.bin')
+    Path(dest_file.as_posix() + config.S3_PARTIAL_SUFFIX).write_bytes(
+        os.urandom(1000))
+
+    calls = self.get_file('test/object.bin', dest_file, old_size, old_etag)
+    self.assertEqual([call.get('Range') for call in calls],
+                     ['bytes=1000-', None])
+    self.assertEqual(dest_file.read_bytes(), data)
+
+    # partially fetched past the end of the current version
+    dest_file.unlink()
+    Path(dest_file.as_posix() + config.S3_PARTIAL_SUFFIX).write_bytes(
+        os.urandom(3000))
+
+    calls = self.get_file('test/object.bin', dest_file, old_size, old_etag)
+    self.assertEqual([call.get('Range') for call in calls],
+                     ['bytes=3000-', None])
+    self.assertEqual(dest_file.read_bytes(), data)
+
+    # resumed on a partial file of another version, fetched again
+    dest_file.unlink()
+    Path(dest_file.as_posix() + config.S3_PARTIAL_SUFFIX).write_bytes(
+        os.urandom(1000))
+
+    etag = get_connector().head('test/object.bin')['ETag'].strip('"')
+    calls = self.get_file('test/object.bin', dest_file, len(data), etag)
+    self.assertEqual([call.get('Range') for call in calls],
+                     ['bytes=1000-', None])
+    self.assertEqual(dest_file.read_bytes(), data)
+
+  def test_fetch_prefix_snapshot(self):
+
+    s3_connector = get_connector()
+    self.put_object('test/data/first.bin', os.urandom(4096))
+    s3_connector.list_object_info('test/data/')
+
+    # re-pushed and added behind the snapshot, f.ex from another host
+    data = os.urandom(2048)
+    for s3_key in ['test/data/first.bin', 'test/data/second.bin']:
+      s3_connector.s3_client.put_object(Bucket=s3_connector.bucket_name,
+                                        Key=s3_key, Body=data)
+
+    # past the refresh age, only keys after the snapshot are listed, the
+    # stale first.bin is fetched again at its current version
+    s3_connector.listing_cache.refresh = 0
+    dest = Path(tempfile.mkdtemp())
+    with mock.patch.object(s3_connector.s3_client, 'list_objects_v2',
+                           wraps=s3_connector.s3_client.list_objects_v2) as ls:
+      self.assertTrue(fetch_prefix(s3_connector, 'test/data/', 'test/',
+                                   dest.as_posix()))
+
+    self.assertEqual([call[1].get('StartAfter') for call in ls.call_args_list],
+                     ['test/data/first.bin'])
+    self.assertEqual(dest.joinpath('data/first.bin').read_bytes(), data)
+    self.assertEqual(dest.joinpath('data/second.bin').read_bytes(), data)
+
+  def test_diary_lookup_snapshot(self):
+
+    s3_connector = get_connector()
+    repo = config.get_aws_repo_uris('v3')['dump']
+    self.assertEqual(s3_connector.list_subdirs(repo), [])
+
+    # neither in the snapshot nor in the token index, listed again in full
+    s3_connector.s3_client.put_object(
+        Bucket=s3_connector.bucket_name, Body=b'',
+        Key=repo + self.diary_path.name + '/drive_diary.avro')
+
+    diary = Diary()
+    diary.s3_connector = s3_connector
+    diary._set_diary_uuid(self.token)
+    self.assertEqual(diary._validate_drive_s3(repo), [self.diary_path.name])
+
+  def test_push_fetch_diary(self):
+
+    self.assertTrue(Diary()._push(self.push_args()))
+
+    dest = tempfile.mkdtemp()
+    self.assertTrue(Diary()._fetch(self.fetch_args(dest)))
+    self.assertEqual(file_digests(dest), file_digests(self.source))
+
+  def test_push_skips_unchanged(self):
+
+    self.assertTrue(Diary()._push(self.push_args()))
+
+    diary = Diary()
+    self.assertTrue(diary._push(self.push_args()))
+    self.assertEqual(diary.push_manifest.skipped,
+                     len(file_digests(self.source)))
+
+  def test_transfer_report(self):
+
+    report_path = Path(tempfile.mkdtemp()).joinpath('push.json')
+    self.assertTrue(Diary()._push(self.push_args(report=str(report_path))))
+
+    report = json.loads(report_path.read_text())
+    pushed = len(file_digests(self.source))
+
+    self.assertEqual(report['operation'], 'push')
+    self.assertEqual(report['operations']['put']['objects'], pushed)
+    self.assertEqual(report['bytes'], sum(
+        p.stat().st_size for p in Path(self.source).rglob('*')
+        if p.is_file()))
+    self.assertEqual(sum(report['latency']['histogram_ms'].values()), pushed)
+    self.assertEqual(report['retries'], 0)
+
+  def test_push_validate_invalid(self):
+
+    # mock avro files are random bytes, no sequence validates
+    schema_path = Path(__file__).parents[1].joinpath('fleet', 'hardware',
+                                                     'schemas', 'avro')
+    get_schema_path = config.get_avro_schema_path
+    config.get_avro_schema_path = lambda: schema_path.as_posix()
+
+    try:
+      self.assertFalse(Diary()._push(self.push_args(validate=True)))
+    finally:
+      config.get_avro_schema_path = get_schema_path
+
+    self.assertEqual(get_connector().list_objects(''), [])
+
+  def test_push_validate(self):
+
+    from mock_s3 import write_mock_tables
+
+    schema_path = Path(__file__).parents[1].joinpath('fleet', 'hardware',
+                                                     'schemas', 'avro')
+    get_schema_path = config.get_avro_schema_path
+    config.get_avro_schema_path = lambda: schema_path.as_posix()
+
+    write_mock_tables(self.diary_path, schema_path)
+    sequence_uris = sorted(self.diary_path.rglob('sequences/*'))
+    diary = Diary()
+
+    # uploads start before the first sequence has validated
+    uploaded = threading.Event()
+    overlapped = []
+    push_obj = diary._push_obj_to_s3
+
+    def push(*args):
+      uploaded.set()
+      return push_obj(*args)
+
+    def validating(*args, **kwargs):
+      results = iter_validate_sequences(*args, **kwargs)
+
+      def after_upload():
+        overlapped.append(uploaded.wait(10))
+        yield from results
+
+      return after_upload()
+
+    diary._push_obj_to_s3 = push
+    patch = mock.patch('fleet.s3_ops.diary.iter_validate_sequences',
+                       validating)
+
+    try:
+      # validated by an earlier push, the last sequence is invalid
+      cache = diary._load_validation_cache(self.diary_path)
+      cache.record(sequence_uris[0], sequence_files(sequence_uris[0]))
+      cache.save()
+      invalid_path = sequence_uris[-1].joinpath('sensordata.avro')
+      invalid_path.write_bytes(os.urandom(64))
+
+      with patch:
+        self.assertFalse(diary._push(self.push_args(validate=True,
+                                                    validation_jobs=2)))
+    finally:
+      config.get_avro_schema_path = get_schema_path
+
+    self.assertEqual(overlapped, [True])
+
+    # valid sequences pushed, neither the invalid one nor the tables
+    repo = config.get_aws_repo_uris('v3')['dump']
+    pushed = set(get_connector().list_objects(repo, refresh=True))
+    expected = {repo + path.relative_to(self.source).as_posix()
+                for uri in sequence_uris[:-1]
+                for path in uri.rglob('*') if path.is_file()}
+    self.assertEqual(pushed, expected)
+
+  def test_remote_diary(self):
+
+    self.assertTrue(Diary()._push(self.push_args()))
+
+    repo = config.get_aws_repo_uris('v3')['dump']
+    diary = RemoteDiary(get_connector(), repo + self.diary_path.name)
+
+    self.assertEqual(len(diary.drive_uris), 2)
+    self.assertEqual(len(diary.sequence_uris), 4)
+
+    # streamed objects read as the local files
+    local = self.diary_path.joinpath(diary.vehicle_uri.name,
+                                     'drive_diary.avro')
+    with diary.open(diary.vehicle_uri.joinpath('drive_diary.avro')) as pfile:
+      pfile.seek(-16, 2)
+      self.assertEqual(pfile.read(), local.read_bytes()[-16:])
+      pfile.seek(0)
+      self.assertEqual(pfile.read(), local.read_bytes())
+
+  def test_fetch_bundle_members(self):
+
+    sequence_uri = next(Path(self.source).rglob('sequences/*'))
+    loose = Path(tempfile.mkdtemp()).joinpath('loose')
+    shutil.copytree(sequence_uri.as_posix(), loose.as_posix())
+    pack_sequence(sequence_uri)
+
+    self.assertTrue(Diary()._push(self.push_args()))
+
+    repo = config.get_aws_repo_uris('v3')['dump']
+    bundle_key = repo + sequence_uri.joinpath(
+        config.DRIVE_SEQUENCE_BUNDLE).relative_to(self.source).as_posix()
+
+    # partial files of earlier runs are fetched again
+    dest = Path(tempfile.mkdtemp())
+    video = next(loose.rglob('*.mp4')).relative_to(loose)
+    part_path = dest.joinpath(video.as_posix() + config.S3_PARTIAL_SUFFIX)
+    part_path.parent.mkdir(parents=True)
+    part_path.write_bytes(os.urandom(1000))
+
+    self.assertTrue(fetch_bundle_members(get_connector(), bundle_key, dest))
+    self.assertEqual(file_digests(dest), file_digests(loose))
+
+    # members fetched by an earlier run are kept, the others fetched
+    removed = sorted(dest.rglob('*.avro'))[0]
+    removed.unlink()
+    s3_connector = get_connector()
+    with mock.patch.object(s3_connector, 'get_file_range',
+                           wraps=s3_connector.get_file_range) as get:
+      self.assertTrue(fetch_bundle_members(s3_connector, bundle_key, dest))
+    self.assertEqual([call[0][1] for call in get.call_args_list],
+                     [removed.as_posix()])
+    self.assertEqual(file_digests(dest), file_digests(loose))
+
+  def test_fetch_metadata_only(self):
+
+    self.assertTrue(Diary()._push(self.push_args()))
+
+    dest = tempfile.mkdtemp()
+    self.assertTrue(Diary()._fetch(self.fetch_args(dest,
+                                                   metadata_only=True)))
+
+    fetched = [name for name, _ in file_digests(dest)]
+    self.assertTrue(len(fetched) > 0)
+    self.assertFalse(any(name.endswith('.mp4') for name in fetched))
+
+  def test_promote(self):
+
+    self.assertTrue(Diary()._push(self.push_args()))
+
+    # legacy upload in 8 MB parts, without md5 metadata
+    s3_connector = get_connector()
+    repo_uris = config.get_aws_repo_uris('v3')
+    legacy_key = repo_uris['dump'] + self.diary_path.name + '/legacy.bin'
+    part_size = 8 * 1024 ** 2
+    s3_connector.s3_client.upload_fileobj(
+        io.BytesIO(os.urandom(2 * part_size + 1024)),
+        s3_connector.bucket_name, legacy_key,
+        Config=TransferConfig(multipart_threshold=part_size,
+                              multipart_chunksize=part_size))
+
+    src_prefix = repo_uris['dump'] + self.diary_path.name + '/'
+    src_etags = {obj['Key'][len(repo_uris['dump']):]: obj['ETag']
+                 for obj in s3_connector.list_object_info(src_prefix,
+                                                          refresh=True)}
+    self.assertTrue(src_etags['{}/legacy.bin'.format(
+        self.diary_path.name)].endswith('-3'))
+
+    self.assertTrue(Diary()._promote(Namespace(
+        token=self.token, avro_schema_version='v3', jobs=4,
+        delete_source=True)))
+
+    dst_prefix = repo_uris['master'] + self.diary_path.name + '/'
+    dst_etags = {obj['Key'][len(repo_uris['master']):]: obj['ETag']
+                 for obj in s3_connector.list_object_info(dst_prefix,
+                                                          refresh=True)}
+    self.assertEqual(dst_etags, src_etags)
+    self.assertEqual(s3_connector.list_objects(src_prefix, refresh=True), [])
+
+  def test_token_required(self):
+
+    parser = argparse.ArgumentParser()
+    Diary().build_parser(parser)
+
+    args = parser.parse_args(['delete', '-r', 'dump', '-a', 'v3'])
+    with mock.patch('sys.stderr'), self.assertRaises(SystemExit) as usage:
+      args.main(args)
+    self.assertEqual(usage.exception.code, 2)
+
+    args = parser.parse_args(['prune', '-o', '1', '-a', 'v3', '--dry-run'])
+    self.assertIsNone(args.token)
+    self.assertTrue(args.main(args))
+
+  def diary_keys(self, repo):
+
+    prefix = config.get_aws_repo_uris('v3')[repo] + self.diary_path.name
+    return get_connector().list_objects(prefix + '/', refresh=True)
+
+  def test_delete(self):
+
+    self.assertTrue(Diary()._push(self.push_args()))
+    self.assertTrue(len(self.diary_keys('dump')) > 0)
+
+    args = Namespace(token=self.token, repo='dump', avro_schema_version='v3',
+                     jobs=4)
+    self.assertTrue(Diary()._delete(args))
+    self.assertEqual(self.diary_keys('dump'), [])
+
+    repo = config.get_aws_repo_uris('v3')['dump']
+    index = TokenIndex(get_connector(), repo)
+    self.assertIsNone(index.lookup('diary', self.token))
+    # nothing left to delete
+    self.assertFalse(Diary()._delete(args))
+
+  def test_prune(self):
+
+    self.assertTrue(Diary()._push(self.push_args(repo='scratch')))
+    pushed = self.diary_keys('scratch')
+
+    def prune(older_than, dry_run=False):
+      return Diary()._prune(Namespace(older_than=older_than, dry_run=dry_run,
+                                      avro_schema_version='v3', jobs=4))
+
+    # too recent, then listed only
+    self.assertTrue(prune(1))
+    self.assertTrue(prune(0, dry_run=True))
+    self.assertEqual(self.diary_keys('scratch'), pushed)
+
+    self.assertTrue(prune(0))
+    self.assertEqual(self.diary_keys('scratch'), [])
+
+  def test_migrate(self):
+
+    schema_path = Path(__file__).parents[1].joinpath('fleet', 'hardware',
+                                                     'schemas', 'avro')
+    schema = read_avro_schemas(schema_path.as_posix())['sensor']
+    table = build_mock_datum(schema, 3)
+
+    # mock avro files are random bytes, written as v3 tables instead
+    for avro_path in Path(self.source).rglob('*.avro'):
+      write_table(avro_path, table, schema, layout='table')
+
+    sequence_uri = next(Path(self.source).rglob('sequences/*'))
+    pack_sequence(sequence_uri)
+
+    self.assertTrue(Diary()._push(self.push_args()))
+    self.assertTrue(Diary()._migrate(Namespace(
+        repo='dump', from_version='v3', to_version='v4', token=self.token,
+        jobs=4, report=None)))
+
+    repo = config.get_aws_repo_uris('v4')['dump']
+    diary = RemoteDiary(get_connector(), repo + self.diary_path.name)
+    self.assertEqual(len(diary.sizes), len(file_digests(self.source)))
+
+    members = [(uri, avro_name) for uri in diary.sequence_uris
+               for avro_name, _ in config.DRIVE_SEQUENCE_AVROS]
+    self.assertEqual(len(members), 4 * len(config.DRIVE_SEQUENCE_AVROS))
+
+    for uri, avro_name in members:
+      with diary.open_sequence_member(uri, avro_name) as pfile:
+        migrated, migrated_schema, layout = read_table(pfile)
+      self.assertEqual((migrated, layout), (table, 'rows'))
+      self.assertEqual(str(migrated_schema), str(schema))
@@ -0,0 +1,145 @@
+from unittest import TestCase
+
+from botocore.exceptions import ClientError, EndpointConnectionError, \
+    IncompleteReadError, NoCredentialsError, ParamValidationError, \
+    ReadTimeoutError
+
+from fleet.s3_ops.throttle import AdaptiveLimiter, RetryBudget, \
+    TransferController, is_retryable, is_throttled
+
+
+def client_error(code):
+
+  return ClientError({'Error': {'Code': code, 'Message': code}}, 'GetObject')
+
+
+class Failing(object):
+
+  """Callable failing with errors before returning result"""
+
+  def __init__(self, errors, result='done'):
+
+    self.errors = list(errors)
+    self.result = result
+    self.calls = 0
+
+  def __call__(self):
+
+    self.calls += 1
+    if self.errors:
+      raise self.errors.pop(0)
+    return self.result
+
+
+class TestThrottle(TestCase):
+
+  def controller(self, limit=8, tokens=100, ratio=0.1, max_attempts=8):
+
+    limiter = AdaptiveLimiter(limit=limit, min_limit=1, max_limit=16)
+    limiter.cooldown = 0.0
+    controller = TransferController(limiter, RetryBudget(tokens, ratio),
+                                    max_attempts=max_attempts)
+    controller.backoff = lambda attempt: 0.0
+
+    return controller
+
+  def test_is_retryable(self):
+
+    retryable = [client_error('SlowDown'), client_error('503'),
+                 client_error('InternalError'),
+                 Exception('An error occurred (SlowDown) when calling the '
+                           'UploadPart operation'),
+                 EndpointConnectionError(endpoint_url='https://s3'),
+                 ReadTimeoutError(endpoint_url='https://s3'),
+                 IncompleteReadError(actual_bytes=1, expected_bytes=2)]
+    failing = [client_error('AccessDenied'), client_error('NoSuchKey'),
+               NoCredentialsError(), ParamValidationError(report='Bucket'),
+               ValueError('not an S3 error')]
+
+    for err in retryable:
+      self.assertTrue(is_retryable(err), err)
+    for err in failing:
+      self.assertFalse(is_retryable(err), err)
+
+    self.assertTrue(is_throttled(client_error('SlowDown')))
+    self.assertFalse(is_throttled(client_error('InternalError')))
+
+  def test_aimd(self):
+
+    limiter = AdaptiveLimiter(limit=8, min_limit=1, max_limit=16)
+    limiter.cooldown = 0.0
+
+    # multiplicative decrease down to min_limit
+    for limit in [4, 2, 1, 1]:
+      limiter.acquire()
+      limiter.release(throttled=True)
+      self.assertEqual(limiter.limit, limit)
+
+    # additive increase, 1 / limit per successful call
+    limiter.acquire()
+    limiter.release()
+    self.assertEqual(limiter.limit, 2)
+
+    for _ in range(6):
+      limiter.acquire()
+      limiter.release()
+    self.assertEqual(int(limiter.limit), 4)
+
+    # throttled bursts within the cooldown decrease once
+    limiter.cooldown = 60.0
+    limiter.last_decrease = 0.0
+    for _ in range(3):
+      limiter.acquire()
+      limiter.release(throttled=True)
+    self.assertEqual(int(limiter.limit), 2)
+    self.assertEqual(limiter.in_flight, 0)
+
+  def test_throttled_recovery(self):
+
+    controller = self.controller()
+    fn = Failing([client_error('SlowDown')] * 3)
+
+    self.assertEqual(controller.call(fn), 'done')
+    self.assertEqual((fn.calls, controller.retries, controller.throttled),
+                     (4, 3, 3))
+    # halved three times, then one up for the successful call
+    self.assertEqual(controller.limiter.limit, 2)
+
+    for _ in range(10):
+      controller.call(Failing([]))
+    self.assertGreater(controller.limiter.limit, 3)
+
+  def test_not_retried(self):
+
+    controller = self.controller()
+    fn = Failing([client_error('AccessDenied')])
+
+    with self.assertRaises(ClientError):
+      controller.call(fn)
+    self.assertEqual((fn.calls, controller.retries), (1, 0))
+
+    fn = Failing([client_error('InternalError')] * 3)
+    controller.max_attempts = 3
+    with self.assertRaises(ClientError):
+      controller.call(fn)
+    self.assertEqual(fn.calls, 3)
+
+  def test_retry_budget(self):
+
+    controller = self.controller(tokens=2, ratio=0.5)
+    fn = Failing([client_error('SlowDown')] * 5)
+
+    # two retries, then the budget is spent
+    with self.assertRaises(ClientError):
+      controller.call(fn)
+    self.assertEqual((fn.calls, controller.retries), (3, 2))
+
+    with self.assertRaises(ClientError):
+      controller.call(Failing([client_error('SlowDown')]))
+
+    # successful calls refill the budget
+    controller.call(Failing([]))
+    controller.call(Failing([]))
+    self.assertEqual(controller.call(Failing([client_error('SlowDown')])),
+                     'done')
+    self.assertEqual(controller.retries, 3)
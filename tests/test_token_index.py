@@ -0,0 +1,78 @@
+import os
+import uuid
+import unittest
+from unittest import TestCase
+
+try:
+  import moto
+except ImportError:
+  moto = None
+
+from fleet.configs import drive_config as config
+from fleet.s3_ops.s3_connector import get_connector
+from fleet.s3_ops.token_index import TokenIndex, read_shard, write_shard
+
+
+class TestTokenShards(TestCase):
+
+  def test_shard_round_trip(self):
+
+    entries = {str(uuid.uuid4()): 'dump/{}/'.format(i) for i in range(8)}
+    tokens, prefixes = read_shard(write_shard(entries))
+
+    self.assertEqual(tokens, sorted(entries))
+    self.assertEqual(dict(zip(tokens, prefixes)), entries)
+    self.assertEqual(read_shard(None), ([], []))
+
+
+@unittest.skipIf(moto is None, 'moto is required for the local S3 stand-in')
+class TestTokenIndex(TestCase):
+
+  def setUp(self):
+
+    from mock_s3 import mock_s3_env
+
+    self.mock_env = mock_s3_env()
+    self.mock_env.__enter__()
+
+    self.s3_connector = get_connector()
+    self.index = TokenIndex(self.s3_connector, 'dump/')
+
+  def tearDown(self):
+
+    self.mock_env.__exit__(None, None, None)
+
+  def test_lookup_update(self):
+
+    # tokens sharing a shard and tokens of their own shards
+    tokens = ['ab' + str(uuid.uuid4())[2:] for _ in range(3)] + \
+        [str(uuid.uuid4()) for _ in range(5)]
+    entries = [('sequence', token, 'dump/diary/{}/'.format(token))
+               for token in tokens]
+
+    self.assertTrue(self.index.update(entries, jobs=4))
+
+    shard_keys = self.s3_connector.list_objects(
+        os.path.join('dump/', config.DRIVE_DATA_INDEX_PREFIX), refresh=True)
+    self.assertEqual(len(shard_keys),
+                     len({token[:config.DRIVE_DATA_INDEX_SHARD_WIDTH]
+                          for token in tokens}))
+
+    for _, token, prefix in entries:
+      self.assertEqual(self.index.lookup('sequence', token), prefix)
+
+    # absent from a written shard, from an unwritten shard, of another kind
+    self.assertIsNone(self.index.lookup('sequence', 'ab' + '0' * 34))
+    self.assertIsNone(self.index.lookup('sequence', 'zz' + '0' * 34))
+    self.assertIsNone(self.index.lookup('drive', tokens[0]))
+
+    # updates keep the other entries of a shard
+    self.assertTrue(self.index.update([('sequence', tokens[0], 'prod/a/')]))
+    self.assertEqual(self.index.lookup('sequence', tokens[0]), 'prod/a/')
+    self.assertEqual(self.index.lookup('sequence', tokens[1]),
+                     entries[1][2])
+
+    self.assertTrue(self.index.remove([('sequence', tokens[1])]))
+    self.assertIsNone(self.index.lookup('sequence', tokens[1]))
+    self.assertEqual(self.index.lookup('sequence', tokens[2]),
+                     entries[2][2])
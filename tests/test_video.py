@@ -0,0 +1,261 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+try:
+  import moto
+except ImportError:
+  moto = None
+
+from fleet.s3_ops.s3_connector import get_connector
+from fleet.s3_ops.video import RemoteVideo, VideoIndex, find_box, frame_window
+
+FRAMES = 12
+FRAMES_PER_CHUNK = 4
+KEYFRAMES = [0, 4, 8]
+FRAME_DELTA = 512
+TIMESCALE = 12800
+# audio bytes interleaved between the video chunks
+GAP = 16
+
+
+def box(box_type, *payloads):
+
+  payload = b''.join(payloads)
+  return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, *payloads):
+
+  return box(box_type, bytes(4), *payloads)
+
+
+def table(box_type, fmt, entries):
+
+  return full_box(box_type, struct.pack('>I', len(entries)),
+                  *[struct.pack(fmt, *entry) for entry in entries])
+
+
+def track(handler, sample_table, edits=()):
+
+  mdhd = full_box(b'mdhd', struct.pack('>IIIIHH', 0, 0, TIMESCALE,
+                                       FRAMES * FRAME_DELTA, 0, 0))
+  hdlr = full_box(b'hdlr', bytes(4), handler, bytes(13))
+
+  mdia = box(b'mdia', mdhd, hdlr, box(b'minf', box(b'stbl', *sample_table)))
+  if not edits:
+    return box(b'trak', mdia)
+
+  return box(b'trak', box(b'edts', table(b'elst', '>Iii', edits)), mdia)
+
+
+def build_mp4(co64=False, composition=None):
+
+  """Minimal MP4 (ftyp, mdat, moov) with a sound and a video track
+
+    Samples are random bytes of distinct sizes in chunks of
+    FRAMES_PER_CHUNK, chunks separated by GAP bytes. With composition
+    offsets (frame deltas, f.ex B-frames) the video track has a ctts box and
+    an edit list starting at the first presented frame.
+
+    Returns:
+      MP4 bytes, list of sample bytes
+  """
+
+  samples = [os.urandom(100 + 10 * i) for i in range(FRAMES)]
+  chunks = [samples[i: i + FRAMES_PER_CHUNK]
+            for i in range(0, FRAMES, FRAMES_PER_CHUNK)]
+
+  ftyp = box(b'ftyp', b'isom', bytes(4), b'isommp41')
+  mdat_payload = b''.join(bytes(GAP) + b''.join(chunk) for chunk in chunks)
+  mdat = box(b'mdat', mdat_payload)
+
+  offset = len(ftyp) + 8
+  chunk_offsets = []
+  for chunk in chunks:
+    offset += GAP
+    chunk_offsets.append((offset, ))
+    offset += sum(len(sample) for sample in chunk)
+
+  sizes = [struct.pack('>I', len(sample)) for sample in samples]
+  stbl = [table(b'stts', '>II', [(FRAMES, FRAME_DELTA)]),
+          table(b'stss', '>I', [(k + 1, ) for k in KEYFRAMES]),
+          table(b'stsc', '>III', [(1, FRAMES_PER_CHUNK, 1)]),
+          full_box(b'stsz', struct.pack('>II', 0, FRAMES), *sizes),
+          table(b'co64', '>Q', chunk_offsets) if co64
+          else table(b'stco', '>I', chunk_offsets)]
+
+  edits = ()
+  if composition is not None:
+    stbl.append(table(b'ctts', '>II', [(1, offset * FRAME_DELTA)
+                                       for offset in composition]))
+    start = min(frame + offset for frame, offset in enumerate(composition))
+    edits = [(0, start * FRAME_DELTA, 1 << 16)]
+
+  sound = [table(b'stts', '>II', []), table(b'stsc', '>III', []),
+           full_box(b'stsz', struct.pack('>II', 0, 0)),
+           table(b'stco', '>I', [])]
+  moov = box(b'moov', full_box(b'mvhd', bytes(96)), track(b'soun', sound),
+             track(b'vide', stbl, edits))
+
+  return ftyp + mdat + moov, samples
+
+
+def read_moov(data):
+
+  start, end = find_box(data, [b'moov'])
+  return data[start - 8: end]
+
+
+class TestVideoIndex(TestCase):
+
+  def test_sample_table(self):
+
+    for co64 in [False, True]:
+
+      data, samples = build_mp4(co64)
+      index = VideoIndex(read_moov(data))
+
+      self.assertEqual(len(index), FRAMES)
+      self.assertEqual(index.timescale, TIMESCALE)
+      self.assertEqual(index.keyframes, KEYFRAMES)
+      self.assertEqual(index.sizes, [len(sample) for sample in samples])
+      self.assertEqual(index.seconds(6), 6 * FRAME_DELTA / TIMESCALE)
+
+      for offset, size, sample in zip(index.offsets, index.sizes, samples):
+        self.assertEqual(data[offset: offset + size], sample)
+
+  def test_composition(self):
+
+    # I P B B in decode order, an open gop at 8 presented after its leading
+    # B-frames, offsets shifted by a frame so none is negative
+    composition = [1, 3, 0, 0, 1, 3, 0, 0, 3, 0, 0, 1]
+    data, _ = build_mp4(composition=composition)
+    index = VideoIndex(read_moov(data))
+
+    self.assertEqual(index.start_time, FRAME_DELTA)
+    presented = sorted(range(FRAMES), key=index.seconds)
+    self.assertEqual(presented, [0, 2, 3, 1, 4, 6, 7, 5, 9, 10, 8, 11])
+    # decoded at 8, presented at 10
+    self.assertEqual(index.seconds(8), 10 * FRAME_DELTA / TIMESCALE)
+
+  def test_byte_ranges(self):
+
+    data, samples = build_mp4()
+    index = VideoIndex(read_moov(data))
+
+    self.assertEqual(index.keyframe(6), 4)
+    self.assertEqual(index.keyframe(8), 8)
+
+    # frames [4, 9] span the second chunk and half of the third
+    ranges = index.byte_ranges(index.keyframe(6), 9)
+    self.assertEqual(len(ranges), 2)
+    self.assertEqual(b''.join(data[s: e + 1] for s, e in ranges),
+                     b''.join(samples[4:10]))
+
+  def test_frame_window(self):
+
+    rows = [{'sensor_modality_type': 'camera', 'bsens_seq_frame': frame,
+             'cam_time_stamp': 10 ** 6 + frame * 100000}
+            for frame in range(FRAMES)]
+    rows.append({'sensor_modality_type': 'gnss', 'bsens_seq_frame': None,
+                 'cam_time_stamp': None})
+
+    self.assertEqual(frame_window(rows, 2, 5), (2, 5))
+    self.assertEqual(frame_window(rows, 0.25, 0.5, by_time=True), (3, 5))
+
+
+@unittest.skipIf(moto is None, 'moto is required for the local S3 stand-in')
+class TestRemoteVideo(TestCase):
+
+  def setUp(self):
+
+    from mock_s3 import mock_s3_env
+
+    self.mock_env = mock_s3_env()
+    self.mock_env.__enter__()
+
+    self.s3_connector = get_connector()
+    self.tmp_dir = Path(tempfile.mkdtemp())
+
+  def tearDown(self):
+
+    self.mock_env.__exit__(None, None, None)
+
+  def put_video(self, video_path):
+
+    s3_key = 'test/video/' + video_path.name
+    self.assertTrue(self.s3_connector.put_checked(video_path, s3_key))
+    return RemoteVideo(self.s3_connector, s3_key,
+                       video_path.stat().st_size)
+
+  def test_read_header(self):
+
+    data, samples = build_mp4()
+    video_path = self.tmp_dir.joinpath('video.mp4')
+    video_path.write_bytes(data)
+
+    video = self.put_video(video_path)
+    index = video.read_header()
+
+    # every top level box, mdat without its samples
+    self.assertEqual([box_data[4:8] for _, box_data in video.boxes],
+                     [b'ftyp', b'mdat', b'moov'])
+    self.assertEqual(len(video.boxes[1][1]), 8)
+    self.assertEqual(index.offsets, VideoIndex(read_moov(data)).offsets)
+
+    ranges = index.byte_ranges(index.keyframe(6), 9)
+    self.assertEqual(b''.join(video.read(s, e) for s, e in ranges),
+                     b''.join(samples[4:10]))
+
+  def encode(self, video_name, **kwargs):
+
+    import ffmpeg
+
+    video_path = self.tmp_dir.joinpath(video_name)
+    source = ffmpeg.input('testsrc=size=64x48:rate=10:duration=2', f='lavfi')
+    # h264 as the recorded videos, a key frame every 5 frames
+    ffmpeg.output(source, video_path.as_posix(), vcodec='libx264', g=5,
+                  sc_threshold=0, **kwargs).run(capture_stdout=True,
+                                                capture_stderr=True)
+
+    return video_path
+
+  @unittest.skipIf(shutil.which('ffmpeg') is None, 'ffmpeg is required')
+  def test_fetch_frames(self):
+
+    video = self.put_video(self.encode('testsrc.mp4', bf=0))
+    clip_path = self.tmp_dir.joinpath('clip.mp4').as_posix()
+
+    self.assertEqual(video.fetch_frames(7, 12, clip_path, jobs=2), (5, 12))
+
+    clip = VideoIndex(read_moov(Path(clip_path).read_bytes()))
+    self.assertEqual(len(clip), 8)
+    self.assertEqual(clip.keyframes[0], 0)
+
+  @unittest.skipIf(shutil.which('ffmpeg') is None, 'ffmpeg is required')
+  def test_fetch_frames_bframes(self):
+
+    # open gops, key frames are presented after the B-frames decoded next
+    video_path = self.encode('bframes.mp4', bf=2,
+                             **{'x264-params': 'open-gop=1:b-pyramid=0'})
+    data = video_path.read_bytes()
+    index = VideoIndex(read_moov(data))
+    key_frame = index.keyframe(7)
+    self.assertGreater(index.seconds(key_frame),
+                       index.times[key_frame] / index.timescale)
+
+    video = self.put_video(video_path)
+    clip_path = self.tmp_dir.joinpath('clip.mp4').as_posix()
+    self.assertEqual(video.fetch_frames(7, 12, clip_path), (key_frame, 12))
+
+    # the clip starts at the fetched key frame
+    clip_data = Path(clip_path).read_bytes()
+    clip = VideoIndex(read_moov(clip_data))
+    start, size = index.offsets[key_frame], index.sizes[key_frame]
+    self.assertEqual(clip_data[clip.offsets[0]: clip.offsets[0] + size],
+                     data[start: start + size])